@@ -0,0 +1,332 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Test setup: runs the plugin outside of Krita.
+# - i18n (a builtin inside Krita) returns its text unchanged
+# - Qt uses the offscreen platform, so the dialog can be built without a display
+# - the preset library and the last preset go to a temporary home folder
+# - the benchmarks (test_benchmarks.py) only run when selected with -m benchmark
+# - when PyQt5 is installed, a stub krita module stands in for Krita (its Document is FakeDocument).
+#   Without PyQt5 the krita module is left missing, so that only the modules that must not import krita nor PyQt5
+#   are imported, and the tests needing PyQt5 are skipped.
+
+import builtins, os, sys, tempfile, types, zipfile
+
+import pytest
+
+
+_home = tempfile.mkdtemp(prefix="tile_grid_tests_")
+os.environ["HOME"] = _home
+os.environ["TILE_GRID_PRESET_LIBRARY"] = os.path.join(_home, "presets")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+builtins.i18n = lambda text: text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import PyQt5  # noqa: F401
+except ImportError:
+    HAS_PYQT5 = False
+else:
+    HAS_PYQT5 = True
+
+
+class FakeNode:
+    def __init__(self, name="root", node_type="grouplayer"):
+        self.node_name = name
+        self.node_type = node_type
+        self.parent = None
+        self.children = []
+        self.svgs = []
+        self.node_id = "{{{0}}}".format(name)
+        self.node_visible = True
+        self.node_opacity = 255
+        self.node_bounds = (0, 0, 0, 0)
+
+    def name(self):
+        return self.node_name
+
+    def uniqueId(self):
+        return types.SimpleNamespace(toString=lambda: self.node_id)
+
+    def visible(self):
+        return self.node_visible
+
+    def opacity(self):
+        return self.node_opacity
+
+    def blendingMode(self):
+        return "normal"
+
+    def bounds(self):
+        x, y, w, h = self.node_bounds
+        return types.SimpleNamespace(x=lambda: x, y=lambda: y, width=lambda: w, height=lambda: h)
+
+    def addChildNode(self, child, above):
+        child.parent = self
+        self.children.append(child)
+        return True
+
+    def setChildNodes(self, nodes):
+        self.children = list(nodes)
+        for child in self.children:
+            child.parent = self
+
+    def remove(self):
+        if self.parent is None:
+            return False
+        self.parent.children.remove(self)
+        self.parent = None
+        return True
+
+    def setSelection(self, selection):
+        self.selection = selection
+
+    def childNodes(self):
+        return list(self.children)
+
+    def addShapesFromSvg(self, svg):
+        self.svgs.append(svg)
+        return []
+
+    def type(self):
+        return self.node_type
+
+
+class FakeDocument:
+    # The parts of krita.Document used by the plugin
+    def __init__(self, width=2480, height=3508, resolution=300.0):
+        self._width = width
+        self._height = height
+        self._resolution = resolution
+        self.vertical_guides = []
+        self.horizontal_guides = []
+        self.guides_visible = False
+        self.guides_locked = False
+        self.annotations = {}
+        self.root = FakeNode()
+        self.refresh_count = 0
+        self.batchmode = False
+        self.file_name = None
+        self.is_modified = False
+        self.closed = False
+        # BGRA bytes of the merged image (all zero when None)
+        self.pixels = None
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def resolution(self):
+        return self._resolution
+
+    def colorModel(self):
+        return "RGBA"
+
+    def colorDepth(self):
+        return "U8"
+
+    def waitForDone(self):
+        pass
+
+    def pixelData(self, x, y, w, h):
+        pixels = self.pixels or bytes(self._width * self._height * 4)
+        stride = self._width * 4
+        return b"".join(pixels[(y + k) * stride + x * 4:(y + k) * stride + (x + w) * 4] for k in range(h))
+
+    def verticalGuides(self):
+        return list(self.vertical_guides)
+
+    def horizontalGuides(self):
+        return list(self.horizontal_guides)
+
+    def setVerticalGuides(self, guides):
+        self.vertical_guides = list(guides)
+
+    def setHorizontalGuides(self, guides):
+        self.horizontal_guides = list(guides)
+
+    def guidesVisible(self):
+        return self.guides_visible
+
+    def setGuidesVisible(self, visible):
+        self.guides_visible = visible
+
+    def guidesLocked(self):
+        return self.guides_locked
+
+    def setGuidesLocked(self, locked):
+        self.guides_locked = locked
+
+    def setAnnotation(self, annotation_type, description, data):
+        self.annotations[annotation_type] = (description, data)
+
+    def annotation(self, annotation_type):
+        return self.annotations.get(annotation_type, (None, b""))[1]
+
+    def fileName(self):
+        return self.file_name or ""
+
+    def modified(self):
+        return self.is_modified
+
+    def topLevelNodes(self):
+        return self.root.childNodes()
+
+    def rootNode(self):
+        return self.root
+
+    def createVectorLayer(self, name):
+        return FakeNode(name, "vectorlayer")
+
+    def createNode(self, name, node_type):
+        return FakeNode(name, node_type)
+
+    def createSelectionMask(self, name):
+        return FakeNode(name, "selectionmask")
+
+    def refreshProjection(self):
+        self.refresh_count += 1
+
+    def setBatchmode(self, batchmode):
+        self.batchmode = batchmode
+
+    def save(self):
+        self.save_count = getattr(self, "save_count", 0) + 1
+        return True
+
+    def saveAs(self, file_name):
+        self.file_name = file_name
+        return True
+
+    def close(self):
+        self.closed = True
+        return True
+
+
+def install_krita_stub():
+    krita = types.ModuleType("krita")
+
+    class Extension:
+        def __init__(self, parent=None):
+            self.parent = parent
+
+    class Selection:
+        def __init__(self):
+            self.rects = []
+
+        def select(self, x, y, w, h, value):
+            self.rects.append((x, y, w, h))
+
+    class Action:
+        def __init__(self, name):
+            self.name = name
+            self.trigger_count = 0
+
+        def trigger(self):
+            self.trigger_count += 1
+
+    class Krita:
+        _instance = None
+
+        def __init__(self):
+            self.extensions = []
+            self.documents = []
+            self.actions = {}
+            self.active_document = None
+            self.batch_mode = False
+
+        @classmethod
+        def instance(cls):
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+        def addExtension(self, extension):
+            self.extensions.append(extension)
+
+        def activeDocument(self):
+            return self.active_document
+
+        def activeWindow(self):
+            return None
+
+        def batchmode(self):
+            return self.batch_mode
+
+        def setBatchmode(self, batch_mode):
+            self.batch_mode = batch_mode
+
+        def openDocument(self, path):
+            # The size and resolution come from the maindoc.xml of the file (see write_kra())
+            from tile_grid.plan import read_kra_info
+            try:
+                doc = FakeDocument(*read_kra_info(path))
+            except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+                return None
+            doc.file_name = path
+            self.documents.append(doc)
+            return doc
+
+        def action(self, name):
+            return self.actions.setdefault(name, Action(name))
+
+        def createDocument(self, width, height, name, color_model, color_depth, profile, resolution):
+            doc = FakeDocument(width, height, resolution)
+            self.documents.append(doc)
+            return doc
+
+    krita.Extension = Extension
+    krita.Krita = Krita
+    krita.Selection = Selection
+    krita.Document = FakeDocument
+    sys.modules["krita"] = krita
+    # Krita also makes Krita a builtin of the plugins
+    builtins.Krita = Krita
+
+
+if HAS_PYQT5:
+    install_krita_stub()
+
+
+def write_kra(path, width, height, ppi=300):
+    # Minimal .kra: only the maindoc.xml read by the planner
+    maindoc = ('<?xml version="1.0" encoding="UTF-8"?><DOC xmlns="http://www.calligra.org/DTD/krita">'
+               '<IMAGE width="{0}" height="{1}" x-res="{2}" y-res="{2}"/></DOC>').format(width, height, ppi)
+    with zipfile.ZipFile(str(path), 'w') as archive:
+        archive.writestr("maindoc.xml", maindoc)
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: timing benchmarks, only run when selected with -m benchmark")
+
+
+def pytest_collection_modifyitems(config, items):
+    # Timings depend on the machine and its load: the benchmarks are left out of plain test runs
+    if "benchmark" in (config.getoption("markexpr") or ""):
+        return
+    skip = pytest.mark.skip(reason="benchmark, run with -m benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(name="write_kra")
+def write_kra_fixture():
+    return write_kra
+
+
+@pytest.fixture
+def make_document():
+    return FakeDocument
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    if not HAS_PYQT5:
+        pytest.skip("PyQt5 is not installed")
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
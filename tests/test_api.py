@@ -0,0 +1,84 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Scripting API and stored grids, on fake documents (see conftest.py).
+
+import pytest
+
+pytest.importorskip("PyQt5")
+
+from tile_grid.annotation import load_grid, relayout_stored_grid
+from tile_grid.api import apply_tile_grid
+from tile_grid.guides import to_list
+from tile_grid.layout import compute_layout, resolve_preset
+from tile_grid.spec import DEFAULT_PRESET
+
+
+PRESET = dict(DEFAULT_PRESET, num_tiles_x=3, num_tiles_y=2)
+
+
+def test_apply_tile_grid_keeps_user_guides(make_document):
+    doc = make_document(3000, 2000, 300.0)
+    doc.setVerticalGuides([1.0])
+    layout, report = apply_tile_grid(doc, PRESET)
+
+    assert doc.verticalGuides() == sorted([1.0] + to_list(layout.guides_x()))
+    assert doc.horizontalGuides() == to_list(layout.guides_y())
+    assert doc.guidesVisible() and doc.guidesLocked()
+    assert report["added"] == 2 * (3 + 2)
+    assert load_grid(doc)["preset"]["num_tiles_x"] == 3
+
+
+def test_apply_tile_grid_rejects_grids_too_big(make_document):
+    with pytest.raises(ValueError):
+        apply_tile_grid(make_document(100, 100, 72.0), dict(PRESET, num_tiles_x=500))
+
+
+def test_panel_borders_and_cell_grids_add_a_vector_layer(make_document):
+    doc = make_document(3000, 2000, 300.0)
+    apply_tile_grid(doc, dict(PRESET, panel_borders=True))
+    apply_tile_grid(doc, dict(PRESET, grid_type="hex_pointy"))
+    layers = doc.rootNode().childNodes()
+    assert [layer.type() for layer in layers] == ["vectorlayer", "vectorlayer"]
+    assert layers[0].svgs[0].count("<rect") == 6
+
+
+def test_stored_grid_follows_resizes(make_document):
+    doc = make_document(3000, 2000, 300.0)
+    doc.setHorizontalGuides([5.0])
+    apply_tile_grid(doc, PRESET)
+    doc._width = 4000
+    relayout_stored_grid(doc)
+
+    layout = compute_layout(resolve_preset(PRESET, 4000, 2000, 300.0), 4000, 2000)
+    assert doc.verticalGuides() == pytest.approx(to_list(layout.guides_x()))
+    assert 5.0 in doc.horizontalGuides()
+
+
+def test_stored_grid_uses_the_preset_tolerance(make_document):
+    doc = make_document(3000, 2000, 300.0)
+    apply_tile_grid(doc, dict(PRESET, guide_tolerance=0.5))
+    # A guide placed by hand, 0.3 px from where a plugin guide lands after the resize
+    layout = compute_layout(resolve_preset(PRESET, 4000, 2000, 300.0), 4000, 2000)
+    hand_guide = to_list(layout.guides_x())[2] + 0.3
+    doc.setVerticalGuides(doc.verticalGuides() + [hand_guide])
+    doc._width = 4000
+    assert "x" in relayout_stored_grid(doc)
+    assert len(doc.verticalGuides()) == len(layout.guides_x())
+
+
+def test_stored_cell_grid_overlay_follows_resizes(make_document):
+    doc = make_document(3000, 2000, 300.0)
+    apply_tile_grid(doc, dict(PRESET, grid_type="hex_flat"))
+    old_svg = doc.rootNode().childNodes()[0].svgs[0]
+    doc._width = 4000
+    assert relayout_stored_grid(doc) == ["overlay"]
+    layers = doc.rootNode().childNodes()
+    assert [layer.name() for layer in layers] == ["Cell grid"]
+    assert layers[0].svgs[0] != old_svg and 'viewBox="0 0 4000 2000"' in layers[0].svgs[0]
+
+    # A deleted cell grid layer is not brought back
+    layers[0].remove()
+    doc._width = 5000
+    assert relayout_stored_grid(doc) == []
+    assert doc.rootNode().childNodes() == []
@@ -0,0 +1,50 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Batch driver (job files and folders), on fake documents (see conftest.py).
+
+import json
+
+import pytest
+
+pytest.importorskip("PyQt5")
+
+from krita import Krita
+
+from tile_grid.batch import run_folder, run_jobs
+from tile_grid.spec import DEFAULT_PRESET
+
+
+@pytest.fixture
+def app():
+    app = Krita.instance()
+    app.documents = []
+    return app
+
+
+def test_run_folder_adds_cell_grid_overlays(app, tmp_path, write_kra):
+    for index in range(3):
+        write_kra(tmp_path / "page_{0}.kra".format(index), 2480, 3508)
+    preset = dict(DEFAULT_PRESET, num_tiles_x=5, num_tiles_y=5, grid_type="hex_flat", panel_borders=True)
+    report_path = tmp_path / "report.jsonl"
+    results = run_folder(str(tmp_path), preset, str(report_path), workers=2, use_processes=False)
+
+    assert [result["status"] for result in results] == ["ok"] * 3
+    for doc in app.documents:
+        layers = doc.rootNode().childNodes()
+        assert [layer.name() for layer in layers] == ["Cell grid"]
+        assert "<rect" not in layers[0].svgs[0]
+        assert doc.closed and doc.save_count == 1
+    assert json.loads(report_path.read_text().splitlines()[-1])["summary"]
+
+
+def test_run_jobs_reports_malformed_lines(app, tmp_path, write_kra):
+    write_kra(tmp_path / "a.kra", 2480, 3508)
+    job = json.dumps({"document": str(tmp_path / "a.kra"), "preset": {"num_tiles_x": 2}})
+    jobs_path = tmp_path / "jobs.jsonl"
+    jobs_path.write_text("\n".join([job, '{"document": "truncated', "# comment", "[1, 2]", job, '{"document": "missing.kra", "preset": {}}']))
+    results = run_jobs(str(jobs_path))
+
+    assert [(result["line"], result["status"]) for result in results] == [(1, "ok"), (2, "error"), (4, "error"), (5, "ok"), (6, "error")]
+    assert results[-1]["document"] == "missing.kra"
+    assert not app.batchmode()
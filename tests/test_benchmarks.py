@@ -0,0 +1,186 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Benchmarks of the hot paths, for grids from 1 x 1 to 1000 x 1000 tiles. They only run when selected:
+#     python -m pytest tests -m benchmark
+# Timings are compared relative to a calibration loop timed in the same run, so that the baselines in
+# benchmark_baselines.json hold on faster or slower machines. A benchmark fails when it is more than
+# TILE_GRID_BENCHMARK_TOLERANCE (default 3) times slower than its baseline, and when it has no baseline.
+# Set TILE_GRID_UPDATE_BASELINES=1 to record the baselines instead (the file is never written otherwise).
+
+import json, os, random, time
+
+import pytest
+
+from tile_grid.guides import merge_guides
+from tile_grid.layout import compute_guides_batch, compute_layout
+from tile_grid.plan import list_kra_files, plan_documents
+from tile_grid.spec import DEFAULT_PRESET, GridSpec
+
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baselines.json")
+TOLERANCE = float(os.environ.get("TILE_GRID_BENCHMARK_TOLERANCE", "3"))
+UPDATE_BASELINES = os.environ.get("TILE_GRID_UPDATE_BASELINES") == "1"
+
+# Timings below this (in seconds) are dominated by noise, and compared against it instead
+NOISE_FLOOR = 0.0002
+
+pytestmark = pytest.mark.benchmark
+
+GRID_SIZES = [1, 10, 100, 1000]
+DOC_SIZE_X, DOC_SIZE_Y, DOC_PPI = 20000, 20000, 300.0
+
+
+def measure(function, repeat=5, min_time=0.002):
+    # Best time of one call over several rounds, each round looping until it lasts at least min_time
+    best = float("inf")
+    for _ in range(repeat):
+        count = 0
+        start_time = time.perf_counter()
+        while True:
+            function()
+            count += 1
+            elapsed = time.perf_counter() - start_time
+            if elapsed >= min_time:
+                break
+        best = min(best, elapsed / count)
+    return best
+
+
+def calibrate():
+    # Time of a fixed pure Python workload, the unit the baselines are expressed in
+    return measure(lambda: sum(i * i for i in range(10000)), repeat=7)
+
+
+@pytest.fixture(scope="module")
+def baselines():
+    try:
+        with open(BASELINES_PATH, 'r') as file:
+            saved = json.load(file)
+    except FileNotFoundError:
+        saved = {}
+    unit = calibrate()
+    recorded = {}
+
+    def check(name, seconds):
+        if UPDATE_BASELINES:
+            recorded[name] = seconds / unit
+            return
+        baseline = saved.get(name)
+        assert baseline is not None, "{0}: no baseline, record it with TILE_GRID_UPDATE_BASELINES=1".format(name)
+        limit = max(baseline * unit, NOISE_FLOOR) * TOLERANCE
+        assert seconds <= limit, "{0}: {1:.6f} s, baseline {2:.6f} s".format(name, seconds, baseline * unit)
+
+    yield check
+
+    if recorded:
+        saved.update(recorded)
+        with open(BASELINES_PATH, 'w') as file:
+            json.dump(saved, file, indent=1, sort_keys=True)
+
+
+def grid_spec(size):
+    return GridSpec(num_tiles_x=size, num_tiles_y=size)
+
+
+@pytest.mark.parametrize("size", GRID_SIZES)
+def test_layout_and_guides(baselines, size):
+    spec = grid_spec(size).resolve(DOC_SIZE_X, DOC_SIZE_Y, DOC_PPI)
+
+    def run():
+        layout = compute_layout(spec, DOC_SIZE_X, DOC_SIZE_Y)
+        return layout.guides_x(), layout.guides_y()
+
+    guides_x, guides_y = run()
+    assert len(guides_x) == len(guides_y) == 2 * size
+    baselines("layout_and_guides_{0}x{0}".format(size), measure(run))
+
+
+@pytest.mark.parametrize("size", GRID_SIZES)
+def test_pixel_aligned_guides(baselines, size):
+    spec = grid_spec(size).copy(pixel_aligned=True).resolve(DOC_SIZE_X, DOC_SIZE_Y, DOC_PPI)
+
+    def run():
+        layout = compute_layout(spec, DOC_SIZE_X, DOC_SIZE_Y)
+        return layout.guides_x(), layout.guides_y()
+
+    baselines("pixel_aligned_guides_{0}x{0}".format(size), measure(run))
+
+
+@pytest.mark.parametrize("size", GRID_SIZES)
+def test_merge_guides(baselines, size):
+    # Merging a grid into a document that already has the same number of (hand placed) guides
+    layout = compute_layout(grid_spec(size).resolve(DOC_SIZE_X, DOC_SIZE_Y, DOC_PPI), DOC_SIZE_X, DOC_SIZE_Y)
+    rng = random.Random(size)
+    existing = [rng.uniform(0, DOC_SIZE_X) for _ in range(2 * size)]
+    new = layout.guides_x()
+    baselines("merge_guides_{0}x{0}".format(size), measure(lambda: merge_guides(existing, new)))
+
+
+def test_guides_batch(baselines):
+    # One spec per grid size from 1 x 1 to 1000 x 1000 tiles
+    specs = [grid_spec(size).resolve(DOC_SIZE_X, DOC_SIZE_Y, DOC_PPI) for size in range(1, 1001, 10)]
+    baselines("guides_batch_100_specs", measure(lambda: compute_guides_batch(specs, (DOC_SIZE_X, DOC_SIZE_Y)), repeat=3))
+
+
+def test_plan_documents_scales_with_workers(tmp_path, write_kra):
+    # Folder batches plan their layouts in a process pool (see plan.py): with N cores, N workers must be faster than one.
+    # Every page has its own size, so that no worker gets its border SVG from the cache of another page.
+    workers = min(4, os.cpu_count() or 1)
+    if workers < 2:
+        pytest.skip("needs at least 2 cores")
+    for index in range(16):
+        write_kra(tmp_path / "page_{0:02d}.kra".format(index), 6000 + index, 6000 + index)
+    paths = list_kra_files(str(tmp_path))
+    preset = dict(DEFAULT_PRESET, num_tiles_x=150, num_tiles_y=150, panel_borders=True)
+
+    def run(num_workers):
+        start_time = time.perf_counter()
+        results = plan_documents(paths, preset, workers=num_workers, use_processes=True)
+        assert not any("error" in result for result in results)
+        return time.perf_counter() - start_time
+
+    # Both timings include starting the pool
+    serial = min(run(1) for _ in range(2))
+    parallel = min(run(workers) for _ in range(2))
+    speedup = serial / parallel
+    assert speedup >= 1 + 0.4 * (workers - 1), "{0} workers: {1:.2f}x faster than one".format(workers, speedup)
+
+
+def test_parse_presets(baselines):
+    presets = [grid_spec(size).to_preset() for size in range(1, 201)]
+    baselines("parse_200_presets", measure(lambda: [GridSpec.from_preset(preset, {}) for preset in presets], repeat=3))
+
+
+@pytest.mark.parametrize("size", GRID_SIZES)
+def test_dialog(baselines, qapp, size):
+    from tile_grid.tile_grid import TileGridDialog
+
+    def construct():
+        return TileGridDialog(DOC_SIZE_X, DOC_SIZE_Y, DOC_PPI)
+
+    dialog = construct()
+    if size == GRID_SIZES[0]:
+        baselines("dialog_construction", measure(construct, repeat=3))
+
+    def apply():
+        # What a new invocation does: load the preset and recompute everything
+        dialog.apply_grid_spec(grid_spec(size))
+        dialog.update_return_values()
+
+    apply()
+    assert dialog.ret_num_tiles_x == size
+    baselines("dialog_apply_{0}x{0}".format(size), measure(apply, repeat=3))
+
+
+def test_dialog_field_change(baselines, qapp):
+    # Latency of a field change once debounced: convert the field, re-evaluate its axis and redraw the preview
+    from tile_grid.tile_grid import TileGridDialog
+    dialog = TileGridDialog(DOC_SIZE_X, DOC_SIZE_Y, DOC_PPI)
+    values = iter(range(10 ** 9))
+
+    def change():
+        dialog.margin_l.setValue(next(values) % 20)
+        dialog.update_tile_ratio()
+
+    baselines("dialog_field_change", measure(change, repeat=3))
@@ -0,0 +1,116 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Vector layers: the SVGs of the panel borders and of the cell grids, read back with ElementTree, and the cache shared by the layers.
+
+import random, re
+import xml.etree.ElementTree as ElementTree
+
+import pytest
+
+from tile_grid.borders import SvgCache, build_border_svg, get_border_svg, svg_cache
+from tile_grid.layout import compute_layout, resolve_preset
+from tile_grid.overlays import CellGrid, build_overlay_svg, compute_cell_grid
+from tile_grid.spec import DEFAULT_PRESET, GRID_HEX_FLAT, GRID_HEX_POINTY, GRID_ISOMETRIC
+
+
+SVG = "{http://www.w3.org/2000/svg}"
+EPSILON = 1e-6
+
+
+def default_layout(doc_size_x=2480, doc_size_y=3508, **changes):
+    return compute_layout(resolve_preset(dict(DEFAULT_PRESET, **changes), doc_size_x, doc_size_y, 300.0), doc_size_x, doc_size_y)
+
+
+def test_border_svg_has_one_inset_rect_per_tile():
+    layout = default_layout(num_tiles_x=4, num_tiles_y=2)
+    root = ElementTree.fromstring(build_border_svg(layout, 300.0, width=10.0, radius=0.0))
+    assert root.get("width") == "595.200pt"
+    assert root.get("viewBox") == "0 0 2480 3508"
+    group = root.find(SVG + "g")
+    assert (group.get("stroke-width"), group.get("stroke-linejoin")) == ("10.000", "miter")
+
+    rects = group.findall(SVG + "rect")
+    assert len(rects) == 8
+    for rect, (x, y, w, h) in zip(rects, layout.tile_rects()):
+        assert float(rect.get("x")) == pytest.approx(x + 5.0, abs=1e-3)
+        assert float(rect.get("y")) == pytest.approx(y + 5.0, abs=1e-3)
+        assert float(rect.get("width")) == pytest.approx(w - 10.0, abs=1e-3)
+        assert float(rect.get("height")) == pytest.approx(h - 10.0, abs=1e-3)
+        assert rect.get("rx") is None
+
+
+def test_border_svg_rounds_corners_within_the_tiles():
+    layout = default_layout(num_tiles_x=2, num_tiles_y=2)
+    root = ElementTree.fromstring(build_border_svg(layout, 300.0, width=4.0, radius=10000.0))
+    assert root.find(SVG + "g").get("stroke-linejoin") == "round"
+    for rect in root.iter(SVG + "rect"):
+        assert float(rect.get("rx")) == pytest.approx(min(float(rect.get("width")), float(rect.get("height"))) / 2, abs=1e-3)
+
+
+def test_border_svgs_are_cached():
+    layout = default_layout()
+    svg = get_border_svg(layout, 300.0)
+    hits, misses = svg_cache.hits, svg_cache.misses
+    # A new layout with the same geometry shares the SVG
+    assert get_border_svg(default_layout(), 300.0) is svg
+    assert (svg_cache.hits, svg_cache.misses) == (hits + 1, misses)
+    assert get_border_svg(layout, 300.0, color="#ff0000") is not svg
+    assert (svg_cache.hits, svg_cache.misses) == (hits + 1, misses + 1)
+
+
+def test_svg_cache_drops_the_least_recently_used_entry():
+    cache = SvgCache(max_entries=2)
+    builds = []
+
+    def get(key):
+        return cache.get_svg(key, lambda: builds.append(key) or key)
+
+    for key in ("a", "b", "a", "c", "a", "b"):
+        get(key)
+    assert builds == ["a", "b", "c", "b"]
+    assert list(cache.entries) == ["a", "b"]
+
+
+@pytest.mark.parametrize("grid_type", [GRID_HEX_POINTY, GRID_HEX_FLAT, GRID_ISOMETRIC])
+@pytest.mark.parametrize("seed", range(10))
+def test_cell_grids_fill_the_margins(grid_type, seed):
+    rng = random.Random(seed)
+    doc_size_x, doc_size_y = rng.randint(200, 4000), rng.randint(200, 4000)
+    spec = {
+        "grid_type": grid_type,
+        "margin_l": rng.uniform(0, doc_size_x * 0.2), "margin_r": rng.uniform(0, doc_size_x * 0.2),
+        "margin_t": rng.uniform(0, doc_size_y * 0.2), "margin_b": rng.uniform(0, doc_size_y * 0.2),
+        "gutter_x": 0.0, "gutter_y": 0.0, "tile_ratio": 1.0,
+        "num_tiles_x": rng.randint(1, 12), "num_tiles_y": rng.randint(1, 12)
+    }
+    grid = compute_layout(spec, doc_size_x, doc_size_y)
+    assert isinstance(grid, CellGrid)
+    assert len(grid.guides_x()) == len(grid.guides_y()) == 0
+
+    polygons = grid.cell_polygons()
+    assert len(polygons) == spec["num_tiles_x"] * spec["num_tiles_y"]
+    xs = [x for polygon in polygons for x, y in polygon]
+    ys = [y for polygon in polygons for x, y in polygon]
+    assert min(xs) >= spec["margin_l"] - EPSILON and max(xs) <= doc_size_x - spec["margin_r"] + EPSILON
+    assert min(ys) >= spec["margin_t"] - EPSILON and max(ys) <= doc_size_y - spec["margin_b"] + EPSILON
+    # The largest cells that fit: the grid spans the margins on at least one axis
+    available_x = doc_size_x - spec["margin_l"] - spec["margin_r"]
+    available_y = doc_size_y - spec["margin_t"] - spec["margin_b"]
+    assert max(xs) - min(xs) == pytest.approx(available_x) or max(ys) - min(ys) == pytest.approx(available_y)
+
+
+def test_overlay_svg_moves_to_each_cell():
+    grid = default_layout(num_tiles_x=4, num_tiles_y=3, grid_type=GRID_HEX_POINTY)
+    root = ElementTree.fromstring(build_overlay_svg(grid, 300.0))
+    paths = root.findall(SVG + "path")
+    assert len(paths) == 1
+    moves = [(float(x), float(y)) for x, y in re.findall(r"M(\S+) ([^l]+)", paths[0].get("d"))]
+    assert moves == [pytest.approx(polygon[0], abs=1e-3) for polygon in grid.cell_polygons()]
+    assert paths[0].get("d").count(grid.cell_path()) == 12
+
+
+def test_unknown_grid_types_are_rejected():
+    spec = dict(resolve_preset(DEFAULT_PRESET, 1000, 1000, 72.0), grid_type="triangle")
+    with pytest.raises(ValueError):
+        compute_cell_grid(spec, 1000, 1000)
@@ -0,0 +1,229 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# The dialog and the extension, on the offscreen Qt platform with a stub krita module (see conftest.py).
+
+import json, os
+
+import pytest
+
+pytest.importorskip("PyQt5")
+
+from PyQt5.QtWidgets import QDialog
+
+from tile_grid.layout import compute_layout
+from tile_grid.library import background_writer
+from tile_grid.preview import TileGridPreview
+from tile_grid.spec import PRESET_VERSION, GridSpec, Length, Unit
+from tile_grid.tile_grid import TileGridDialog, TileGridExtension, load_json_cached, save_json_cached
+
+
+@pytest.fixture
+def dialog(qapp):
+    dialog = TileGridDialog(2480, 3508, 300.0)
+    dialog.apply_grid_spec(GridSpec())
+    dialog.update_return_values()
+    return dialog
+
+
+def test_default_values(dialog):
+    assert dialog.get_grid_spec() == GridSpec()
+    assert dialog.ret_margin_l_px == pytest.approx(248.0)
+    assert dialog.ret_margin_t_px == pytest.approx(526.2)
+
+
+def test_unit_change_keeps_the_size(dialog):
+    field = dialog.length_fields["margin_l"]
+    field.cbox.setCurrentIndex(field.cbox.findData(Unit.IN.value))
+    assert field.unit is Unit.IN
+    assert dialog.margin_l.value() == pytest.approx(248.0 / 300.0, abs=0.01)
+    dialog.update_return_values()
+    assert dialog.ret_margin_l_px == pytest.approx(248.0, abs=3)
+
+
+def test_presets_are_locale_independent(dialog):
+    preset = dialog.get_current_preset()
+    assert preset["version"] == PRESET_VERSION
+    assert preset["margin_l_unit"] == "%"
+
+    # Version 1 preset, with unit labels
+    dialog.apply_preset({"margin_l": 1.0, "margin_l_unit": "Inches (in)", "num_tiles_x": 5})
+    assert dialog.get_grid_spec().margin_l == Length(1.0, Unit.IN)
+    assert dialog.num_tiles_x.value() == 5
+
+    with pytest.raises(ValueError):
+        dialog.apply_preset({"num_tiles_x": "five"})
+
+
+def test_apply_layout_spec_keeps_units(dialog):
+    spec = dict(GridSpec().resolve(2480, 3508, 300.0), num_tiles_x=4, num_tiles_y=5, margin_l=124.0)
+    dialog.apply_layout_spec(spec)
+    assert dialog.length_fields["margin_l"].unit is Unit.PC
+    assert dialog.margin_l.value() == pytest.approx(5.0)
+    assert dialog.ret_num_tiles_x == 4
+
+
+def test_partial_layout_spec_keeps_the_other_fields(dialog):
+    dialog.apply_grid_spec(GridSpec(tracks_x="1, 2", subgrids=[{"parent": 0, "row": 0, "col": 0, "preset": {"num_tiles_x": 2}}], pixel_aligned=True))
+    dialog.apply_layout_spec({"num_tiles_y": 4, "margin_t": 350.8})
+    grid_spec = dialog.get_grid_spec()
+    assert (grid_spec.tracks_x, grid_spec.num_tiles_y, grid_spec.pixel_aligned) == ("1, 2", 4, True)
+    assert len(grid_spec.subgrids) == 1
+    assert dialog.margin_t.value() == pytest.approx(10.0)
+
+
+def test_field_changes_are_debounced(dialog, monkeypatch):
+    recompute_count = dialog.recompute_count
+    dialog.num_tiles_x.setValue(4)
+    dialog.num_tiles_x.setValue(5)
+    dialog.margin_l.setValue(6.0)
+    assert dialog.recompute_timer.isActive()
+    assert dialog.recompute_count == recompute_count
+    assert dialog.skipped_recomputes == 2
+
+    dialog.recompute_timer.timeout.emit()
+    assert dialog.recompute_count == recompute_count + 1
+    assert dialog.ret_num_tiles_x == 5
+    max_tile_size_x, max_tile_size_y = dialog.evaluate_max_tile_size()
+    assert dialog.tile_ratio.value() == pytest.approx(max_tile_size_x / max_tile_size_y, abs=0.01)
+
+    # Only the axis of the changed fields is re-evaluated
+    from tile_grid import tile_grid
+    evaluated_sizes = []
+    evaluate_max_tile_size_axis = tile_grid.evaluate_max_tile_size_axis
+
+    def evaluate_axis(doc_size, *args):
+        evaluated_sizes.append(doc_size)
+        return evaluate_max_tile_size_axis(doc_size, *args)
+
+    monkeypatch.setattr(tile_grid, "evaluate_max_tile_size_axis", evaluate_axis)
+    dialog.num_tiles_y.setValue(6)
+    dialog.update_tile_ratio()
+    assert evaluated_sizes == [dialog.doc_size_y]
+    assert not dialog.recompute_timer.isActive()
+
+
+def test_preview_only_renders_new_layouts(qapp):
+    preview = TileGridPreview()
+    preview.resize(300, 200)
+    # Shown, so that grab() paints it without sending it a resize event first
+    preview.show()
+    spec = {"margin_l": 248.0, "margin_r": 248.0, "margin_t": 526.2, "margin_b": 526.2,
+            "gutter_x": 62.0, "gutter_y": 87.7, "num_tiles_x": 3, "num_tiles_y": 3, "tile_ratio": 1.78}
+    preview.set_tile_layout(compute_layout(spec, 2480, 3508))
+    preview.grab()
+    assert preview.render_count == 1
+
+    # Same layout computed again: the cached pixmap is kept
+    preview.set_tile_layout(compute_layout(spec, 2480, 3508))
+    preview.grab()
+    assert preview.render_count == 1
+
+    preview.set_tile_layout(compute_layout(dict(spec, num_tiles_x=5), 2480, 3508))
+    preview.grab()
+    assert preview.render_count == 2
+    preview.resize(400, 300)
+    preview.grab()
+    assert preview.render_count == 3
+    preview.close()
+
+
+def test_set_document_reuses_the_dialog(dialog):
+    dialog.set_document(1000, 1000, 72.0)
+    dialog.update_return_values()
+    assert dialog.ret_margin_l_px == pytest.approx(100.0)
+    assert dialog.refresh_time >= 0
+
+
+def test_get_dialog_reuses_the_dialog(qapp):
+    extension = TileGridExtension(None)
+    dialog = extension.get_dialog(None, 2480, 3508, 300.0)
+    assert extension.get_dialog(None, 1000, 1000, 72.0) is dialog
+    assert (dialog.doc_size_x, dialog.doc_size_y, dialog.doc_ppi) == (1000, 1000, 72.0)
+
+
+def test_json_files_are_only_read_again_when_they_change(tmp_path):
+    path = str(tmp_path / "preset.json")
+    with open(path, 'w') as file:
+        json.dump({"num_tiles_x": 4}, file)
+    data = load_json_cached(path)
+    assert load_json_cached(path) is data
+
+    with open(path, 'w') as file:
+        json.dump({"num_tiles_x": 5}, file)
+    os.utime(path, ns=(0, 0))
+    assert load_json_cached(path) == {"num_tiles_x": 5}
+
+    # Saved data is served from memory, and written in the background
+    saved = {"num_tiles_x": 6}
+    save_json_cached(path, saved)
+    assert load_json_cached(path) is saved
+    background_writer.flush()
+    with open(path, 'r') as file:
+        assert json.load(file) == saved
+
+
+def test_add_tile_grid(qapp, make_document, monkeypatch):
+    import krita
+    doc = make_document(2480, 3508, 300.0)
+    krita.Krita.instance().active_document = doc
+    extension = TileGridExtension(None)
+    dialog = extension.get_dialog(None, doc.width(), doc.height(), doc.resolution())
+    dialog.default_preset()
+    monkeypatch.setattr(dialog, "exec_", lambda: QDialog.Accepted)
+
+    extension.add_tile_grid()
+    assert len(doc.verticalGuides()) == 2 * 3
+    assert len(doc.horizontalGuides()) == 2 * 3
+
+
+def test_dialog_restores_the_stored_grid(dialog, make_document):
+    from tile_grid.api import apply_tile_grid
+    doc = make_document(3000, 2000, 300.0)
+    apply_tile_grid(doc, GridSpec(tracks_x="1, 2, 1", margin_l=Length(1.0, Unit.IN)))
+    dialog.apply_grid_spec(GridSpec(num_tiles_x=7))
+
+    TileGridExtension(None).prefill_dialog(dialog, doc)
+    assert dialog.tracks_x.text() == "1, 2, 1"
+    assert dialog.get_grid_spec().margin_l == Length(1.0, Unit.IN)
+
+
+def test_dialog_only_keeps_inferred_grids_that_reproduce_the_guides(dialog, make_document):
+    extension = TileGridExtension(None)
+    doc = make_document(3000, 2000, 300.0)
+    doc.setVerticalGuides([85.41, 250.34, 269.7, 436.02, 455.25, 621.47, 641.4, 807.36])
+    doc.setHorizontalGuides([100.0, 311.2])
+    dialog.apply_grid_spec(GridSpec(num_tiles_x=7))
+    extension.prefill_dialog(dialog, doc)
+    assert dialog.get_grid_spec() == GridSpec(num_tiles_x=7)
+
+    # A guide placed by hand does not prevent finding the grid
+    layout = compute_layout(GridSpec(num_tiles_x=4, num_tiles_y=3).resolve(3000, 2000, 300.0), 3000, 2000)
+    doc.setVerticalGuides(list(layout.guides_x()) + [1234.0])
+    doc.setHorizontalGuides(list(layout.guides_y()))
+    extension.prefill_dialog(dialog, doc)
+    assert dialog.num_tiles_x.value() == 4
+    assert dialog.num_tiles_y.value() == 3
+
+
+def test_add_tile_grid_times_the_dialog(qapp, make_document, monkeypatch):
+    import krita
+    from tile_grid.timing import timer
+    monkeypatch.setattr(timer, "enabled", True)
+    monkeypatch.setattr(timer, "log_path", None)
+    doc = make_document(2480, 3508, 300.0)
+    krita.Krita.instance().active_document = doc
+    extension = TileGridExtension(None)
+
+    def exec_dialog(dialog):
+        dialog.num_tiles_x.setValue(4)
+        dialog.update_tile_ratio()
+        return QDialog.Accepted
+
+    monkeypatch.setattr(TileGridDialog, "exec_", exec_dialog)
+    extension.add_tile_grid()
+    extension.add_tile_grid()
+    record = timer.last_run.to_record()
+    assert {"dialog_refresh", "field_change", "layout", "set_guides"} <= set(record["stages"])
+    assert "dialog_construction" not in record["stages"]
+    assert record["recomputes"] == 1
@@ -0,0 +1,79 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Tile export, on documents whose pixels tell where they come from (see gradient_document()).
+
+import pytest
+
+pytest.importorskip("PyQt5")
+
+from PyQt5.QtGui import QImage, qAlpha, qGreen, qRed
+
+from tile_grid import export, occupancy
+from tile_grid.export import export_tiles
+from tile_grid.layout import compute_layout
+
+
+def grid_spec(num_tiles_x, num_tiles_y, margin=0.0, gutter=0.0):
+    return {
+        "margin_l": margin, "margin_r": margin, "margin_t": margin, "margin_b": margin,
+        "gutter_x": gutter, "gutter_y": gutter,
+        "num_tiles_x": num_tiles_x, "num_tiles_y": num_tiles_y, "tile_ratio": 1.0
+    }
+
+
+def gradient_document(make_document, width, height):
+    # The red and green channels of each pixel are its x and y coordinates
+    doc = make_document(width, height, 72.0)
+    doc.pixels = bytes(value for y in range(height) for x in range(width) for value in (0, y, x, 255))
+    return doc
+
+
+def test_export_tiles_saves_each_tile(qapp, make_document, tmp_path):
+    doc = gradient_document(make_document, 60, 40)
+    layout = compute_layout(grid_spec(3, 2, margin=2.0, gutter=4.0), 60, 40)
+    num_tiles, elapsed_time = export_tiles(doc, layout, str(tmp_path), workers=2, max_pending=1)
+    assert num_tiles == 6
+    assert elapsed_time >= 0
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(
+        "tile_{0:03d}_{1:03d}.png".format(row, col) for row in range(2) for col in range(3))
+
+    for x, y, w, h, row, col in layout.pixel_rects():
+        tile = QImage(str(tmp_path / "tile_{0:03d}_{1:03d}.png".format(row, col)))
+        assert (tile.width(), tile.height()) == (w, h)
+        for i, j in ((0, 0), (w - 1, 0), (0, h - 1), (w - 1, h - 1)):
+            pixel = tile.pixel(i, j)
+            assert (qRed(pixel), qGreen(pixel), qAlpha(pixel)) == (x + i, y + j, 255)
+
+
+def test_export_tiles_name_format(qapp, make_document, tmp_path):
+    doc = gradient_document(make_document, 40, 20)
+    layout = compute_layout(grid_spec(2, 1), 40, 20)
+    export_tiles(doc, layout, str(tmp_path / "tiles"), name_format="page_{index}.png")
+    assert sorted(path.name for path in (tmp_path / "tiles").iterdir()) == ["page_0.png", "page_1.png"]
+
+
+def test_export_tiles_skips_empty_tiles(qapp, make_document, tmp_path):
+    # Only the second of the four tiles has been painted, and the third is fully transparent
+    doc = make_document(40, 10, 72.0)
+    pixels = bytearray(40 * 10 * 4)
+    for y in range(10):
+        pixels[(y * 40 + 12) * 4:(y * 40 + 18) * 4] = bytes((0, 0, 255, 255)) * 6
+        pixels[(y * 40 + 20) * 4:(y * 40 + 30) * 4] = bytes((0, 0, 255, 0)) * 10
+    doc.pixels = bytes(pixels)
+    layout = compute_layout(grid_spec(4, 1), 40, 10)
+    num_tiles, _ = export_tiles(doc, layout, str(tmp_path), skip_empty=True)
+    assert num_tiles == 1
+    assert [path.name for path in tmp_path.iterdir()] == ["tile_000_001.png"]
+
+
+def test_export_tiles_reuses_the_occupancy_of_saved_documents(qapp, make_document, tmp_path, monkeypatch):
+    monkeypatch.setattr(occupancy, "occupancy_cache", occupancy.OccupancyCache())
+    monkeypatch.setattr(export, "occupancy_cache", occupancy.occupancy_cache)
+    doc = gradient_document(make_document, 40, 20)
+    doc.file_name = str(tmp_path / "page.kra")
+    (tmp_path / "page.kra").write_bytes(b"")
+    layout = compute_layout(grid_spec(2, 1), 40, 20)
+    for directory in ("first", "second"):
+        assert export_tiles(doc, layout, str(tmp_path / directory), skip_empty=True)[0] == 2
+    assert (occupancy.occupancy_cache.hits, occupancy.occupancy_cache.misses) == (1, 1)
@@ -0,0 +1,298 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Invariants of the layout engine, checked on randomly generated (but seeded, so reproducible) grids.
+
+import glob, math, os, random, subprocess, sys
+
+import pytest
+
+from tile_grid import autofit
+from tile_grid.autofit import default_gutter_candidates
+from tile_grid.guides import merge_guides, to_list
+from tile_grid.infer import infer_grid, infer_verified_grid
+from tile_grid.layout import compute_guides_batch, compute_layout, evaluate_max_tile_size, resolve_preset
+from tile_grid.nested import TileTree
+from tile_grid.spec import DEFAULT_PRESET
+from tile_grid.tracks import format_tracks, parse_tracks, solve_tracks
+
+
+EPSILON = 1e-6
+SEEDS = range(200)
+
+
+def random_spec(rng, doc_size_x, doc_size_y):
+    # Margins and minimum gutters that leave at least a few pixels per tile
+    num_tiles_x = rng.randint(1, 40)
+    num_tiles_y = rng.randint(1, 40)
+    spec = {
+        "margin_l": rng.uniform(0, doc_size_x * 0.2),
+        "margin_r": rng.uniform(0, doc_size_x * 0.2),
+        "margin_t": rng.uniform(0, doc_size_y * 0.2),
+        "margin_b": rng.uniform(0, doc_size_y * 0.2),
+        "gutter_x": rng.choice([0.0, rng.uniform(0, doc_size_x * 0.3 / num_tiles_x)]),
+        "gutter_y": rng.choice([0.0, rng.uniform(0, doc_size_y * 0.3 / num_tiles_y)]),
+        "num_tiles_x": num_tiles_x,
+        "num_tiles_y": num_tiles_y,
+        "tile_ratio": math.exp(rng.uniform(-2, 2))
+    }
+    return spec
+
+
+def random_document(rng):
+    return rng.randint(200, 8000), rng.randint(200, 8000)
+
+
+def check_inside_margins(layout, spec, doc_size_x, doc_size_y, epsilon=EPSILON):
+    for x, y, w, h in layout.tile_rects():
+        assert x >= spec["margin_l"] - epsilon
+        assert y >= spec["margin_t"] - epsilon
+        assert x + w <= doc_size_x - spec["margin_r"] + epsilon
+        assert y + h <= doc_size_y - spec["margin_b"] + epsilon
+
+
+def check_gutters(guides, min_gutter, epsilon=EPSILON):
+    # Guides alternate tile starts and ends: the gap between an end and the next start is a gutter
+    guides = to_list(guides)
+    for end, start in zip(guides[1::2], guides[2::2]):
+        assert start - end >= min_gutter - epsilon
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_uniform_layout_invariants(seed):
+    rng = random.Random(seed)
+    doc_size_x, doc_size_y = random_document(rng)
+    spec = random_spec(rng, doc_size_x, doc_size_y)
+    layout = compute_layout(spec, doc_size_x, doc_size_y)
+
+    assert layout.num_tiles_x == spec["num_tiles_x"]
+    assert layout.num_tiles_y == spec["num_tiles_y"]
+    assert len(layout.tile_rects()) == spec["num_tiles_x"] * spec["num_tiles_y"]
+    check_inside_margins(layout, spec, doc_size_x, doc_size_y)
+    check_gutters(layout.guides_x(), spec["gutter_x"])
+    check_gutters(layout.guides_y(), spec["gutter_y"])
+
+    # The tile ratio is preserved, and the tiles are as large as the margins and gutters allow on one axis
+    assert layout.tile_size_x / layout.tile_size_y == pytest.approx(spec["tile_ratio"])
+    max_tile_size_x, max_tile_size_y = evaluate_max_tile_size(spec, doc_size_x, doc_size_y)
+    assert layout.tile_size_x <= max_tile_size_x + EPSILON
+    assert layout.tile_size_y <= max_tile_size_y + EPSILON
+    assert (layout.tile_size_x == pytest.approx(max_tile_size_x)) or (layout.tile_size_y == pytest.approx(max_tile_size_y))
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_pixel_aligned_layout_invariants(seed):
+    rng = random.Random(seed)
+    doc_size_x, doc_size_y = random_document(rng)
+    spec = dict(random_spec(rng, doc_size_x, doc_size_y), pixel_aligned=True)
+    layout = compute_layout(spec, doc_size_x, doc_size_y)
+
+    # Identical integer tiles, inside the (rounded) margins, that do not overlap
+    assert isinstance(layout.tile_size_x, int) and isinstance(layout.tile_size_y, int)
+    rounded = {key: int(round(spec[key])) for key in ("margin_l", "margin_r", "margin_t", "margin_b")}
+    check_inside_margins(layout, rounded, doc_size_x, doc_size_y, 0)
+    for guides in (layout.guides_x(), layout.guides_y()):
+        guides = to_list(guides)
+        assert all(guide == int(guide) for guide in guides)
+        assert guides == sorted(guides)
+    rects = layout.pixel_rects()
+    assert len(rects) == spec["num_tiles_x"] * spec["num_tiles_y"]
+    assert all(w == layout.tile_size_x and h == layout.tile_size_y for x, y, w, h, row, col in rects)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_track_solver_invariants(seed):
+    rng = random.Random(seed)
+    tracks = []
+    for _ in range(rng.randint(1, 30)):
+        kind = rng.random()
+        if kind < 0.2:
+            size = rng.uniform(0, 50)
+            tracks.append((0.0, size, size))
+        elif kind < 0.6:
+            minimum = rng.uniform(0, 40)
+            tracks.append((rng.uniform(0.1, 5), minimum, minimum + rng.uniform(0, 200)))
+        else:
+            tracks.append((rng.uniform(0.1, 5), 0.0, math.inf))
+    gutter = rng.uniform(0, 10)
+    available = rng.uniform(0, 4000)
+    sizes = solve_tracks(available, tracks, gutter)
+
+    # Every track within its bounds, and the tracks fill the space unless the bounds prevent it
+    for size, (weight, minimum, maximum) in zip(sizes, tracks):
+        assert minimum - EPSILON <= size <= maximum + EPSILON
+    total = sum(sizes) + (len(tracks) - 1) * gutter
+    low = sum(minimum for weight, minimum, maximum in tracks) + (len(tracks) - 1) * gutter
+    high = sum(maximum for weight, minimum, maximum in tracks) + (len(tracks) - 1) * gutter
+    assert total == pytest.approx(min(max(available, low), high), abs=1e-6)
+
+
+@pytest.mark.parametrize("text", ["nan, 1", "inf", "-inf", "1, nanpx", "infpx", "1[nan:]", "1[:nan]", "1[inf:]", "1[10:inf]", "1[-1:]", "0", "2px, "])
+def test_parse_tracks_rejects_invalid_tracks(text):
+    with pytest.raises(ValueError):
+        parse_tracks(text)
+
+
+def test_parse_tracks_round_trip():
+    tracks = parse_tracks("2, 300px, 1[100:], 1[:400], 1.5[10:20]")
+    assert tracks == [(2.0, 0.0, math.inf), (0.0, 300.0, 300.0), (1.0, 100.0, math.inf), (1.0, 0.0, 400.0), (1.5, 10.0, 20.0)]
+    assert parse_tracks(format_tracks(tracks)) == tracks
+
+
+def test_tracks_layout_fills_available_space():
+    spec = {"margin_l": 100, "margin_r": 100, "margin_t": 50, "margin_b": 50, "gutter_x": 20, "gutter_y": 10,
+            "num_tiles_x": 1, "num_tiles_y": 1, "tile_ratio": 1.0, "tracks_x": "1, 2, 300px, 1[100:200]", "tracks_y": "1, 1"}
+    layout = compute_layout(spec, 2000, 1000)
+    check_inside_margins(layout, spec, 2000, 1000)
+    check_gutters(layout.guides_x(), spec["gutter_x"])
+    guides_x = to_list(layout.guides_x())
+    assert guides_x[0] == pytest.approx(100)
+    assert guides_x[-1] == pytest.approx(1900)
+    assert len(guides_x) == 2 * len(parse_tracks(spec["tracks_x"]))
+
+    with pytest.raises(ValueError):
+        compute_layout(dict(spec, tracks_x="3000px"), 2000, 1000)
+
+
+def test_batch_guides_match_single_layouts():
+    rng = random.Random(1)
+    specs = [random_spec(rng, 3000, 2000) for _ in range(50)]
+    specs[3]["pixel_aligned"] = True
+    specs[7]["tracks_x"] = "1, 2, 1"
+    for spec, (guides_x, guides_y) in zip(specs, compute_guides_batch(specs, (3000, 2000))):
+        layout = compute_layout(spec, 3000, 2000)
+        assert to_list(guides_x) == pytest.approx(to_list(layout.guides_x()))
+        assert to_list(guides_y) == pytest.approx(to_list(layout.guides_y()))
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_merge_guides(seed):
+    rng = random.Random(seed)
+    existing = [rng.uniform(0, 1000) for _ in range(rng.randint(0, 50))]
+    new = [rng.uniform(0, 1000) for _ in range(rng.randint(0, 50))]
+    tolerance = rng.choice([0.0, 0.5, 2.0])
+    merged, report = merge_guides(existing, new, tolerance)
+
+    # Sorted, no two guides within the tolerance, no guide moved, and every guide accounted for by the report
+    assert merged == sorted(merged)
+    assert all(b - a > tolerance for a, b in zip(merged, merged[1:]))
+    assert set(merged) <= set(existing) | set(new)
+    assert report["added"] + report["merged"] == len(new)
+    assert len(merged) == len(existing) - report["dropped"] + report["added"]
+
+
+def test_infer_grid_round_trip():
+    spec = resolve_preset(dict(DEFAULT_PRESET, num_tiles_x=4, num_tiles_y=3), 3000, 2000, 300.0)
+    layout = compute_layout(spec, 3000, 2000)
+    inferred = infer_verified_grid(to_list(layout.guides_x()), to_list(layout.guides_y()), 3000, 2000)
+    assert (inferred["num_tiles_x"], inferred["num_tiles_y"]) == (4, 3)
+    again = compute_layout(inferred, 3000, 2000)
+    assert to_list(again.guides_x()) == pytest.approx(to_list(layout.guides_x()), abs=1.0)
+
+
+def test_infer_grid_ignores_stray_guides():
+    spec = resolve_preset(dict(DEFAULT_PRESET, num_tiles_x=4, num_tiles_y=3), 3000, 2000, 300.0)
+    layout = compute_layout(spec, 3000, 2000)
+    guides_x = to_list(layout.guides_x()) + [1234.0]
+    inferred = infer_verified_grid(guides_x, to_list(layout.guides_y()), 3000, 2000)
+    assert (inferred["num_tiles_x"], inferred["num_tiles_y"]) == (4, 3)
+
+
+def test_infer_grid_rejects_grids_it_cannot_reproduce():
+    # Hand-placed tiles, each guide off by up to 0.9 pixels: the regular grid fitted to them misses some guides
+    guides_x = [85.41, 250.34, 269.7, 436.02, 455.25, 621.47, 641.4, 807.36]
+    guides_y = [100.0, 311.2]
+    assert infer_grid(guides_x, guides_y, 4000, 4000) is not None
+    assert infer_verified_grid(guides_x, guides_y, 4000, 4000) is None
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_auto_fit_python_matches_numpy(seed):
+    np = pytest.importorskip("numpy")  # noqa: F841
+    rng = random.Random(seed)
+    doc_size_x, doc_size_y = rng.randint(200, 8000), rng.randint(200, 8000)
+    margins = tuple(rng.uniform(0, 50) for _ in range(4))
+    gutters_x = default_gutter_candidates(doc_size_x, rng.uniform(0, 30))
+    gutters_y = default_gutter_candidates(doc_size_y, rng.uniform(0, 30))
+    tile_size = (rng.uniform(50, 800), rng.uniform(50, 800)) if seed % 2 else None
+    args = (doc_size_x - margins[0] - margins[1], doc_size_y - margins[2] - margins[3],
+            rng.uniform(0.2, 5.0) if tile_size is None else tile_size[0] / tile_size[1],
+            None if tile_size is None else tile_size[0], gutters_x, gutters_y, 200, 200, rng.randint(1, 8))
+    expected = autofit._auto_fit_numpy(*args)
+    results = autofit._auto_fit_python(*args)
+    # NumPy and math logarithms may differ in the last bit
+    key = ("num_tiles_x", "num_tiles_y", "gutter_x", "gutter_y")
+    assert [[result[name] for name in key] for result in results] == [[result[name] for name in key] for result in expected]
+    assert [result["score"] for result in results] == pytest.approx([result["score"] for result in expected])
+
+
+def test_auto_fit_python_finds_the_best_layouts():
+    # Exhaustive reference: every column/gutter and row/gutter pair, ranked by rounded score then number of tiles
+    available_x, available_y, tile_ratio = 2000.0, 1500.0, 1.5
+    gutters = [0.0, 10.0, 40.0]
+    candidates_x = autofit._axis_candidates(available_x, gutters, 60)
+    candidates_y = autofit._axis_candidates(available_y, gutters, 60)
+    reference = []
+    for i, (mx, num_x, _) in enumerate(candidates_x):
+        for j, (my, num_y, _) in enumerate(candidates_y):
+            tile_x = min(mx, my * tile_ratio)
+            score = abs(math.log((mx / my) / tile_ratio)) + 1 - (tile_x * tile_x / tile_ratio) / (mx * my)
+            reference.append((round(score, autofit.SCORE_DECIMALS), num_x * num_y, i, j, num_x, num_y))
+    expected = [(num_x, num_y) for _, _, _, _, num_x, num_y in sorted(reference)[:10]]
+
+    results = autofit._auto_fit_python(available_x, available_y, tile_ratio, None, gutters, gutters, 60, 60, 10)
+    assert [(result["num_tiles_x"], result["num_tiles_y"]) for result in results] == expected
+
+
+def nested_preset():
+    # Two columns, the left one split into two rows, the lower of which is split into two columns
+    no_margins = {"margin_l": 0, "margin_r": 0, "margin_t": 0, "margin_b": 0, "gutter_x": 0, "gutter_y": 0}
+    return dict(no_margins, num_tiles_x=2, num_tiles_y=1, tile_ratio=1.0, subgrids=[
+        {"parent": 0, "row": 0, "col": 0, "preset": dict(no_margins, num_tiles_x=1, num_tiles_y=2)},
+        {"parent": 1, "row": 1, "col": 0, "preset": dict(no_margins, num_tiles_x=2, num_tiles_y=1)}])
+
+
+def test_nested_layout_depths():
+    spec = resolve_preset(nested_preset(), 200, 100, 72.0)
+    for max_depth, num_tiles in ((0, 2), (1, 3), (2, 4), (None, 4)):
+        layout = compute_layout(dict(spec, max_depth=max_depth), 200, 100)
+        rects = layout.tile_rects()
+        assert len(rects) == num_tiles
+        assert len(layout.pixel_rects()) == num_tiles
+        # The right column is never split, the tiles of the left one stay inside it
+        assert (100.0, 0.0, 100.0, 100.0) in rects
+        for x, y, w, h in rects:
+            if x < 100.0:
+                assert x + w <= 100.0 + EPSILON and 0.0 <= y and y + h <= 100.0 + EPSILON
+        guides_x = to_list(layout.guides_x())
+        assert guides_x == sorted(guides_x)
+        assert {0.0, 100.0, 200.0} <= set(guides_x)
+
+
+def test_tile_tree():
+    preset = {"num_tiles_x": 2}
+    tree = TileTree([{"parent": 0, "row": 0, "col": 1, "preset": preset}, {"parent": 0, "row": 0, "col": 0, "preset": preset}])
+    assert len(tree) == 3
+    assert len(tree.presets) == 1
+    assert tree.find_child(0, 0, 0) == 1
+    assert tree.find_child(0, 0, 1) == 2
+    assert tree.find_child(0, 1, 0) == -1
+
+    with pytest.raises(ValueError):
+        TileTree([{"parent": 1, "row": 0, "col": 0, "preset": preset}])
+    with pytest.raises(ValueError):
+        TileTree([{"parent": 0, "row": 0, "col": 0, "preset": preset}, {"parent": 0, "row": 0, "col": 0, "preset": {}}])
+
+
+def test_pure_modules_import_without_krita_nor_pyqt5():
+    # In a fresh interpreter where krita and PyQt5 cannot be imported, every module declaring it does not need them
+    package = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tile_grid")
+    modules = []
+    for path in sorted(glob.glob(os.path.join(package, "*.py"))):
+        with open(path, 'r') as file:
+            if "must not import" in file.read():
+                modules.append("tile_grid." + os.path.splitext(os.path.basename(path))[0])
+    assert "tile_grid.layout" in modules
+    code = "import sys; sys.modules.update(dict.fromkeys(['krita', 'PyQt5', 'sip'], None))\n"
+    code += "\n".join("import " + module for module in modules)
+    subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(package), check=True)
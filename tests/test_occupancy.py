@@ -0,0 +1,159 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Occupancy map, with and without NumPy: both must give the same states and bounding boxes.
+
+import os, random
+
+import pytest
+
+from tile_grid import occupancy
+from tile_grid.layout import compute_layout
+from tile_grid.occupancy import STATE_CONTENT, STATE_EMPTY, STATE_SOLID, STATE_TRANSPARENT, OccupancyCache, analyze_tiles
+
+
+@pytest.fixture(params=["numpy", "bytes"])
+def analyze(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(occupancy, "np", None)
+    return analyze_tiles
+
+
+def make_image(width, height, pixels):
+    # pixels: {(x, y): (b, g, r, a)}, every other pixel being zero
+    data = bytearray(width * height * 4)
+    for (x, y), pixel in pixels.items():
+        data[(y * width + x) * 4:(y * width + x) * 4 + 4] = bytes(pixel)
+    return bytes(data)
+
+
+def fill(x0, y0, w, h, pixel):
+    return {(x, y): pixel for y in range(y0, y0 + h) for x in range(x0, x0 + w)}
+
+
+def test_tile_states(analyze):
+    # 8x8 image cut into four 4x4 tiles
+    pixels = {}
+    pixels.update(fill(4, 0, 4, 4, (10, 20, 30, 0)))
+    pixels.update(fill(0, 4, 4, 4, (0, 0, 255, 255)))
+    pixels.update(fill(4, 4, 4, 4, (0, 0, 255, 255)))
+    pixels[(6, 5)] = (255, 0, 0, 255)
+    pixels[(7, 7)] = (255, 0, 0, 128)
+    rects = [(x, y, 4, 4, y // 4, x // 4) for y in (0, 4) for x in (0, 4)]
+    results = analyze(make_image(8, 8, pixels), 8, 8, rects)
+
+    assert [(result["row"], result["col"], result["state"]) for result in results] == [
+        (0, 0, STATE_EMPTY), (0, 1, STATE_TRANSPARENT), (1, 0, STATE_SOLID), (1, 1, STATE_CONTENT)]
+    assert results[1]["bbox"] is None
+    assert results[2]["color"] == (255, 0, 0, 255)
+    assert results[3]["bbox"] == (6, 5, 2, 3)
+
+
+def test_transparent_tiles_keep_their_bounding_box(analyze):
+    pixels = {(2, 1): (1, 2, 3, 0)}
+    results = analyze(make_image(4, 4, pixels), 4, 4, [(0, 0, 4, 4, 0, 0)])
+    assert results[0]["state"] == STATE_TRANSPARENT
+    assert results[0]["bbox"] == (2, 1, 1, 1)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_numpy_and_bytes_agree(seed, monkeypatch):
+    pytest.importorskip("numpy")
+    rng = random.Random(seed)
+    width, height = rng.randint(8, 40), rng.randint(8, 40)
+    pixels = {}
+    for _ in range(rng.randint(0, 20)):
+        w, h = rng.randint(1, min(10, width)), rng.randint(1, min(10, height))
+        pixel = (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255), rng.choice([0, 255, rng.randint(0, 255)]))
+        pixels.update(fill(rng.randint(0, width - w), rng.randint(0, height - h), w, h, pixel))
+    data = make_image(width, height, pixels)
+
+    # Evenly spaced tiles (analyzed as one strided view) or tiles of uneven sizes
+    num_cols, num_rows = rng.randint(1, 4), rng.randint(1, 4)
+    tile_w, tile_h = width // num_cols, height // num_rows
+    rects = [(col * tile_w, row * tile_h, tile_w, tile_h, row, col) for row in range(num_rows) for col in range(num_cols)]
+    if seed % 2:
+        rects = [(x, y, w - rng.randint(0, w - 1), h - rng.randint(0, h - 1), row, col) for x, y, w, h, row, col in rects]
+
+    expected = analyze_tiles(data, width, height, rects)
+    monkeypatch.setattr(occupancy, "np", None)
+    assert analyze_tiles(data, width, height, rects) == expected
+
+
+def page_layout(num_tiles_x, num_tiles_y):
+    # Tiles covering the whole 8x4 page
+    return compute_layout({
+        "margin_l": 0.0, "margin_r": 0.0, "margin_t": 0.0, "margin_b": 0.0, "gutter_x": 0.0, "gutter_y": 0.0,
+        "num_tiles_x": num_tiles_x, "num_tiles_y": num_tiles_y, "tile_ratio": 8.0 * num_tiles_y / (4.0 * num_tiles_x)
+    }, 8, 4)
+
+
+def saved_document(make_document, tmp_path, name="page.kra"):
+    # 8x4 document saved as a file, with one painted layer and the right half painted
+    doc = make_document(8, 4, 72.0)
+    doc.pixels = make_image(8, 4, fill(4, 0, 4, 4, (0, 0, 255, 255)))
+    doc.file_name = str(tmp_path / name)
+    (tmp_path / name).write_bytes(b"")
+    layer = doc.createNode("Paint", "paintlayer")
+    layer.node_bounds = (4, 0, 4, 4)
+    doc.rootNode().addChildNode(layer, None)
+    return doc, layer
+
+
+def test_occupancy_cache_hits_unchanged_documents(make_document, tmp_path):
+    cache = OccupancyCache()
+    doc, _ = saved_document(make_document, tmp_path)
+    layout = page_layout(2, 1)
+    results = cache.get_occupancy(doc, layout)
+    assert [tile["state"] for tile in results] == [STATE_EMPTY, STATE_SOLID]
+
+    # The key is read from the file and the layers: a hit does not read the pixels
+    doc.pixels = None
+    assert cache.get_occupancy(doc, layout) is results
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Another layout is another entry
+    cache.get_occupancy(doc, page_layout(1, 2))
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+@pytest.mark.parametrize("change", ["modified", "visible", "bounds", "saved"])
+def test_occupancy_cache_misses_changed_documents(make_document, tmp_path, change):
+    cache = OccupancyCache()
+    doc, layer = saved_document(make_document, tmp_path)
+    layout = page_layout(2, 1)
+    cache.get_occupancy(doc, layout)
+
+    doc.pixels = None
+    if change == "modified":
+        doc.is_modified = True
+    elif change == "visible":
+        layer.node_visible = False
+    elif change == "bounds":
+        layer.node_bounds = (0, 0, 8, 4)
+    else:
+        path = tmp_path / "page.kra"
+        stat = path.stat()
+        os.utime(str(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    assert [tile["state"] for tile in cache.get_occupancy(doc, layout)] == [STATE_EMPTY, STATE_EMPTY]
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_occupancy_cache_skips_unsaved_documents(make_document):
+    cache = OccupancyCache()
+    doc = make_document(8, 4, 72.0)
+    layout = page_layout(2, 1)
+    cache.get_occupancy(doc, layout)
+    cache.get_occupancy(doc, layout)
+    assert (cache.hits, cache.misses, len(cache.entries)) == (0, 2, 0)
+
+
+def test_occupancy_cache_evicts_the_least_recently_used(make_document, tmp_path):
+    cache = OccupancyCache(max_entries=2)
+    docs = [saved_document(make_document, tmp_path, "page{0}.kra".format(index))[0] for index in range(3)]
+    layout = page_layout(2, 1)
+    for doc in (docs[0], docs[1], docs[0], docs[2]):
+        cache.get_occupancy(doc, layout)
+    assert [key[1][0] for key in cache.entries] == [docs[0].file_name, docs[2].file_name]
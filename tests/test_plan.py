@@ -0,0 +1,131 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Batch planning of .kra files, without Krita.
+
+import multiprocessing
+
+import pytest
+
+from tile_grid import plan
+
+from tile_grid.guides import to_list
+from tile_grid.layout import compute_layout
+from tile_grid.plan import list_kra_files, plan_documents, plan_storyboard, read_kra_info
+from tile_grid.spec import DEFAULT_PRESET, GridSpec
+
+
+@pytest.fixture
+def kra_folder(tmp_path, write_kra):
+    sizes = [(2480, 3508), (3508, 2480), (1000, 1000)]
+    for index in range(30):
+        write_kra(tmp_path / "page_{0:02d}.kra".format(index), *sizes[index % len(sizes)])
+    (tmp_path / "notes.txt").write_text("not a document")
+    return tmp_path
+
+
+def test_read_kra_info(tmp_path, write_kra):
+    write_kra(tmp_path / "a.kra", 640, 480, 150)
+    assert read_kra_info(str(tmp_path / "a.kra")) == (640, 480, 150.0)
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_plan_documents_matches_layouts(kra_folder, workers):
+    paths = list_kra_files(str(kra_folder))
+    assert len(paths) == 30
+    preset = dict(DEFAULT_PRESET, num_tiles_x=4, num_tiles_y=6, panel_borders=True)
+    results = plan_documents(paths, preset, workers=workers, use_processes=False)
+
+    assert [result["document"] for result in results] == paths
+    grid_spec = GridSpec.from_preset(preset)
+    for result in results:
+        doc_size_x, doc_size_y = result["doc_size_x"], result["doc_size_y"]
+        layout = compute_layout(grid_spec.resolve(doc_size_x, doc_size_y, result["doc_ppi"]), doc_size_x, doc_size_y)
+        assert result["guides_x"] == pytest.approx(to_list(layout.guides_x()))
+        assert result["guides_y"] == pytest.approx(to_list(layout.guides_y()))
+        assert result["border_svg"].count("<rect") == 24
+        assert result["overlay_svg"] is None
+
+
+def test_plan_documents_draws_cell_grids_as_overlays(kra_folder):
+    preset = dict(DEFAULT_PRESET, num_tiles_x=5, num_tiles_y=5, grid_type="hex_pointy", panel_borders=True)
+    for result in plan_documents(list_kra_files(str(kra_folder)), preset, workers=2, use_processes=False):
+        assert result["border_svg"] is None
+        assert result["overlay_svg"].count("M") == 25
+
+
+def test_plan_documents_reports_broken_files(kra_folder):
+    broken = kra_folder / "broken.kra"
+    broken.write_bytes(b"not a zip file")
+    results = plan_documents(list_kra_files(str(kra_folder)), DEFAULT_PRESET, workers=2, use_processes=False)
+    errors = [result for result in results if "error" in result]
+    assert [result["document"] for result in errors] == [str(broken)]
+
+
+def test_plan_documents_spreads_documents_over_processes(kra_folder, monkeypatch):
+    # Every document waits at a barrier for a second one: a pool that ran them in a single process would time out
+    if multiprocessing.get_start_method() != "fork":
+        pytest.skip("the workers only see the patched planner when forked")
+    barrier = multiprocessing.Barrier(2, timeout=30)
+    plan_document = plan.plan_document
+
+    def plan_together(path, preset, unit_labels):
+        barrier.wait()
+        return plan_document(path, preset, unit_labels)
+
+    monkeypatch.setattr(plan, "plan_document", plan_together)
+    paths = list_kra_files(str(kra_folder))[:8]
+    results = plan_documents(paths, DEFAULT_PRESET, workers=2, use_processes=True)
+    assert [result["document"] for result in results] == paths
+    assert not any("error" in result for result in results)
+    assert len(set(result["worker"] for result in results)) == 2
+
+
+def test_plan_documents_validates_the_preset_first(kra_folder):
+    with pytest.raises(ValueError):
+        plan_documents(list_kra_files(str(kra_folder)), {"num_tiles_x": "many"}, use_processes=False)
+
+
+def test_plan_storyboard_shares_layouts():
+    page_sizes = [(2480, 3508)] * 10 + [(4960, 3508)]
+    documents, layouts = plan_storyboard(DEFAULT_PRESET, page_sizes, 300.0)
+    assert len(documents) == 11
+    assert len(layouts) == 2
+    assert documents[0]["pages"][0]["layout"] is documents[9]["pages"][0]["layout"]
+    assert documents[10]["doc_size_x"] == 4960
+
+
+def test_plan_storyboard_single_document():
+    page_sizes = [(1000, 1500)] * 4
+    documents, layouts = plan_storyboard(dict(DEFAULT_PRESET, num_tiles_x=2, num_tiles_y=2), page_sizes, 300.0,
+                                         single_document=True, page_gap=100)
+    assert len(documents) == 1
+    document = documents[0]
+    assert (document["doc_size_x"], document["doc_size_y"]) == (1000, 4 * 1500 + 3 * 100)
+    assert [page["offset_y"] for page in document["pages"]] == [0, 1600, 3200, 4800]
+
+    # Page edges plus the tile edges of every page
+    layout = layouts[(1000, 1500)]
+    assert len(document["guides_y"]) == 4 * (2 + len(layout.guides_y()))
+    assert document["guides_y"] == sorted(document["guides_y"])
+    assert len(document["guides_x"]) == 2 + len(layout.guides_x())
+
+
+def test_plan_storyboard_single_document_needs_the_same_columns():
+    preset = dict(DEFAULT_PRESET, num_tiles_x=3, num_tiles_y=2)
+    with pytest.raises(ValueError):
+        plan_storyboard(preset, [(1000, 1500), (1500, 1500)], 300.0, single_document=True)
+
+    # Short pages get narrower tiles, so a width in common is not enough
+    with pytest.raises(ValueError):
+        plan_storyboard(preset, [(1000, 1500), (1000, 300)], 300.0, single_document=True)
+
+    documents, layouts = plan_storyboard(preset, [(1000, 1500), (1000, 2000)], 300.0, single_document=True)
+    assert len(layouts) == 2
+    assert to_list(layouts[(1000, 1500)].guides_x()) == to_list(layouts[(1000, 2000)].guides_x())
+    assert documents[0]["guides_x"] == [0.0] + to_list(layouts[(1000, 1500)].guides_x()) + [1000.0]
+
+
+def test_plan_storyboard_rejects_grids_too_big():
+    with pytest.raises(ValueError):
+        plan_storyboard(dict(DEFAULT_PRESET, num_tiles_x=900), [(2480, 3508), (300, 300)], 300.0)
@@ -0,0 +1,139 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Preset parsing (GridSpec) and the preset library.
+
+import json, os, pickle
+
+import pytest
+
+from tile_grid.borders import build_border_svg
+from tile_grid.layout import compute_layout
+from tile_grid.library import BackgroundWriter, PresetLibrary
+from tile_grid.spec import DEFAULT_PRESET, PRESET_VERSION, GridSpec, Length, Unit
+
+
+def test_default_grid_spec_matches_default_preset():
+    assert GridSpec() == GridSpec.from_preset({})
+    assert GridSpec().to_preset() == DEFAULT_PRESET
+
+
+def test_round_trip():
+    grid_spec = GridSpec(margin_l=Length(2.0, Unit.CM), gutter_y=Length(12.0, Unit.PX), num_tiles_x=5, tracks_y="1, 2",
+                         pixel_aligned=True, grid_type="hex_flat")
+    preset = json.loads(json.dumps(grid_spec.to_preset()))
+    assert preset["version"] == PRESET_VERSION
+    assert preset["margin_l_unit"] == "cm"
+    assert GridSpec.from_preset(preset) == grid_spec
+    assert pickle.loads(pickle.dumps(grid_spec)) == grid_spec
+
+
+def test_version_1_preset():
+    # Unit labels (English or translated) and flags saved as strings
+    preset = {"margin_l": "1.5", "margin_l_unit": "Inches (in)", "margin_t_unit": "Zoll", "num_tiles_x": "4",
+              "lock_guides": "False", "pixel_aligned": "True"}
+    grid_spec = GridSpec.from_preset(preset, {"Inches (in)": "in", "Zoll": "in"})
+    assert grid_spec.margin_l == Length(1.5, Unit.IN)
+    assert grid_spec.margin_t.unit is Unit.IN
+    assert grid_spec.num_tiles_x == 4
+    assert grid_spec.lock_guides is False
+    assert grid_spec.pixel_aligned is True
+
+
+def test_invalid_preset_lists_every_error():
+    with pytest.raises(ValueError) as error:
+        GridSpec.from_preset({"num_tiles_x": 0, "tile_ratio": "wide", "gutter_x_unit": "furlongs", "tracks_x": "1,,2",
+                              "grid_type": "triangles"})
+    message = str(error.value)
+    for field in ("num_tiles_x", "tile_ratio", "gutter_x", "tracks_x", "grid type"):
+        assert field in message
+
+
+def test_resolve():
+    grid_spec = GridSpec(margin_l=Length(1.0, Unit.IN), margin_r=Length(10.0, Unit.PC), margin_t=Length(2.54, Unit.CM),
+                         margin_b=Length(7.0, Unit.PX))
+    spec = grid_spec.resolve(1000, 500, 300.0)
+    assert spec["margin_l"] == pytest.approx(300.0)
+    assert spec["margin_r"] == pytest.approx(100.0)
+    assert spec["margin_t"] == pytest.approx(300.0)
+    assert spec["margin_b"] == pytest.approx(7.0)
+    assert spec["doc_ppi"] == 300.0
+
+
+def test_library_round_trip(tmp_path):
+    writer = BackgroundWriter()
+    library = PresetLibrary(str(tmp_path), writer=writer)
+    assert library.save("Manga 4 panels", dict(DEFAULT_PRESET, num_tiles_x=2, num_tiles_y=2))
+    assert library.save("Strip", dict(DEFAULT_PRESET, num_tiles_x=4, num_tiles_y=1))
+    writer.flush()
+
+    other = PresetLibrary(str(tmp_path), writer=BackgroundWriter())
+    assert other.names() == ["Manga 4 panels", "Strip"]
+    assert other.load("Strip").num_tiles_x == 4
+    assert other.load("Strip") is other.load("Strip")
+    assert (other.hits, other.misses) == (2, 1)
+
+    other.delete("Strip")
+    other.writer.flush()
+    assert PresetLibrary(str(tmp_path)).names() == ["Manga 4 panels"]
+    assert sorted(os.listdir(str(tmp_path))) == ["Manga_4_panels.json", "index.json"]
+
+
+def test_library_skips_unchanged_writes(tmp_path):
+    writer = BackgroundWriter()
+    library = PresetLibrary(str(tmp_path), writer=writer)
+    library.save("A", DEFAULT_PRESET)
+    writer.flush()
+    written = writer.written
+    assert not library.save("A", dict(DEFAULT_PRESET))
+    assert not library.save("A", GridSpec())
+    writer.flush()
+    assert writer.written == written
+
+    # Same content written twice to a path: only the first write happens
+    path = str(tmp_path / "last.json")
+    assert writer.write(path, "{}")
+    assert not writer.write(path, "{}")
+
+
+def test_library_rejects_invalid_presets(tmp_path):
+    library = PresetLibrary(str(tmp_path), writer=BackgroundWriter())
+    with pytest.raises(ValueError):
+        library.save("Bad", {"num_tiles_x": -1})
+    assert len(library) == 0
+
+
+@pytest.mark.parametrize("field, value", [
+    ("margin_l", float("nan")), ("gutter_y", "inf"), ("tile_ratio", float("-inf")), ("border_width", "nan"),
+    ("num_tiles_x", 2.5), ("num_tiles_y", "3.7"), ("num_tiles_x", float("inf")),
+    ("tracks_x", "nan, 1"), ("tracks_y", "1[10:inf]"), ("tracks_x", "infpx"),
+    ("border_color", '#000" onload="x'), ("border_color", "<svg/>"), ("border_color", "red"), ("border_color", 0)
+])
+def test_preset_rejects_unsafe_values(field, value):
+    with pytest.raises(ValueError) as error:
+        GridSpec.from_preset({field: value})
+    assert field in str(error.value)
+
+
+def test_preset_accepts_whole_counts_and_hex_colors():
+    grid_spec = GridSpec.from_preset({"num_tiles_x": 4.0, "num_tiles_y": "5", "border_color": "#ff000080"})
+    assert (grid_spec.num_tiles_x, grid_spec.num_tiles_y) == (4, 5)
+    assert isinstance(grid_spec.num_tiles_x, int)
+    assert 'stroke="#ff0000" stroke-opacity="0.502"' in build_border_svg(compute_layout(
+        grid_spec.resolve(1000, 1000, 72.0), 1000, 1000), 72.0, color=grid_spec.border_color)
+
+
+@pytest.mark.parametrize("index_text", ['{"version": 1, "presets": {"Str', "[]", '{"presets": {"A": 3}}'])
+def test_library_rebuilds_a_corrupt_index(tmp_path, index_text):
+    writer = BackgroundWriter()
+    library = PresetLibrary(str(tmp_path), writer=writer)
+    library.save("Strip", dict(DEFAULT_PRESET, num_tiles_x=4, num_tiles_y=1))
+    library.save("Grid", DEFAULT_PRESET)
+    writer.flush()
+    (tmp_path / "index.json").write_text(index_text)
+
+    other = PresetLibrary(str(tmp_path), writer=BackgroundWriter())
+    assert other.names() == ["Grid", "Strip"]
+    assert other.load("Strip").num_tiles_x == 4
+    other.writer.flush()
+    assert PresetLibrary(str(tmp_path)).names() == ["Grid", "Strip"]
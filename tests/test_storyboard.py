@@ -0,0 +1,59 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Storyboard generator, on fake documents (see conftest.py).
+
+import pytest
+
+pytest.importorskip("PyQt5")
+
+from krita import Krita
+
+from tile_grid.spec import DEFAULT_PRESET
+from tile_grid.storyboard import create_storyboard
+
+
+PRESET = dict(DEFAULT_PRESET, num_tiles_x=2, num_tiles_y=3)
+
+
+def test_one_document_per_page(tmp_path):
+    documents, report = create_storyboard(PRESET, [(2480, 3508)] * 5, 300.0, directory=str(tmp_path), show=False)
+    assert report["documents"] == 5 and report["layouts"] == 1 and report["panels"] == 30
+
+    # Saved and closed, so only their paths are returned
+    assert documents == []
+    assert report["paths"] == [str(tmp_path / "Storyboard - page {0:03d}.kra".format(page)) for page in range(1, 6)]
+    documents = Krita.instance().documents[-5:]
+    for doc in documents:
+        layers = doc.rootNode().childNodes()
+        assert [layer.name() for layer in layers] == ["Panel {0}".format(panel) for panel in range(6, 0, -1)]
+        assert layers[-1].childNodes()[0].type() == "selectionmask"
+        assert doc.refresh_count == 1
+
+
+def test_single_document_needs_pages_of_the_same_width():
+    with pytest.raises(ValueError):
+        create_storyboard(PRESET, [(1000, 1500), (1200, 1500)], 300.0, single_document=True)
+        assert doc.closed and doc.file_name.endswith(".kra")
+    assert documents[0].verticalGuides() == documents[4].verticalGuides()
+
+
+def test_single_document(tmp_path):
+    documents, report = create_storyboard(PRESET, [(1000, 1500)] * 3, 300.0, single_document=True, page_gap=50)
+    assert len(documents) == 1
+    doc = documents[0]
+    assert (doc.width(), doc.height()) == (1000, 3 * 1500 + 2 * 50)
+    groups = doc.rootNode().childNodes()
+    assert [group.name() for group in groups] == ["Page 3", "Page 2", "Page 1"]
+
+    # The masks of the last page are offset by the pages above it
+    mask = groups[0].childNodes()[-1].childNodes()[0]
+    x, y, w, h = mask.selection.rects[0]
+    assert y >= 2 * (1500 + 50)
+    assert doc.refresh_count == 1
+    assert report["paths"] == []
+
+
+def test_single_document_needs_pages_of_the_same_width():
+    with pytest.raises(ValueError):
+        create_storyboard(PRESET, [(1000, 1500), (1200, 1500)], 300.0, single_document=True)
@@ -0,0 +1,47 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Optional stage timings.
+
+import json
+
+from tile_grid.timing import NULL_RUN, NULL_STAGE, Timer
+
+
+def test_disabled_timer_does_nothing():
+    timer = Timer()
+    run = timer.start_run("add_tile_grid")
+    assert run is NULL_RUN
+    assert timer.stage("layout") is NULL_STAGE
+    with timer.stage("layout"):
+        pass
+    timer.finish_run(run)
+    assert timer.last_run is None
+
+
+def test_run_record(tmp_path):
+    log_path = tmp_path / "timings.jsonl"
+    timer = Timer()
+    timer.enable(str(log_path))
+    for index in range(2):
+        run = timer.start_run("add_tile_grid", doc_size_x=100)
+        with timer.stage("layout"):
+            with timer.stage("guides"):
+                pass
+        with timer.stage("layout"):
+            pass
+        # Nested runs time into the outer run
+        inner = timer.start_run("apply_tile_grid")
+        with timer.stage("merge"):
+            pass
+        timer.finish_run(inner)
+        run.set_info(num_tiles_x=3)
+        timer.finish_run(run)
+
+    records = [json.loads(line) for line in log_path.read_text().splitlines()]
+    assert len(records) == 2
+    assert records[0]["run"] == "add_tile_grid"
+    assert records[0]["doc_size_x"] == 100 and records[0]["num_tiles_x"] == 3
+    assert list(records[0]["stages"]) == ["guides", "layout", "merge"]
+    assert records[0]["total"] >= records[0]["stages"]["layout"]
+    assert timer.last_run.summary().startswith("add_tile_grid: ")
@@ -1,3 +1,9 @@
-from .tile_grid import TileGridExtension
+# The layout engine (tile_grid.layout) can be imported outside of Krita, so only register the extension when running inside Krita
+try:
+    import krita
+except ImportError:
+    pass
+else:
+    from .tile_grid import TileGridExtension
 
-Krita.instance().addExtension(TileGridExtension(Krita.instance()))
+    Krita.instance().addExtension(TileGridExtension(Krita.instance()))
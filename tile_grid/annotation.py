@@ -0,0 +1,145 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Grid spec stored in the document (as an annotation), so that the grid can follow resizes of the canvas.
+# The annotation keeps the preset (with its original units), the document size it was applied to and the
+# guides owned by the plugin. On resize, only the plugin guides of the axes that changed are swapped;
+# the other guides (e.g. placed by hand) are left untouched. Hex and isometric grids have their cell grid layer redrawn.
+
+from krita import Krita
+from PyQt5.QtCore import QByteArray, QObject, QTimer
+import json
+
+from .borders import add_svg_layer
+from .guides import merge_guides, remove_guides
+from .layout import compute_layout
+from .overlays import DEFAULT_OVERLAY_LAYER_NAME, CellGrid, get_overlay_svg
+from .spec import GridSpec, get_unit_labels
+
+
+ANNOTATION_TYPE = "tile_grid"
+ANNOTATION_DESCRIPTION = "Tile Grid plugin settings"
+ANNOTATION_VERSION = 1
+
+
+def store_grid(doc, preset, guides_x, guides_y):
+    # guides_x and guides_y are the guides added by the plugin. preset is a preset dict or a GridSpec.
+    data = {
+        "version": ANNOTATION_VERSION,
+        "preset": preset.to_preset() if isinstance(preset, GridSpec) else preset,
+        "doc_size_x": doc.width(),
+        "doc_size_y": doc.height(),
+        "doc_ppi": doc.resolution(),
+        "guides_x": list(guides_x),
+        "guides_y": list(guides_y)
+    }
+    doc.setAnnotation(ANNOTATION_TYPE, ANNOTATION_DESCRIPTION, QByteArray(json.dumps(data).encode("utf-8")))
+
+
+def load_grid(doc):
+    # Returns the stored grid, or None if the document has none (or an unreadable one)
+    raw = bytes(doc.annotation(ANNOTATION_TYPE))
+    if not raw:
+        return None
+    try:
+        data = json.loads(raw.decode("utf-8"))
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or data.get("version") != ANNOTATION_VERSION:
+        return None
+    return data
+
+
+def relayout_stored_grid(doc, tolerance=None):
+    # Re-applies the stored grid if the document size or resolution changed since it was applied.
+    # Guides are matched with the guide_tolerance of the stored preset, unless a tolerance is given.
+    # Hex and isometric grids get their cell grid layer redrawn (unless it was deleted).
+    # Returns what was updated: the axes ("x", "y") whose plugin guides were swapped, and "overlay".
+    stored = load_grid(doc)
+    if stored is None:
+        return []
+    doc_size_x, doc_size_y, doc_ppi = doc.width(), doc.height(), doc.resolution()
+    old_size_x, old_size_y = stored["doc_size_x"], stored["doc_size_y"]
+    if (doc_size_x, doc_size_y, doc_ppi) == (old_size_x, old_size_y, stored["doc_ppi"]):
+        return []
+
+    try:
+        grid_spec = GridSpec.from_preset(stored["preset"], get_unit_labels())
+        layout = compute_layout(grid_spec.resolve(doc_size_x, doc_size_y, doc_ppi), doc_size_x, doc_size_y)
+    except (ValueError, ZeroDivisionError):
+        return []
+    if layout.tile_size_x < 1 or layout.tile_size_y < 1:
+        return []
+    if tolerance is None:
+        tolerance = grid_spec.guide_tolerance
+
+    changed_axes = []
+    new_guides_x = layout.guides_x().tolist()
+    new_guides_y = layout.guides_y().tolist()
+    if not same_guides(new_guides_x, stored["guides_x"], tolerance):
+        doc.setVerticalGuides(swap_guides(doc.verticalGuides(), stored["guides_x"], new_guides_x, old_size_x, doc_size_x, tolerance))
+        changed_axes.append("x")
+    if not same_guides(new_guides_y, stored["guides_y"], tolerance):
+        doc.setHorizontalGuides(swap_guides(doc.horizontalGuides(), stored["guides_y"], new_guides_y, old_size_y, doc_size_y, tolerance))
+        changed_axes.append("y")
+
+    if isinstance(layout, CellGrid) and replace_overlay_layer(doc, layout, grid_spec):
+        changed_axes.append("overlay")
+
+    store_grid(doc, stored["preset"], new_guides_x, new_guides_y)
+    return changed_axes
+
+
+def replace_overlay_layer(doc, grid, grid_spec, name=DEFAULT_OVERLAY_LAYER_NAME):
+    # Swaps the top-level cell grid layer for one drawn on the new grid. Returns False if there is no such layer.
+    for node in doc.rootNode().childNodes():
+        if node.type() == "vectorlayer" and node.name() == name:
+            node.remove()
+            add_svg_layer(doc, get_overlay_svg(grid, doc.resolution(), grid_spec.border_width, grid_spec.border_color), name)
+            return True
+    return False
+
+
+def same_guides(guides, other_guides, tolerance):
+    return len(guides) == len(other_guides) and all(abs(a - b) <= tolerance for a, b in zip(guides, other_guides))
+
+
+def swap_guides(current, owned, new, old_size, new_size, tolerance):
+    # Removes the plugin guides, either where they were placed or where a proportional scaling of the image moved them
+    user_guides = remove_guides(current, owned, tolerance)
+    if old_size and old_size != new_size:
+        user_guides = remove_guides(user_guides, [pos * new_size / old_size for pos in owned], tolerance)
+    return merge_guides(user_guides, new, tolerance)[0]
+
+
+class GridWatcher(QObject):
+    # Krita has no resize notification, so the active document size is checked periodically (a few cheap calls),
+    # and whenever a view is created. The stored grid is only read when the size or resolution actually changed.
+    def __init__(self, parent=None, interval=500):
+        super().__init__(parent)
+        self.known_sizes = {}
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.check_active_document)
+
+        notifier = Krita.instance().notifier()
+        notifier.setActive(True)
+        notifier.viewCreated.connect(self.check_active_document)
+
+    def start(self):
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def check_active_document(self):
+        doc = Krita.instance().activeDocument()
+        if doc is None:
+            return
+        key = doc.rootNode().uniqueId().toString()
+        size = (doc.width(), doc.height(), doc.resolution())
+        if self.known_sizes.get(key) == size:
+            return
+        self.known_sizes[key] = size
+        relayout_stored_grid(doc)
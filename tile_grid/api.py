@@ -0,0 +1,81 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Non-interactive scripting API: applies a tile grid preset to a document without showing any UI.
+#
+# Example (from the Scripter):
+#     from tile_grid.api import apply_tile_grid
+#     apply_tile_grid(Krita.instance().activeDocument(), {"num_tiles_x": 2, "num_tiles_y": 4})
+
+from .guides import merge_guides
+from .annotation import store_grid
+from .borders import add_border_layer, border_style
+from .layout import compute_layout
+from .overlays import CellGrid, add_overlay_layer
+from .spec import GridSpec, get_unit_labels
+from .timing import timer
+
+
+def apply_tile_grid(doc, preset, set_guide_options=True, store=True):
+    # Adds the guides of the preset's grid to the document. preset is a GridSpec, or a preset dict (see GridSpec.from_preset()).
+    # When set_guide_options is True, guides are made visible and (un)locked through the document itself,
+    # which works for documents that are not displayed in any view.
+    # When store is True, the preset is saved in the document so that the grid follows later resizes.
+    # When the preset has panel_borders set, a vector layer with the panel borders is added as well.
+    # Hex and isometric grids (see overlays.py) add a vector layer with the cell outlines instead of guides.
+    # Returns (layout, report) where report counts the guides added, merged or dropped.
+    # Raises ValueError when the preset is invalid or the grid does not fit the document.
+    # The stages are timed when timing is on (see timing.py).
+    doc_size_x = doc.width()
+    doc_size_y = doc.height()
+    run = timer.start_run("apply_tile_grid", doc_size_x=doc_size_x, doc_size_y=doc_size_y, doc_ppi=doc.resolution())
+    try:
+        with timer.stage("preset"):
+            grid_spec = GridSpec.from_preset(preset, get_unit_labels())
+            spec = grid_spec.resolve(doc_size_x, doc_size_y, doc.resolution())
+
+        with timer.stage("layout"):
+            layout = compute_layout(spec, doc_size_x, doc_size_y)
+            if layout.tile_size_x < 1 or layout.tile_size_y < 1:
+                raise ValueError("The specified grid parameters are too big for the document size")
+            guides_x = layout.guides_x()
+            guides_y = layout.guides_y()
+
+        report = apply_guides(doc, guides_x, guides_y, grid_spec, set_guide_options)
+        if store:
+            with timer.stage("store"):
+                store_grid(doc, grid_spec, guides_x.tolist(), guides_y.tolist())
+        with timer.stage("layers"):
+            panel_borders, width, radius, color = border_style(grid_spec)
+            if isinstance(layout, CellGrid):
+                add_overlay_layer(doc, layout, width, color)
+            elif panel_borders:
+                add_border_layer(doc, layout, width, radius, color)
+        run.set_info(num_tiles_x=layout.num_tiles_x, num_tiles_y=layout.num_tiles_y)
+        return layout, report
+    finally:
+        timer.finish_run(run)
+
+
+def apply_guides(doc, new_guides_x, new_guides_y, preset, set_guide_options=True):
+    # Merges precomputed guides into the document according to the preset options (clear_guides, lock_guides, guide_tolerance).
+    # Returns the merge report.
+    grid_spec = GridSpec.from_preset(preset, get_unit_labels())
+    if set_guide_options:
+        with timer.stage("guide_options"):
+            doc.setGuidesVisible(True)
+            doc.setGuidesLocked(grid_spec.lock_guides)
+
+    with timer.stage("get_guides"):
+        guides_x = [] if grid_spec.clear_guides else doc.verticalGuides()
+        guides_y = [] if grid_spec.clear_guides else doc.horizontalGuides()
+
+    with timer.stage("merge"):
+        guides_x, report_x = merge_guides(guides_x, new_guides_x, grid_spec.guide_tolerance)
+        guides_y, report_y = merge_guides(guides_y, new_guides_y, grid_spec.guide_tolerance)
+
+    with timer.stage("set_guides"):
+        doc.setVerticalGuides(guides_x)
+        doc.setHorizontalGuides(guides_y)
+
+    return {key: report_x[key] + report_y[key] for key in report_x}
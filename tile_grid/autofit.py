@@ -0,0 +1,174 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Auto-fit: searches the column x row x gutter combinations that best fit a target tile ratio (or tile size in pixels).
+# With NumPy, every combination is evaluated in a single broadcast. Without it, the same search relies on the fact that
+# the score grows away from the target ratio: for each column/gutter pair, only the row/gutter pairs that can still rank are scored.
+# This module must not import krita nor PyQt5.
+
+from bisect import bisect_left
+import heapq, math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+DEFAULT_MAX_TILES = 200
+DEFAULT_NUM_RESULTS = 5
+
+# Scores closer than this are considered equal (0.1% error is not visible), the layout with fewer tiles wins
+SCORE_DECIMALS = 3
+
+
+def default_gutter_candidates(doc_size, min_gutter=0):
+    # A few common gutter sizes (in pixels) relative to the document size, plus the current minimum gutter
+    candidates = {float(min_gutter), 0.0}
+    for percentage in (0.5, 1.0, 2.5, 5.0):
+        candidates.add(round(doc_size * percentage * 0.01, 2))
+    return sorted(candidates)
+
+
+def auto_fit(doc_size_x, doc_size_y, margins, tile_ratio=None, tile_size=None, gutters_x=(0,), gutters_y=(0,),
+             max_tiles_x=DEFAULT_MAX_TILES, max_tiles_y=DEFAULT_MAX_TILES, num_results=DEFAULT_NUM_RESULTS):
+    # margins: (margin_l, margin_r, margin_t, margin_b) in pixels.
+    # The target is either tile_ratio (width/height) or tile_size (width, height) in pixels.
+    # Returns the num_results best layouts, best first, as dicts with the number of tiles, the minimum gutters,
+    # the resulting tile size, the ratio error (log scale), the wasted area (0 to 1) and the overall score.
+    # The wasted area is the share of the space left once margins and minimum gutters are taken out that is not
+    # covered by tiles. Layouts with the same score are ranked by increasing number of tiles.
+    if tile_size is not None:
+        tile_ratio = tile_size[0] / tile_size[1]
+    if tile_ratio is None or tile_ratio <= 0:
+        raise ValueError("A positive tile ratio or tile size is required")
+
+    margin_l, margin_r, margin_t, margin_b = margins
+    available_x = doc_size_x - margin_l - margin_r
+    available_y = doc_size_y - margin_t - margin_b
+    if available_x <= 0 or available_y <= 0:
+        return []
+
+    target_width = tile_size[0] if tile_size is not None else None
+    if np is not None:
+        return _auto_fit_numpy(available_x, available_y, tile_ratio, target_width, gutters_x, gutters_y, max_tiles_x, max_tiles_y, num_results)
+    return _auto_fit_python(available_x, available_y, tile_ratio, target_width, gutters_x, gutters_y, max_tiles_x, max_tiles_y, num_results)
+
+
+def _axis_candidates(available, gutters, max_tiles):
+    # (max_tile_size, num_tiles, gutter) of every valid combination of an axis
+    candidates = []
+    for gutter in gutters:
+        for num_tiles in range(1, max_tiles + 1):
+            max_tile_size = (available - (num_tiles - 1) * gutter) / num_tiles
+            if max_tile_size < 1:
+                break
+            candidates.append((max_tile_size, num_tiles, gutter))
+    return candidates
+
+
+def _result(num_tiles_x, num_tiles_y, gutter_x, gutter_y, tile_size_x, tile_size_y, ratio_error, wasted_area, score):
+    return {
+        "num_tiles_x": int(num_tiles_x),
+        "num_tiles_y": int(num_tiles_y),
+        "gutter_x": float(gutter_x),
+        "gutter_y": float(gutter_y),
+        "tile_size_x": float(tile_size_x),
+        "tile_size_y": float(tile_size_y),
+        "ratio_error": float(ratio_error),
+        "wasted_area": float(wasted_area),
+        "score": float(score)
+    }
+
+
+def _auto_fit_numpy(available_x, available_y, tile_ratio, target_width, gutters_x, gutters_y, max_tiles_x, max_tiles_y, num_results):
+    # Axis x on the first dimension, axis y on the second one
+    cols = np.arange(1, max_tiles_x + 1, dtype=np.float64)
+    rows = np.arange(1, max_tiles_y + 1, dtype=np.float64)
+    gx = np.asarray(gutters_x, dtype=np.float64)
+    gy = np.asarray(gutters_y, dtype=np.float64)
+    max_x = ((available_x - (cols[None, :] - 1) * gx[:, None]) / cols[None, :]).ravel()
+    max_y = ((available_y - (rows[None, :] - 1) * gy[:, None]) / rows[None, :]).ravel()
+    num_x = np.broadcast_to(cols[None, :], (gx.size, cols.size)).ravel()
+    num_y = np.broadcast_to(rows[None, :], (gy.size, rows.size)).ravel()
+    gut_x = np.broadcast_to(gx[:, None], (gx.size, cols.size)).ravel()
+    gut_y = np.broadcast_to(gy[:, None], (gy.size, rows.size)).ravel()
+    valid_x = max_x >= 1
+    valid_y = max_y >= 1
+    max_x, num_x, gut_x = max_x[valid_x], num_x[valid_x], gut_x[valid_x]
+    max_y, num_y, gut_y = max_y[valid_y], num_y[valid_y], gut_y[valid_y]
+    if max_x.size == 0 or max_y.size == 0:
+        return []
+
+    # Same rule as the layout engine: the tile is limited by the axis that runs out of space first
+    mx = max_x[:, None]
+    my = max_y[None, :]
+    tile_x = np.minimum(mx, my * tile_ratio)
+    tile_y = tile_x / tile_ratio
+    ratio_error = np.abs(np.log((mx / my) / tile_ratio))
+    wasted_area = 1 - (tile_x * tile_y) / (mx * my)
+    score = ratio_error + wasted_area
+    if target_width is not None:
+        score = score + np.abs(np.log(tile_x / target_width))
+
+    # Rounding the score lets the number of tiles break the ties
+    rounded_score = np.round(score, SCORE_DECIMALS).ravel()
+    num_tiles = (num_x[:, None] * num_y[None, :]).ravel()
+    count = min(num_results, rounded_score.size)
+    threshold = np.partition(rounded_score, count - 1)[count - 1]
+    contenders = np.flatnonzero(rounded_score <= threshold)
+    best = contenders[np.lexsort((num_tiles[contenders], rounded_score[contenders]))][:count]
+    results = []
+    for index in best:
+        i, j = divmod(int(index), max_y.size)
+        results.append(_result(num_x[i], num_y[j], gut_x[i], gut_y[j], tile_x[i, j], tile_y[i, j],
+                               ratio_error[i, j], wasted_area[i, j], score[i, j]))
+    return results
+
+
+def _auto_fit_python(available_x, available_y, tile_ratio, target_width, gutters_x, gutters_y, max_tiles_x, max_tiles_y, num_results):
+    # Same candidates, scores and ranking as _auto_fit_numpy() (ties go to fewer tiles, then to the first candidates).
+    # Without the target width, the score only depends on how far mx / my is from the ratio and grows with that distance;
+    # with it, that part is still a lower bound. So for each column/gutter pair, the row/gutter pairs are walked from the
+    # ideal height outwards, and each walk stops as soon as the bound cannot beat the current results.
+    candidates_x = _axis_candidates(available_x, gutters_x, max_tiles_x)
+    candidates_y = _axis_candidates(available_y, gutters_y, max_tiles_y)
+    if not candidates_x or not candidates_y:
+        return []
+    order_y = sorted(range(len(candidates_y)), key=lambda j: candidates_y[j][0])
+    sizes_y = [candidates_y[j][0] for j in order_y]
+
+    # Worst result first: the keys are negated, so that the heap root is the result to drop
+    best = []
+
+    def consider(i, j):
+        # Returns False when neither this row/gutter pair nor any further from the ideal height can make the results
+        mx, num_tiles_x, gutter_x = candidates_x[i]
+        my, num_tiles_y, gutter_y = candidates_y[j]
+        tile_x = min(mx, my * tile_ratio)
+        tile_y = tile_x / tile_ratio
+        ratio_error = abs(math.log((mx / my) / tile_ratio))
+        wasted_area = 1 - (tile_x * tile_y) / (mx * my)
+        total = ratio_error + wasted_area
+        if len(best) == num_results and round(total, SCORE_DECIMALS) > -best[0][0]:
+            return False
+        if target_width is not None:
+            total += abs(math.log(tile_x / target_width))
+        key = (-round(total, SCORE_DECIMALS), -num_tiles_x * num_tiles_y, -i, -j)
+        entry = key + ((num_tiles_x, num_tiles_y, gutter_x, gutter_y, tile_x, tile_y, ratio_error, wasted_area, total),)
+        if len(best) < num_results:
+            heapq.heappush(best, entry)
+        elif key > best[0][:4]:
+            heapq.heapreplace(best, entry)
+        return True
+
+    for i, candidate_x in enumerate(candidates_x):
+        index = bisect_left(sizes_y, candidate_x[0] / tile_ratio)
+        for k in range(index - 1, -1, -1):
+            if not consider(i, order_y[k]):
+                break
+        for k in range(index, len(order_y)):
+            if not consider(i, order_y[k]):
+                break
+
+    return [_result(*entry[4]) for entry in sorted(best, reverse=True)]
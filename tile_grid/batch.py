@@ -0,0 +1,190 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Batch driver: applies tile grids to many documents without showing any UI.
+#
+# The job file is in JSON Lines format, one job per line:
+#     {"document": "/path/to/page_001.kra", "preset": {"num_tiles_x": 2, "num_tiles_y": 3}}
+#     {"document": "/path/to/page_002.kra", "preset_file": "/path/to/preset.json", "output": "/path/to/out.kra"}
+# Blank lines and lines starting with '#' are ignored.
+#
+# From the command line:
+#     kritarunner -s tile_grid.batch jobs.jsonl [report.jsonl]
+#
+# run_folder() applies a single preset to every .kra file of a directory. The layouts are all computed
+# up front in a worker pool (see tile_grid.plan); only the Krita document calls run on the main thread.
+
+from krita import Krita
+import json, time
+
+from .annotation import store_grid
+from .api import apply_guides, apply_tile_grid
+from .borders import DEFAULT_BORDER_LAYER_NAME, add_svg_layer
+from .overlays import DEFAULT_OVERLAY_LAYER_NAME
+from .plan import list_kra_files, plan_documents
+from .spec import GridSpec, get_unit_labels
+
+
+def read_jobs(jobs_path):
+    # Streams the job lines one at a time, so that very long job files are never loaded in memory at once.
+    # Yields (line_number, line): the lines are parsed by parse_job(), so that a malformed line only fails its own job.
+    with open(jobs_path, 'r') as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            yield line_number, line
+
+
+def parse_job(line):
+    # Raises ValueError if the line is not a JSON object
+    job = json.loads(line)
+    if not isinstance(job, dict):
+        raise ValueError("A job must be a JSON object")
+    return job
+
+
+# Presets of the preset files already read, parsed and validated, keyed by path
+_preset_files = {}
+
+
+def load_job_preset(job):
+    # Returns the GridSpec of a job. Preset files shared by many jobs are only read and validated once.
+    if "preset" in job:
+        return GridSpec.from_preset(job["preset"], get_unit_labels())
+    path = job["preset_file"]
+    if path not in _preset_files:
+        with open(path, 'r') as file:
+            _preset_files[path] = GridSpec.from_preset(json.load(file), get_unit_labels())
+    return _preset_files[path]
+
+
+def run_job(job):
+    start_time = time.perf_counter()
+    result = {"document": job.get("document")}
+    doc = Krita.instance().openDocument(job["document"])
+    if doc is None:
+        raise IOError("Unable to open {0}".format(job["document"]))
+    try:
+        _, report = apply_tile_grid(doc, load_job_preset(job))
+        result.update(report)
+        if "output" in job:
+            saved = doc.saveAs(job["output"])
+        else:
+            saved = doc.save()
+        if not saved:
+            raise IOError("Unable to save {0}".format(job.get("output", job["document"])))
+    finally:
+        doc.close()
+    result["status"] = "ok"
+    result["time"] = time.perf_counter() - start_time
+    return result
+
+
+def run_jobs(jobs_path, report_path=None):
+    # Runs every job of the file in order. A failing job is reported and does not stop the batch.
+    # Returns the list of per-job results, also written as JSON Lines to report_path if given.
+    app = Krita.instance()
+    batch_mode = app.batchmode()
+    app.setBatchmode(True)
+
+    results = []
+    report_file = open(report_path, 'w') if report_path else None
+    try:
+        for line_number, line in read_jobs(jobs_path):
+            job = {}
+            try:
+                job = parse_job(line)
+                result = run_job(job)
+            except Exception as error:
+                result = {"document": job.get("document"), "status": "error", "error": str(error)}
+            result["line"] = line_number
+            results.append(result)
+            if report_file is not None:
+                report_file.write(json.dumps(result) + "\n")
+                report_file.flush()
+    finally:
+        if report_file is not None:
+            report_file.close()
+        app.setBatchmode(batch_mode)
+
+    return results
+
+
+def run_folder(directory, preset, report_path=None, workers=None, recursive=False, use_processes=None):
+    # Applies the preset to every .kra file of the directory and saves them.
+    # Returns the per-file results (with timings), also written as JSON Lines to report_path if given.
+    start_time = time.perf_counter()
+    grid_spec = GridSpec.from_preset(preset, get_unit_labels())
+    paths = list_kra_files(directory, recursive)
+    plans = plan_documents(paths, grid_spec, get_unit_labels(), workers, use_processes)
+    plan_time = time.perf_counter() - start_time
+
+    app = Krita.instance()
+    batch_mode = app.batchmode()
+    app.setBatchmode(True)
+
+    results = []
+    report_file = open(report_path, 'w') if report_path else None
+    try:
+        for plan in plans:
+            result = {"document": plan["document"], "plan_time": plan.get("plan_time")}
+            try:
+                if "error" in plan:
+                    raise ValueError(plan["error"])
+                result.update(apply_plan(plan, grid_spec))
+                result["status"] = "ok"
+            except Exception as error:
+                result["status"] = "error"
+                result["error"] = str(error)
+            results.append(result)
+            if report_file is not None:
+                report_file.write(json.dumps(result) + "\n")
+                report_file.flush()
+    finally:
+        if report_file is not None:
+            report_file.close()
+        app.setBatchmode(batch_mode)
+
+    if report_path:
+        with open(report_path, 'a') as file:
+            file.write(json.dumps({"summary": True, "documents": len(paths), "plan_time": plan_time,
+                                   "total_time": time.perf_counter() - start_time}) + "\n")
+    return results
+
+
+def apply_plan(plan, preset):
+    # Main thread part of run_folder(): opens the document, applies the planned guides and saves it.
+    # preset is a GridSpec or a preset dict.
+    result = {}
+    start_time = time.perf_counter()
+    doc = Krita.instance().openDocument(plan["document"])
+    if doc is None:
+        raise IOError("Unable to open {0}".format(plan["document"]))
+    result["open_time"] = time.perf_counter() - start_time
+    try:
+        start_time = time.perf_counter()
+        if (doc.width(), doc.height(), doc.resolution()) == (plan["doc_size_x"], plan["doc_size_y"], round(plan["doc_ppi"])):
+            result.update(apply_guides(doc, plan["guides_x"], plan["guides_y"], preset))
+            store_grid(doc, preset, plan["guides_x"], plan["guides_y"])
+            if plan.get("border_svg"):
+                add_svg_layer(doc, plan["border_svg"], DEFAULT_BORDER_LAYER_NAME)
+            if plan.get("overlay_svg"):
+                add_svg_layer(doc, plan["overlay_svg"], DEFAULT_OVERLAY_LAYER_NAME)
+        else:
+            # The header did not match the actual document: lay it out again on the spot
+            result.update(apply_tile_grid(doc, preset)[1])
+        result["apply_time"] = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        if not doc.save():
+            raise IOError("Unable to save {0}".format(plan["document"]))
+        result["save_time"] = time.perf_counter() - start_time
+    finally:
+        doc.close()
+    return result
+
+
+def __main__(args):
+    # Entry point for kritarunner
+    run_jobs(args[0], args[1] if len(args) > 1 else None)
@@ -0,0 +1,103 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Panel borders: turns the tiles of a layout into bordered (optionally rounded) vector panels.
+# All the panels go into one SVG document, written by a streaming builder and cached per layout and style,
+# which is inserted into a new vector layer with a single addShapesFromSvg() call.
+# This module must not import krita nor PyQt5 (the document and layers are passed in).
+
+from collections import OrderedDict
+import io
+
+from .spec import DEFAULT_BORDER_COLOR, DEFAULT_BORDER_RADIUS, DEFAULT_BORDER_WIDTH, GridSpec, check_color
+
+
+DEFAULT_BORDER_LAYER_NAME = "Panel borders"
+
+
+def svg_stroke(color):
+    # stroke (and stroke-opacity) attributes of a #RRGGBB or #RRGGBBAA color, as SVG 1.1 colors have no alpha.
+    # Raises ValueError for any other color, which is never written into the SVG.
+    check_color(color)
+    if len(color) == 9:
+        return 'stroke="{0}" stroke-opacity="{1:.3f}"'.format(color[:7], int(color[7:], 16) / 255)
+    return 'stroke="{0}"'.format(color)
+
+
+def build_border_svg(layout, doc_ppi, width=DEFAULT_BORDER_WIDTH, radius=DEFAULT_BORDER_RADIUS, color=DEFAULT_BORDER_COLOR):
+    # One <rect> per tile in a single group carrying the common style. Coordinates are in pixels through the viewBox,
+    # the SVG size is in points as Krita expects. Borders are drawn inside the tiles (the stroke is inset by half its width).
+    doc_size_x = layout.doc_size_x
+    doc_size_y = layout.doc_size_y
+    points_per_pixel = 72.0 / doc_ppi
+    inset = width / 2
+
+    svg = io.StringIO()
+    svg.write('<svg xmlns="http://www.w3.org/2000/svg" width="{0:.3f}pt" height="{1:.3f}pt" viewBox="0 0 {2} {3}">'.format(
+        doc_size_x * points_per_pixel, doc_size_y * points_per_pixel, doc_size_x, doc_size_y))
+    svg.write('<g fill="none" {0} stroke-width="{1:.3f}" stroke-linejoin="{2}">'.format(svg_stroke(color), width, "round" if radius > 0 else "miter"))
+    if radius > 0:
+        rect = '<rect x="{0:.3f}" y="{1:.3f}" width="{2:.3f}" height="{3:.3f}" rx="{4:.3f}"/>'
+    else:
+        rect = '<rect x="{0:.3f}" y="{1:.3f}" width="{2:.3f}" height="{3:.3f}"/>'
+    write = svg.write
+    for x, y, w, h in layout.tile_rects():
+        if w > width and h > width:
+            write(rect.format(x + inset, y + inset, w - width, h - width, min(radius, (w - width) / 2, (h - width) / 2)))
+    svg.write('</g></svg>')
+    return svg.getvalue()
+
+
+class SvgCache:
+    # Generated SVGs keyed by what they were built from (least recently used first). Pages of a batch share their
+    # layout, so an SVG is only built once for all of them.
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_svg(self, key, build):
+        # build() is only called on a cache miss
+        svg = self.entries.get(key)
+        if svg is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return svg
+
+        self.misses += 1
+        svg = build()
+        self.entries[key] = svg
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return svg
+
+
+# Shared by the dialog, the scripting API and the batches
+svg_cache = SvgCache()
+
+
+def get_border_svg(layout, doc_ppi, width=DEFAULT_BORDER_WIDTH, radius=DEFAULT_BORDER_RADIUS, color=DEFAULT_BORDER_COLOR):
+    # Cached build_border_svg()
+    return svg_cache.get_svg(("borders", layout.key(), doc_ppi, width, radius, color),
+                             lambda: build_border_svg(layout, doc_ppi, width, radius, color))
+
+
+def border_style(preset):
+    # (enabled, width, radius, color) of the panel borders of a preset or GridSpec
+    grid_spec = GridSpec.from_preset(preset)
+    return grid_spec.panel_borders, grid_spec.border_width, grid_spec.border_radius, grid_spec.border_color
+
+
+def add_border_layer(doc, layout, width=DEFAULT_BORDER_WIDTH, radius=DEFAULT_BORDER_RADIUS, color=DEFAULT_BORDER_COLOR,
+                     name=DEFAULT_BORDER_LAYER_NAME):
+    # Adds a vector layer with the panel borders on top of the document. Returns the layer.
+    return add_svg_layer(doc, get_border_svg(layout, doc.resolution(), width, radius, color), name)
+
+
+def add_svg_layer(doc, svg, name):
+    # Adds a vector layer on top of the document with the shapes of a prebuilt SVG (e.g. from a batch plan)
+    layer = doc.createVectorLayer(name)
+    doc.rootNode().addChildNode(layer, None)
+    layer.addShapesFromSvg(svg)
+    return layer
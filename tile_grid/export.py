@@ -0,0 +1,63 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Tile export: cuts the merged image into the tiles of a layout and saves each tile as a PNG file.
+# The projection is read once as a single buffer; each tile is a view into it (no per-tile copy nor
+# per-tile pixelData call), and the PNG encoding runs on a thread pool with a bounded number of pending tiles.
+
+from PyQt5.QtGui import QImage
+try:
+    from PyQt5 import sip
+except ImportError:
+    import sip
+from concurrent.futures import ThreadPoolExecutor
+import os, threading, time
+
+from .occupancy import STATE_EMPTY, STATE_TRANSPARENT, occupancy_cache
+from .pixels import read_projection
+
+
+DEFAULT_TILE_NAME_FORMAT = "tile_{row:03d}_{col:03d}.png"
+
+
+def export_tiles(doc, layout, directory, name_format=DEFAULT_TILE_NAME_FORMAT, workers=None, max_pending=None, skip_empty=False):
+    # Saves each tile of the layout as a PNG file in directory. Returns (number_of_tiles, elapsed_time).
+    # When skip_empty is True, empty and fully transparent tiles are not saved.
+    start_time = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+
+    doc_size_x = doc.width()
+    doc_size_y = doc.height()
+    data = read_projection(doc)
+    stride = doc_size_x * 4
+    image = QImage(data, doc_size_x, doc_size_y, stride, QImage.Format_ARGB32)
+    base_address = int(image.constBits())
+
+    workers = workers or os.cpu_count() or 1
+    pending = threading.BoundedSemaphore(max_pending or 2 * workers)
+
+    def encode(tile, path):
+        try:
+            if not tile.save(path, "PNG"):
+                raise IOError("Unable to save {0}".format(path))
+        finally:
+            pending.release()
+
+    rects = layout.pixel_rects()
+    if skip_empty:
+        occupancy = occupancy_cache.get_occupancy(doc, layout, data)
+        rects = [rect for rect, tile in zip(rects, occupancy) if tile["state"] not in (STATE_EMPTY, STATE_TRANSPARENT)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for x, y, w, h, row, col in rects:
+            # Zero-copy view of the tile: points into the projection buffer and keeps the document row stride
+            tile = QImage(sip.voidptr(base_address + y * stride + x * 4), w, h, stride, QImage.Format_ARGB32)
+            path = os.path.join(directory, name_format.format(row=row, col=col, index=row * layout.num_tiles_x + col))
+            pending.acquire()
+            futures.append(executor.submit(encode, tile, path))
+        for future in futures:
+            future.result()
+
+    # The views must not outlive the buffer they point into
+    del image, data
+    return len(rects), time.perf_counter() - start_time
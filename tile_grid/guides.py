@@ -0,0 +1,171 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Array-backed guide generation. Uses NumPy when it is available, and falls back to array('d') otherwise.
+# This module must not import krita nor PyQt5.
+
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def generate_guides(margin, pad, gutter, num_tiles, tile_size):
+    # Returns the start and end edge of each tile, i.e. 2 * num_tiles positions, in one batch
+    start = margin + pad
+    step = tile_size + gutter
+
+    if np is not None:
+        tile_starts = start + np.arange(num_tiles, dtype=np.float64) * step
+        guides = np.empty(2 * num_tiles, dtype=np.float64)
+        guides[0::2] = tile_starts
+        guides[1::2] = tile_starts + tile_size
+        return guides
+
+    guides = array('d', bytes(16 * num_tiles))
+    guides[0::2] = array('d', [start + k * step for k in range(num_tiles)])
+    guides[1::2] = array('d', [start + k * step + tile_size for k in range(num_tiles)])
+    return guides
+
+
+def generate_guides_batch(axes):
+    # axes: sequence of (margin, pad, gutter, num_tiles, tile_size) tuples.
+    # Returns one guide array per axis, all computed in a single vectorized pass when NumPy is available.
+    if np is None or not axes:
+        return [generate_guides(*axis) for axis in axes]
+
+    params = np.array(axes, dtype=np.float64).reshape(-1, 5)
+    starts = params[:, 0] + params[:, 1]
+    steps = params[:, 4] + params[:, 2]
+    counts = params[:, 3].astype(np.int64)
+    tile_sizes = params[:, 4]
+
+    # Index of each tile within its own axis
+    offsets = np.cumsum(counts) - counts
+    tile_index = np.arange(counts.sum(), dtype=np.float64) - np.repeat(offsets, counts)
+
+    tile_starts = np.repeat(starts, counts) + tile_index * np.repeat(steps, counts)
+    guides = np.empty(2 * tile_starts.size, dtype=np.float64)
+    guides[0::2] = tile_starts
+    guides[1::2] = tile_starts + np.repeat(tile_sizes, counts)
+
+    return np.split(guides, 2 * np.cumsum(counts)[:-1])
+
+
+def to_list(guides):
+    # Krita expects plain lists of floats
+    return guides.tolist()
+
+
+# Guides closer than this (in pixels) are considered to be the same guide
+DEFAULT_MERGE_TOLERANCE = 0.01
+
+
+def merge_guides(existing, new, tolerance=DEFAULT_MERGE_TOLERANCE):
+    # Merges new guide positions into existing ones in O(n log n): both lists are sorted once, then
+    # runs of positions whose consecutive gaps are within tolerance collapse into a single guide.
+    # A collapsed run keeps its first existing guide if it has one, so user guides never move.
+    # Returns (merged_positions, report) where merged_positions is a sorted list and report counts
+    # the new guides 'added', the new guides 'merged' into another guide and the existing duplicates 'dropped'.
+    existing = to_list(existing) if hasattr(existing, "tolist") else list(existing)
+    new = to_list(new) if hasattr(new, "tolist") else list(new)
+    if np is not None:
+        return _merge_guides_numpy(existing, new, tolerance)
+
+    # Existing guides sort first at equal positions
+    tagged = sorted([(pos, 0) for pos in existing] + [(pos, 1) for pos in new])
+    merged = []
+    report = {"added": 0, "merged": 0, "dropped": 0}
+
+    def close_run(run):
+        num_existing = sum(1 for _, origin in run if origin == 0)
+        num_new = len(run) - num_existing
+        if num_existing:
+            merged.append(next(pos for pos, origin in run if origin == 0))
+            report["dropped"] += num_existing - 1
+            report["merged"] += num_new
+        else:
+            merged.append(run[0][0])
+            report["added"] += 1
+            report["merged"] += num_new - 1
+
+    run = []
+    for item in tagged:
+        if run and item[0] - run[-1][0] > tolerance:
+            close_run(run)
+            run = []
+        run.append(item)
+    if run:
+        close_run(run)
+
+    return merged, report
+
+
+def _merge_guides_numpy(existing, new, tolerance):
+    positions = np.array(existing + new, dtype=np.float64)
+    is_new = np.zeros(positions.size, dtype=bool)
+    is_new[len(existing):] = True
+    if positions.size == 0:
+        return [], {"added": 0, "merged": 0, "dropped": 0}
+
+    order = np.lexsort((is_new, positions))
+    positions = positions[order]
+    is_new = is_new[order]
+
+    # One run id per group of positions chained within tolerance
+    run_starts = np.concatenate(([True], np.diff(positions) > tolerance))
+    run_ids = np.cumsum(run_starts) - 1
+    num_runs = run_ids[-1] + 1
+    num_existing = np.bincount(run_ids, weights=~is_new, minlength=num_runs).astype(np.int64)
+    num_new = np.bincount(run_ids, weights=is_new, minlength=num_runs).astype(np.int64)
+
+    # Keep the first existing guide of each run, or the first new guide if the run has no existing guide
+    index = np.arange(positions.size)
+    first_existing = np.full(num_runs, positions.size, dtype=np.int64)
+    np.minimum.at(first_existing, run_ids[~is_new], index[~is_new])
+    first_any = np.flatnonzero(run_starts)
+    kept = np.where(num_existing > 0, first_existing, first_any)
+
+    has_existing = num_existing > 0
+    report = {
+        "added": int(np.count_nonzero(~has_existing)),
+        "merged": int(num_new[has_existing].sum() + (num_new[~has_existing] - 1).sum()),
+        "dropped": int((num_existing[has_existing] - 1).sum())
+    }
+    return positions[kept].tolist(), report
+
+
+def remove_guides(guides, removed, tolerance=DEFAULT_MERGE_TOLERANCE):
+    # Returns the sorted guides that do not match any of the removed positions (within tolerance), in O(n log n)
+    guides = sorted(to_list(guides) if hasattr(guides, "tolist") else guides)
+    removed = sorted(to_list(removed) if hasattr(removed, "tolist") else removed)
+    kept = []
+    k = 0
+    for pos in guides:
+        while k < len(removed) and removed[k] < pos - tolerance:
+            k += 1
+        if k < len(removed) and removed[k] <= pos + tolerance:
+            continue
+        kept.append(pos)
+    return kept
+
+
+def generate_guides_from_starts(starts, tile_size):
+    # Same as generate_guides() for tiles whose start positions are given explicitly (e.g. pixel-aligned layouts).
+    # tile_size is either shared by all tiles or a sequence with one size per tile (e.g. track layouts).
+    if np is not None:
+        tile_starts = np.asarray(starts, dtype=np.float64)
+        guides = np.empty(2 * tile_starts.size, dtype=np.float64)
+        guides[0::2] = tile_starts
+        guides[1::2] = tile_starts + np.asarray(tile_size, dtype=np.float64)
+        return guides
+
+    guides = array('d', bytes(16 * len(starts)))
+    guides[0::2] = array('d', starts)
+    if isinstance(tile_size, (int, float)):
+        guides[1::2] = array('d', [start + tile_size for start in starts])
+    else:
+        guides[1::2] = array('d', [start + size for start, size in zip(starts, tile_size)])
+    return guides
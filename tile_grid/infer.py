@@ -0,0 +1,171 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Reverse solver: infers the grid parameters (margins, gutters, number of tiles and ratio) back from existing guides.
+# Guides are sorted once, the tile and gutter sizes are guessed from a histogram of the gaps between consecutive
+# guides, and each guess is checked by walking the guides with binary searches, so the whole solve is O(n log n).
+# Guides that do not belong to the grid (e.g. placed by hand) are ignored.
+# This module must not import krita nor PyQt5.
+
+from bisect import bisect_left
+from collections import Counter
+
+from .layout import compute_layout
+from .spec import GRID_RECT
+
+
+DEFAULT_INFER_TOLERANCE = 1.0
+
+
+def infer_grid(guides_x, guides_y, doc_size_x, doc_size_y, tolerance=DEFAULT_INFER_TOLERANCE):
+    # Returns a layout spec in pixels (see layout.SPEC_KEYS), or None if no grid is found on either axis
+    axis_x = infer_axis(guides_x, tolerance)
+    axis_y = infer_axis(guides_y, tolerance)
+    if axis_x is None or axis_y is None:
+        return None
+
+    start_x, end_x, tile_size_x, gutter_x, num_tiles_x = axis_x
+    start_y, end_y, tile_size_y, gutter_y, num_tiles_y = axis_y
+    return {
+        "margin_l": start_x,
+        "margin_r": doc_size_x - end_x,
+        "margin_t": start_y,
+        "margin_b": doc_size_y - end_y,
+        "gutter_x": gutter_x,
+        "gutter_y": gutter_y,
+        "num_tiles_x": num_tiles_x,
+        "num_tiles_y": num_tiles_y,
+        "tile_ratio": tile_size_x / tile_size_y
+    }
+
+
+def infer_verified_grid(guides_x, guides_y, doc_size_x, doc_size_y, tolerance=DEFAULT_INFER_TOLERANCE):
+    # infer_grid(), keeping the result only if every guide of the grid laid out again falls on a guide of the document
+    # (within tolerance). Other guides of the document, e.g. placed by hand, are let through.
+    # The spec found is a uniform rectangular grid, and says so (no tracks nor subgrids). Returns None otherwise.
+    spec = infer_grid(guides_x, guides_y, doc_size_x, doc_size_y, tolerance)
+    if spec is None:
+        return None
+    spec.update(tracks_x="", tracks_y="", subgrids=[], grid_type=GRID_RECT)
+    try:
+        layout = compute_layout(spec, doc_size_x, doc_size_y)
+    except (ValueError, ZeroDivisionError):
+        return None
+    for guides, new_guides in ((guides_x, layout.guides_x()), (guides_y, layout.guides_y())):
+        positions = _sorted_unique(guides, tolerance)
+        if any(_nearest(positions, pos, tolerance) is None for pos in new_guides):
+            return None
+    return spec
+
+
+def infer_axis(guides, tolerance=DEFAULT_INFER_TOLERANCE):
+    # Returns (start, end, tile_size, gutter, num_tiles) for the best tile sequence found in guides, or None
+    positions = _sorted_unique(guides, tolerance)
+    if len(positions) < 2:
+        return None
+
+    best_chain, best_gutter_size = None, 0
+    for tile_size, gutter_size in _candidate_periods(positions, tolerance):
+        chain = _longest_chain(positions, tile_size, gutter_size, tolerance)
+        if best_chain is None or len(chain) > len(best_chain):
+            best_chain, best_gutter_size = chain, gutter_size
+    if best_chain is None or len(best_chain) < 2:
+        return None
+
+    return _fit_chain([positions[i] for i in best_chain], best_gutter_size > 0)
+
+
+def _sorted_unique(guides, tolerance):
+    positions = []
+    for pos in sorted(guides):
+        if not positions or pos - positions[-1] > tolerance:
+            positions.append(pos)
+    return positions
+
+
+def _candidate_periods(positions, tolerance):
+    # Histogram of the gaps between consecutive guides. Neighbouring bins are summed so that a gap lying on a
+    # bin boundary still counts in full. The most frequent gaps are the tile and gutter size candidates.
+    bin_size = max(tolerance, 1e-6)
+    gaps = [b - a for a, b in zip(positions, positions[1:])]
+    bins = Counter(int(round(gap / bin_size)) for gap in gaps)
+    scores = {key: bins[key - 1] + bins[key] + bins[key + 1] for key in bins}
+
+    top = []
+    for key in sorted(scores, key=lambda key: (-scores[key], -bins[key], key)):
+        if all(abs(key - other) > 1 for other in top):
+            top.append(key)
+        if len(top) == 3:
+            break
+
+    # Mean gap of each candidate bin (more accurate than the bin center)
+    sizes = []
+    for key in top:
+        members = [gap for gap in gaps if abs(gap / bin_size - key) <= 1.5]
+        sizes.append(sum(members) / len(members))
+
+    candidates = []
+    for tile_size in sizes:
+        candidates.append((tile_size, 0))
+        for gutter_size in sizes:
+            if gutter_size != tile_size:
+                candidates.append((tile_size, gutter_size))
+    return candidates
+
+
+def _nearest(positions, target, tolerance):
+    index = bisect_left(positions, target - tolerance)
+    if index < len(positions) and positions[index] <= target + tolerance:
+        # Several positions may be within tolerance: take the closest one
+        best = index
+        while index + 1 < len(positions) and positions[index + 1] <= target + tolerance:
+            index += 1
+            if abs(positions[index] - target) < abs(positions[best] - target):
+                best = index
+        return best
+    return None
+
+
+def _longest_chain(positions, tile_size, gutter_size, tolerance):
+    # Longest run of guides alternating tile and gutter gaps (or tile gaps only when gutter_size is 0),
+    # starting on a tile start and ending on a tile end. Returns the guide indices.
+    visited = [False] * len(positions)
+    best = []
+    for start in range(len(positions)):
+        if visited[start]:
+            continue
+        chain = [start]
+        while True:
+            step = tile_size if gutter_size == 0 or len(chain) % 2 == 1 else gutter_size
+            index = _nearest(positions, positions[chain[-1]] + step, tolerance)
+            if index is None or index <= chain[-1]:
+                break
+            chain.append(index)
+        for index in chain:
+            visited[index] = True
+        # With gutters, the chain must stop on a tile end (even number of guides)
+        if gutter_size > 0 and len(chain) % 2 == 1:
+            chain.pop()
+        if len(chain) > len(best):
+            best = chain
+    return best
+
+
+def _fit_chain(chain, has_gutters):
+    # Least squares fit of the tile starts against their index, to average out rounding errors
+    if has_gutters:
+        starts = chain[0::2]
+        ends = chain[1::2]
+    else:
+        starts = chain[:-1]
+        ends = chain[1:]
+    num_tiles = len(starts)
+    tile_size = sum(end - start for start, end in zip(starts, ends)) / num_tiles
+    if has_gutters and num_tiles > 1:
+        mean_k = (num_tiles - 1) / 2
+        mean_start = sum(starts) / num_tiles
+        period = sum((k - mean_k) * (start - mean_start) for k, start in enumerate(starts)) / sum((k - mean_k) ** 2 for k in range(num_tiles))
+        gutter_size = max(0, period - tile_size)
+    else:
+        gutter_size = 0
+    return chain[0], chain[-1], tile_size, gutter_size, num_tiles
@@ -0,0 +1,311 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Headless layout engine: computes tile sizes, gutters, paddings and guide positions from a grid spec and a document size.
+# This module must not import krita nor PyQt5 so that it can run in a plain Python worker.
+
+import math
+
+from .guides import generate_guides, generate_guides_batch, generate_guides_from_starts
+from .spec import GRID_RECT, UNIT_LABELS, GridSpec
+from .tracks import parse_tracks, solve_tracks, track_starts
+
+
+# Keys of a layout spec. All sizes are expressed in pixels.
+SPEC_KEYS = (
+    "margin_l", "margin_r", "margin_t", "margin_b",
+    "gutter_x", "gutter_y",
+    "num_tiles_x", "num_tiles_y",
+    "tile_ratio"
+)
+# Optional spec keys:
+# "pixel_aligned": when True, tiles, gutters and paddings are whole numbers of pixels (see PixelTileLayout)
+# "tracks_x", "tracks_y": non-uniform columns and rows, as track strings (see tracks.py). When set, they override
+#                         num_tiles_x/num_tiles_y and the tile ratio (see TrackTileLayout)
+# "subgrids", "doc_ppi", "max_depth": grids nested in the cells of this one, and how deep to expand them (see nested.py)
+# "grid_type": "rect" (default), or a hex or isometric grid drawn as a vector overlay (see overlays.py)
+
+
+class TileLayout:
+    # Result of compute_layout(): everything needed to place guides or to cut the document into tiles (in pixels)
+    def __init__(self, doc_size_x, doc_size_y, margin_l, margin_r, margin_t, margin_b, num_tiles_x, num_tiles_y,
+                 tile_size_x, tile_size_y, gutter_x, gutter_y, pad_l, pad_t):
+        self.doc_size_x = doc_size_x
+        self.doc_size_y = doc_size_y
+        self.margin_l = margin_l
+        self.margin_r = margin_r
+        self.margin_t = margin_t
+        self.margin_b = margin_b
+        self.num_tiles_x = num_tiles_x
+        self.num_tiles_y = num_tiles_y
+        self.tile_size_x = tile_size_x
+        self.tile_size_y = tile_size_y
+        self.gutter_x = gutter_x
+        self.gutter_y = gutter_y
+        self.pad_l = pad_l
+        self.pad_t = pad_t
+
+    def key(self):
+        # Hashable value identifying the computed geometry, for caches
+        return (self.doc_size_x, self.doc_size_y, self.margin_l, self.margin_r, self.margin_t, self.margin_b,
+                self.num_tiles_x, self.num_tiles_y, self.tile_size_x, self.tile_size_y,
+                self.gutter_x, self.gutter_y, self.pad_l, self.pad_t)
+
+    def __eq__(self, other):
+        return isinstance(other, TileLayout) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def axis_x(self):
+        return (self.margin_l, self.pad_l, self.gutter_x, self.num_tiles_x, self.tile_size_x)
+
+    def axis_y(self):
+        return (self.margin_t, self.pad_t, self.gutter_y, self.num_tiles_y, self.tile_size_y)
+
+    # Guide arrays (NumPy arrays or array('d')) enclosing each tile
+    def guides_x(self):
+        return generate_guides(*self.axis_x())
+
+    def guides_y(self):
+        return generate_guides(*self.axis_y())
+
+    def tile_rects(self):
+        # List of (x, y, width, height) tuples, row by row
+        start_x = self.margin_l + self.pad_l
+        start_y = self.margin_t + self.pad_t
+        step_x = self.tile_size_x + self.gutter_x
+        step_y = self.tile_size_y + self.gutter_y
+        return [(start_x + col * step_x, start_y + row * step_y, self.tile_size_x, self.tile_size_y)
+                for row in range(self.num_tiles_y)
+                for col in range(self.num_tiles_x)]
+
+    def pixel_rects(self):
+        # Integer version of tile_rects(): (x, y, width, height, row, col) tuples clamped to the document.
+        # Edges are rounded (rather than sizes), so that adjacent tiles never overlap nor leave a gap.
+        rects = []
+        for index, (x, y, w, h) in enumerate(self.tile_rects()):
+            x0 = max(0, int(round(x)))
+            y0 = max(0, int(round(y)))
+            x1 = min(int(self.doc_size_x), int(round(x + w)))
+            y1 = min(int(self.doc_size_y), int(round(y + h)))
+            if x1 > x0 and y1 > y0:
+                rects.append((x0, y0, x1 - x0, y1 - y0, index // self.num_tiles_x, index % self.num_tiles_x))
+        return rects
+
+
+def evaluate_max_tile_size(spec, doc_size_x, doc_size_y):
+    # Largest tile size that fits the document once margins and minimum gutters are taken out
+    tile_size_x = evaluate_max_tile_size_axis(doc_size_x, spec["margin_l"], spec["margin_r"], spec["gutter_x"], spec["num_tiles_x"])
+    tile_size_y = evaluate_max_tile_size_axis(doc_size_y, spec["margin_t"], spec["margin_b"], spec["gutter_y"], spec["num_tiles_y"])
+    return tile_size_x, tile_size_y
+
+
+def evaluate_max_tile_size_axis(doc_size, margin_start, margin_end, gutter, num_tiles):
+    num_tiles = int(num_tiles)
+    return (doc_size - margin_start - margin_end - (num_tiles - 1) * gutter) / num_tiles
+
+
+def compute_layout(spec, doc_size_x, doc_size_y):
+    if spec.get("grid_type", GRID_RECT) != GRID_RECT:
+        # Imported here because overlays builds on this module
+        from .overlays import compute_cell_grid
+        return compute_cell_grid(spec, doc_size_x, doc_size_y)
+    if spec.get("subgrids"):
+        # Imported here because nested builds on this module
+        from .nested import compute_nested_layout
+        return compute_nested_layout(spec, doc_size_x, doc_size_y)
+    if spec.get("tracks_x") or spec.get("tracks_y"):
+        return compute_track_layout(spec, doc_size_x, doc_size_y)
+
+    margin_l = spec["margin_l"]
+    margin_r = spec["margin_r"]
+    margin_t = spec["margin_t"]
+    margin_b = spec["margin_b"]
+    min_gutter_x = spec["gutter_x"]
+    min_gutter_y = spec["gutter_y"]
+    num_tiles_x = int(spec["num_tiles_x"])
+    num_tiles_y = int(spec["num_tiles_y"])
+    tile_ratio = spec["tile_ratio"]
+
+    # Calculate the maximum tile size that fits the document
+    max_tile_size_x, max_tile_size_y = evaluate_max_tile_size(spec, doc_size_x, doc_size_y)
+
+    # Calculate the tile height based on the tile ratio
+    tile_size_y = max_tile_size_x / tile_ratio
+    gutter_x, gutter_y, pad_l, pad_t = min_gutter_x, min_gutter_y, 0, 0
+
+    # If the tiles height is too big, we need to adjust the tile size (and the gutter size) so that the tiles height is limited to max_tile_size_y.
+    # The leftover space of the shrunk axis goes into its gutters, or into a centering padding if there is only one tile on that axis.
+    if tile_size_y <= max_tile_size_y:
+        tile_size_x = max_tile_size_x
+        gutter_y, pad_t = distribute_leftover(doc_size_y - margin_t - margin_b, num_tiles_y, tile_size_y)
+    else:
+        tile_size_x = max_tile_size_y * tile_ratio
+        tile_size_y = max_tile_size_y
+        gutter_x, pad_l = distribute_leftover(doc_size_x - margin_l - margin_r, num_tiles_x, tile_size_x)
+
+    layout = TileLayout(doc_size_x, doc_size_y, margin_l, margin_r, margin_t, margin_b, num_tiles_x, num_tiles_y,
+                        tile_size_x, tile_size_y, gutter_x, gutter_y, pad_l, pad_t)
+    if spec.get("pixel_aligned"):
+        return align_layout(layout)
+    return layout
+
+
+class PixelTileLayout(TileLayout):
+    # Layout whose tile edges all fall on whole pixels. All tiles have the same integer size; the leftover pixels of
+    # each axis are spread over its gutters (Bresenham style, so gutters differ by at most one pixel), or used as a
+    # centering padding when the axis has no gutter. Tile starts are stored explicitly per axis.
+    def __init__(self, doc_size_x, doc_size_y, margin_l, margin_r, margin_t, margin_b, num_tiles_x, num_tiles_y,
+                 tile_size_x, tile_size_y, gutter_x, gutter_y, pad_l, pad_t, starts_x, starts_y):
+        super().__init__(doc_size_x, doc_size_y, margin_l, margin_r, margin_t, margin_b, num_tiles_x, num_tiles_y,
+                         tile_size_x, tile_size_y, gutter_x, gutter_y, pad_l, pad_t)
+        self.starts_x = starts_x
+        self.starts_y = starts_y
+
+    def key(self):
+        return super().key() + (True,)
+
+    def guides_x(self):
+        return generate_guides_from_starts(self.starts_x, self.tile_size_x)
+
+    def guides_y(self):
+        return generate_guides_from_starts(self.starts_y, self.tile_size_y)
+
+    def tile_rects(self):
+        return [(x, y, self.tile_size_x, self.tile_size_y) for y in self.starts_y for x in self.starts_x]
+
+    def pixel_rects(self):
+        return [(x, y, self.tile_size_x, self.tile_size_y, row, col)
+                for row, y in enumerate(self.starts_y)
+                for col, x in enumerate(self.starts_x)]
+
+
+def align_layout(layout):
+    # Integer version of a layout: margins are rounded, tile sizes are rounded down, and the leftover pixels are redistributed
+    start_x = int(round(layout.margin_l))
+    end_x = int(layout.doc_size_x) - int(round(layout.margin_r))
+    start_y = int(round(layout.margin_t))
+    end_y = int(layout.doc_size_y) - int(round(layout.margin_b))
+
+    tile_size_x, starts_x, gutter_x, pad_l = align_axis(start_x, end_x, layout.num_tiles_x, layout.tile_size_x, layout.gutter_x > 0)
+    tile_size_y, starts_y, gutter_y, pad_t = align_axis(start_y, end_y, layout.num_tiles_y, layout.tile_size_y, layout.gutter_y > 0)
+
+    return PixelTileLayout(layout.doc_size_x, layout.doc_size_y, start_x, int(layout.doc_size_x) - end_x, start_y, int(layout.doc_size_y) - end_y,
+                           layout.num_tiles_x, layout.num_tiles_y, tile_size_x, tile_size_y, gutter_x, gutter_y, pad_l, pad_t,
+                           starts_x, starts_y)
+
+
+def align_axis(start, end, num_tiles, tile_size, has_gutters):
+    # Returns (tile_size, tile_starts, mean_gutter, pad) with integer sizes and positions
+    tile_size = max(1, min(int(math.floor(tile_size + 1e-9)), (end - start) // num_tiles))
+    leftover = end - start - num_tiles * tile_size
+    if num_tiles > 1 and has_gutters:
+        # Gutter k gets floor((k + 1) * leftover / n) - floor(k * leftover / n) pixels, with n the number of gutters
+        num_gutters = num_tiles - 1
+        starts = [start + k * tile_size + (k * leftover) // num_gutters for k in range(num_tiles)]
+        return tile_size, starts, leftover / num_gutters, 0
+    pad = leftover // 2
+    starts = [start + pad + k * tile_size for k in range(num_tiles)]
+    return tile_size, starts, 0, pad
+
+
+class TrackTileLayout(TileLayout):
+    # Layout whose columns and rows may all have different sizes (see compute_track_layout()).
+    # Tile starts and sizes are stored explicitly per axis; tile_size_x/tile_size_y hold the smallest tile.
+    def __init__(self, doc_size_x, doc_size_y, margin_l, margin_r, margin_t, margin_b, gutter_x, gutter_y, pad_l, pad_t,
+                 starts_x, sizes_x, starts_y, sizes_y):
+        super().__init__(doc_size_x, doc_size_y, margin_l, margin_r, margin_t, margin_b, len(sizes_x), len(sizes_y),
+                         min(sizes_x), min(sizes_y), gutter_x, gutter_y, pad_l, pad_t)
+        self.starts_x = starts_x
+        self.sizes_x = sizes_x
+        self.starts_y = starts_y
+        self.sizes_y = sizes_y
+
+    def key(self):
+        return super().key() + (tuple(self.starts_x), tuple(self.sizes_x), tuple(self.starts_y), tuple(self.sizes_y))
+
+    def guides_x(self):
+        return generate_guides_from_starts(self.starts_x, self.sizes_x)
+
+    def guides_y(self):
+        return generate_guides_from_starts(self.starts_y, self.sizes_y)
+
+    def tile_rects(self):
+        return [(x, y, w, h)
+                for y, h in zip(self.starts_y, self.sizes_y)
+                for x, w in zip(self.starts_x, self.sizes_x)]
+
+
+def compute_track_layout(spec, doc_size_x, doc_size_y):
+    # Tracks share the space left by the margins and the gutters (see tracks.solve_tracks()). An axis without tracks
+    # gets num_tiles equal tracks, i.e. tiles fill it. Tracks whose maximum sizes leave space unused are centered.
+    # Raises ValueError if the fixed sizes and minimum sizes do not fit.
+    margin_l = spec["margin_l"]
+    margin_r = spec["margin_r"]
+    margin_t = spec["margin_t"]
+    margin_b = spec["margin_b"]
+    gutter_x = spec["gutter_x"]
+    gutter_y = spec["gutter_y"]
+    pixel_aligned = spec.get("pixel_aligned")
+
+    def axis(tracks, num_tiles, start, end, gutter):
+        tracks = parse_tracks(tracks) or [(1.0, 0.0, math.inf)] * int(num_tiles)
+        sizes = solve_tracks(end - start, tracks, gutter)
+        leftover = end - start - sum(sizes) - (len(sizes) - 1) * gutter
+        if leftover < -1e-6:
+            raise ValueError("The tracks do not fit: {0:g} pixels missing".format(-leftover))
+        pad = max(0.0, leftover) / 2
+        starts = track_starts(start + pad, sizes, gutter)
+        if pixel_aligned:
+            # Edges are rounded (rather than sizes), so that gaps stay consistent
+            pad = int(round(pad))
+            ends = [int(round(pos + size)) for pos, size in zip(starts, sizes)]
+            starts = [int(round(pos)) for pos in starts]
+            sizes = [max(1, stop - pos) for pos, stop in zip(starts, ends)]
+        return starts, sizes, pad
+
+    if pixel_aligned:
+        margin_l, margin_r = int(round(margin_l)), int(round(margin_r))
+        margin_t, margin_b = int(round(margin_t)), int(round(margin_b))
+    starts_x, sizes_x, pad_l = axis(spec.get("tracks_x"), spec["num_tiles_x"], margin_l, doc_size_x - margin_r, gutter_x)
+    starts_y, sizes_y, pad_t = axis(spec.get("tracks_y"), spec["num_tiles_y"], margin_t, doc_size_y - margin_b, gutter_y)
+    return TrackTileLayout(doc_size_x, doc_size_y, margin_l, margin_r, margin_t, margin_b, gutter_x, gutter_y, pad_l, pad_t,
+                           starts_x, sizes_x, starts_y, sizes_y)
+
+
+def distribute_leftover(available_size, num_tiles, tile_size):
+    # Returns (gutter, pad) for an axis whose tiles are smaller than the available space
+    if num_tiles > 1: # If there is more than one tile, the leftover goes into the gutters
+        return (available_size - num_tiles * tile_size) / (num_tiles - 1), 0
+    else: # If there is only one tile, we need to calculate the padding size
+        return 0, (available_size - tile_size) / 2
+
+
+def compute_guides_batch(specs, doc_sizes):
+    # Computes the guides of many grid specs at once.
+    # doc_sizes is either a single (doc_size_x, doc_size_y) pair shared by all specs, or one pair per spec.
+    # Returns a list of (guides_x, guides_y) arrays, one per spec.
+    if len(doc_sizes) == 2 and not isinstance(doc_sizes[0], (tuple, list)):
+        doc_sizes = [doc_sizes] * len(specs)
+    layouts = [compute_layout(spec, doc_size_x, doc_size_y) for spec, (doc_size_x, doc_size_y) in zip(specs, doc_sizes)]
+
+    # Uniform layouts are generated in one batch; the others (pixel-aligned, track and nested layouts) generate their own guides
+    def explicit(layout):
+        return type(layout).guides_x is not TileLayout.guides_x
+
+    uniform_layouts = [layout for layout in layouts if not explicit(layout)]
+    axes = []
+    for layout in uniform_layouts:
+        axes.append(layout.axis_x())
+        axes.append(layout.axis_y())
+    guides = iter(generate_guides_batch(axes))
+
+    return [(layout.guides_x(), layout.guides_y()) if explicit(layout) else (next(guides), next(guides))
+            for layout in layouts]
+
+
+def resolve_preset(preset, doc_size_x, doc_size_y, doc_ppi, unit_labels=UNIT_LABELS):
+    # Converts a preset (or a GridSpec) into a layout spec in pixels. unit_labels maps the unit labels found in
+    # version 1 presets to unit keys. Raises ValueError if the preset is invalid (see GridSpec.from_preset).
+    return GridSpec.from_preset(preset, unit_labels).resolve(doc_size_x, doc_size_y, doc_ppi)
@@ -0,0 +1,249 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Named preset library: one JSON file per preset in a directory, listed by a single index file (name -> file and
+# content hash), so that the names are known without reading every preset. Parsed presets are kept in a small LRU
+# cache. Writes are atomic (temporary file then rename), skipped when the content hash did not change, and done in
+# order by a background thread so that the dialog never waits for the disk.
+# The directory can be shared (e.g. by a studio) by pointing TILE_GRID_PRESET_LIBRARY at it.
+# This module must not import krita nor PyQt5.
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib, json, logging, os, re, tempfile
+
+from .spec import GridSpec
+
+
+INDEX_FILENAME = "index.json"
+INDEX_VERSION = 1
+DEFAULT_LIBRARY_DIRECTORY = os.environ.get("TILE_GRID_PRESET_LIBRARY") or os.path.join(os.path.expanduser("~"), "krita_tile_grid_presets")
+
+logger = logging.getLogger(__name__)
+
+
+def dump_json(data):
+    # Canonical serialization, so that equal data gives equal content hashes
+    return json.dumps(data, sort_keys=True, indent=1)
+
+
+def content_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def write_atomic(path, text):
+    # Readers see either the old or the new file, never a partial write
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as file:
+            file.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class BackgroundWriter:
+    # Writes and removes files in order on a single worker thread, started on first use.
+    # Remembers the hash of the last content of each path to skip writing the same content again; a write superseded
+    # by a newer one to the same path before it started (e.g. the index during a burst of saves) is dropped.
+    def __init__(self):
+        self.executor = None
+        self.hashes = {}
+        self.pending = []
+        self.written = 0
+        self.skipped = 0
+        self.errors = []
+
+    def remember(self, path, text):
+        # Content known to be on disk (e.g. just read)
+        self.hashes[path] = content_hash(text)
+
+    def write(self, path, text):
+        # Returns False if the path already holds this content
+        digest = content_hash(text)
+        if self.hashes.get(path) == digest:
+            self.skipped += 1
+            return False
+        self.hashes[path] = digest
+        self.submit(self._write, path, text, digest)
+        return True
+
+    def remove(self, path):
+        self.hashes.pop(path, None)
+        self.submit(self._remove, path)
+
+    def submit(self, task, *args):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = [future for future in self.pending if not future.done()]
+        self.pending.append(self.executor.submit(task, *args))
+
+    def busy(self):
+        return any(not future.done() for future in self.pending)
+
+    def flush(self):
+        # Waits for the pending writes. Raises the first error of the flushed writes.
+        pending, self.pending = self.pending, []
+        for future in pending:
+            future.result()
+
+    def _write(self, path, text, digest):
+        if self.hashes.get(path) != digest:
+            self.skipped += 1
+            return
+        try:
+            write_atomic(path, text)
+        except OSError as error:
+            # Write it again next time
+            if self.hashes.get(path) == digest:
+                del self.hashes[path]
+            self.errors.append((path, error))
+            raise
+        self.written += 1
+
+    def _remove(self, path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+# Shared by the dialog (last preset) and the preset libraries
+background_writer = BackgroundWriter()
+
+
+class PresetLibrary:
+    def __init__(self, directory=DEFAULT_LIBRARY_DIRECTORY, max_entries=32, writer=background_writer):
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_FILENAME)
+        self.writer = writer
+        self.max_entries = max_entries
+        self.entries = {}             # Name -> {"file": file name, "hash": content hash}
+        self.index_mtime = None
+        self.cache = OrderedDict()    # (name, hash) -> GridSpec, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.reload()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def names(self):
+        return sorted(self.entries, key=lambda name: (name.lower(), name))
+
+    def reload(self):
+        # Re-reads the index if it changed on disk (e.g. saved from another computer sharing the library).
+        # Skipped while our own writes are pending, as the index on disk is older than the one in memory.
+        if self.writer.busy():
+            return
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self.index_mtime:
+            return
+        try:
+            with open(self.index_path, 'r') as file:
+                index = json.load(file)
+            entries = index["presets"]
+            if not all(isinstance(entry, dict) and "file" in entry and "hash" in entry for entry in entries.values()):
+                raise ValueError("invalid preset entry")
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as error:
+            # e.g. truncated by a crash on a file system without atomic renames: the presets themselves are still there
+            logger.warning("Unreadable preset library index %s (%s), rebuilding it from the preset files", self.index_path, error)
+            self.rebuild_index()
+            self.index_mtime = mtime
+            return
+        self.entries = dict(entries)
+        self.index_mtime = mtime
+        self.writer.remember(self.index_path, self.index_text())
+
+    def rebuild_index(self):
+        # Lists every preset file of the directory, named after its file, and writes the index again
+        entries = {}
+        for file_name in sorted(os.listdir(self.directory)):
+            if not file_name.endswith(".json") or file_name == INDEX_FILENAME or file_name.startswith("."):
+                continue
+            try:
+                with open(os.path.join(self.directory, file_name), 'r') as file:
+                    text = file.read()
+                if not isinstance(json.loads(text), dict):
+                    raise ValueError("not a preset")
+            except (OSError, ValueError) as error:
+                logger.warning("Skipping preset file %s (%s)", file_name, error)
+                continue
+            entries[os.path.splitext(file_name)[0]] = {"file": file_name, "hash": content_hash(text)}
+        self.entries = entries
+        self.writer.write(self.index_path, self.index_text())
+
+    def load(self, name):
+        # GridSpec of a preset. Raises KeyError for unknown names and ValueError for invalid presets.
+        entry = self.entries[name]
+        key = (name, entry["hash"])
+        grid_spec = self.cache.get(key)
+        if grid_spec is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return grid_spec
+
+        self.misses += 1
+        with open(os.path.join(self.directory, entry["file"]), 'r') as file:
+            grid_spec = GridSpec.from_preset(json.load(file))
+        self.cache_spec(key, grid_spec)
+        return grid_spec
+
+    def save(self, name, preset):
+        # Adds or replaces a preset (dict or GridSpec). Returns False if the library already holds the same content.
+        grid_spec = GridSpec.from_preset(preset)
+        text = dump_json(grid_spec.to_preset())
+        digest = content_hash(text)
+        entry = self.entries.get(name)
+        if entry is not None and entry["hash"] == digest:
+            return False
+
+        file_name = entry["file"] if entry is not None else self.new_file_name(name)
+        self.entries[name] = {"file": file_name, "hash": digest}
+        self.cache_spec((name, digest), grid_spec)
+        self.writer.write(os.path.join(self.directory, file_name), text)
+        self.writer.write(self.index_path, self.index_text())
+        return True
+
+    def import_file(self, path, name=None):
+        # Adds a preset file to the library, named after the file by default. Returns the name.
+        with open(path, 'r') as file:
+            preset = json.load(file)
+        name = name or os.path.splitext(os.path.basename(path))[0]
+        self.save(name, preset)
+        return name
+
+    def delete(self, name):
+        entry = self.entries.pop(name)
+        self.writer.write(self.index_path, self.index_text())
+        self.writer.remove(os.path.join(self.directory, entry["file"]))
+
+    def index_text(self):
+        return dump_json({"version": INDEX_VERSION, "presets": self.entries})
+
+    def new_file_name(self, name):
+        # File name derived from the preset name, unique in the library
+        stem = re.sub(r"[^\w-]+", "_", name).strip("_") or "preset"
+        used = {entry["file"] for entry in self.entries.values()}
+        file_name = stem + ".json"
+        count = 1
+        while file_name in used or file_name == INDEX_FILENAME:
+            count += 1
+            file_name = "{0}_{1}.json".format(stem, count)
+        return file_name
+
+    def cache_spec(self, key, grid_spec):
+        self.cache[key] = grid_spec
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
@@ -0,0 +1,180 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Nested grids: any cell of a grid may hold its own grid (e.g. panels split into sub-panels, or meta-tiles).
+# The tree is stored in flat arrays and only expanded into layouts, guides and rectangles down to the depth being shown.
+# This module must not import krita nor PyQt5.
+
+from array import array
+from bisect import bisect_left
+import json
+
+from .guides import DEFAULT_MERGE_TOLERANCE, merge_guides, to_list
+from .layout import TileLayout, compute_layout
+from .spec import GridSpec, get_unit_labels
+
+
+# Cells are identified by row * CELL_STRIDE + col
+CELL_STRIDE = 1 << 20
+
+DEFAULT_PPI = 72.0
+
+
+class TileTree:
+    # Node 0 is the root grid; every other node is a grid filling one cell of its parent grid.
+    # subgrids: list of {"parent": node, "row": row, "col": col, "preset": preset} where node 0 is the root
+    # and node k + 1 is subgrids[k] (so a parent is always listed before its children). The presets have the same
+    # schema as the top-level presets, percentages being relative to the cell.
+    #
+    # Nodes are renumbered breadth first, so that the children of a node form a contiguous range
+    # [child_start[node], child_start[node + 1]) sorted by cell, searched with bisect. Identical presets are shared,
+    # and parsed once into GridSpecs.
+    def __init__(self, subgrids=()):
+        self.presets = []
+        preset_ids = {}
+        children = [[] for _ in range(len(subgrids) + 1)]
+        node_cells = [0]
+        node_specs = [-1]
+        for index, subgrid in enumerate(subgrids):
+            node = index + 1
+            parent = int(subgrid.get("parent", 0))
+            row = int(subgrid.get("row", 0))
+            col = int(subgrid.get("col", 0))
+            if not 0 <= parent < node:
+                raise ValueError("Invalid parent for subgrid {0}: {1}".format(index, parent))
+            if not (0 <= row and 0 <= col < CELL_STRIDE):
+                raise ValueError("Invalid cell for subgrid {0}: ({1}, {2})".format(index, row, col))
+            preset = subgrid.get("preset", {})
+            preset_key = json.dumps(preset, sort_keys=True)
+            if preset_key not in preset_ids:
+                preset_ids[preset_key] = len(self.presets)
+                self.presets.append(preset)
+            node_cells.append(row * CELL_STRIDE + col)
+            node_specs.append(preset_ids[preset_key])
+            children[parent].append(node)
+
+        # Breadth-first renumbering
+        order = [0]
+        self.child_start = array('i')
+        for node in order:
+            self.child_start.append(len(order))
+            kids = sorted(children[node], key=lambda kid: node_cells[kid])
+            for previous, kid in zip(kids, kids[1:]):
+                if node_cells[previous] == node_cells[kid]:
+                    raise ValueError("Several subgrids share the same cell")
+            order.extend(kids)
+        self.child_start.append(len(order))
+        self.cells = array('q', [node_cells[node] for node in order])
+        self.spec_ids = array('i', [node_specs[node] for node in order])
+        unit_labels = get_unit_labels()
+        self.grid_specs = [GridSpec.from_preset(preset, unit_labels) for preset in self.presets]
+
+    def __len__(self):
+        return len(self.cells)
+
+    def signature(self):
+        # Hashable value identifying the tree, for caches
+        return (tuple(self.child_start), tuple(self.cells), tuple(self.spec_ids), json.dumps(self.presets, sort_keys=True))
+
+    def find_child(self, node, row, col):
+        # Node filling the cell (row, col) of node, or -1
+        start, end = self.child_start[node], self.child_start[node + 1]
+        cell = row * CELL_STRIDE + col
+        index = bisect_left(self.cells, cell, start, end)
+        if index < end and self.cells[index] == cell:
+            return index
+        return -1
+
+
+class NestedTileLayout(TileLayout):
+    # Layout of a root grid and its subgrids, expanded down to max_depth (0 is the root grid only, None is every level).
+    # tile_rects() and pixel_rects() list the innermost tiles shown; their row and column are numbered over the
+    # distinct tile edges of the whole page. Margins and paddings are those of the root grid.
+    def __init__(self, root, tree, doc_ppi, max_depth=None, tolerance=DEFAULT_MERGE_TOLERANCE):
+        self.root = root
+        self.tree = tree
+        self.doc_ppi = doc_ppi
+        self.max_depth = max_depth
+        self.tolerance = tolerance
+        self.expanded = self.expand()
+
+        rects = self.tile_rects()
+        self.cols = sorted({x for x, y, w, h in rects})
+        self.rows = sorted({y for x, y, w, h in rects})
+        super().__init__(root.doc_size_x, root.doc_size_y, root.margin_l, root.margin_r, root.margin_t, root.margin_b,
+                         len(self.cols), len(self.rows), min(w for x, y, w, h in rects), min(h for x, y, w, h in rects),
+                         root.gutter_x, root.gutter_y, root.pad_l, root.pad_t)
+
+    def key(self):
+        return (self.root.key(), self.tree.signature(), self.doc_ppi, self.max_depth)
+
+    def expand(self):
+        # Returns the (layout, offset_x, offset_y, node, depth) of every grid shown, parents first.
+        # Cells of the same size holding the same preset share their layout.
+        layouts = {}
+        expanded = [(self.root, 0, 0, 0, 0)]
+        for layout, offset_x, offset_y, node, depth in expanded:
+            if self.max_depth is not None and depth >= self.max_depth:
+                continue
+            if self.tree.child_start[node] == self.tree.child_start[node + 1]:
+                continue
+            for index, (x, y, w, h) in enumerate(layout.tile_rects()):
+                child = self.tree.find_child(node, index // layout.num_tiles_x, index % layout.num_tiles_x)
+                if child < 0:
+                    continue
+                spec_id = self.tree.spec_ids[child]
+                child_layout = layouts.get((spec_id, w, h))
+                if child_layout is None:
+                    spec = self.tree.grid_specs[spec_id].resolve(w, h, self.doc_ppi)
+                    child_layout = layouts[(spec_id, w, h)] = compute_layout(spec, w, h)
+                expanded.append((child_layout, offset_x + x, offset_y + y, child, depth + 1))
+        return expanded
+
+    def guides_x(self):
+        return self._guides(lambda layout: layout.guides_x(), 1)
+
+    def guides_y(self):
+        return self._guides(lambda layout: layout.guides_y(), 2)
+
+    def _guides(self, get_guides, offset_index):
+        # Guides of every grid shown, duplicates (e.g. a subgrid edge on its cell edge) merged
+        positions = []
+        for entry in self.expanded:
+            offset = entry[offset_index]
+            positions.extend(pos + offset for pos in to_list(get_guides(entry[0])))
+        guides, _ = merge_guides([], positions, self.tolerance)
+        return array('d', guides)
+
+    def tile_rects(self):
+        # Tiles holding a subgrid shown are replaced by the tiles of that subgrid
+        rects = []
+        for layout, offset_x, offset_y, node, depth in self.expanded:
+            expanded_child = self.max_depth is None or depth < self.max_depth
+            for index, (x, y, w, h) in enumerate(layout.tile_rects()):
+                if expanded_child and self.tree.find_child(node, index // layout.num_tiles_x, index % layout.num_tiles_x) >= 0:
+                    continue
+                rects.append((offset_x + x, offset_y + y, w, h))
+        return rects
+
+    def pixel_rects(self):
+        col_index = {x: col for col, x in enumerate(self.cols)}
+        row_index = {y: row for row, y in enumerate(self.rows)}
+        rects = []
+        for x, y, w, h in self.tile_rects():
+            x0 = max(0, int(round(x)))
+            y0 = max(0, int(round(y)))
+            x1 = min(int(self.doc_size_x), int(round(x + w)))
+            y1 = min(int(self.doc_size_y), int(round(y + h)))
+            if x1 > x0 and y1 > y0:
+                rects.append((x0, y0, x1 - x0, y1 - y0, row_index[y], col_index[x]))
+        rects.sort(key=lambda rect: (rect[4], rect[5]))
+        return rects
+
+
+def compute_nested_layout(spec, doc_size_x, doc_size_y):
+    # spec: layout spec with a "subgrids" list (see TileTree), the document "doc_ppi" for the subgrid units,
+    # and optionally the "max_depth" to expand
+    root_spec = dict(spec, subgrids=None)
+    root = compute_layout(root_spec, doc_size_x, doc_size_y)
+    tree = TileTree(spec["subgrids"])
+    return NestedTileLayout(root, tree, spec.get("doc_ppi", DEFAULT_PPI), spec.get("max_depth"))
@@ -0,0 +1,201 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Occupancy map: tells for each tile of a layout whether it is empty, fully transparent, a single solid colour,
+# or has content, along with the bounding box of that content.
+# Uses NumPy when it is available; the fallback works row by row on bytes, never pixel by pixel in Python.
+# This module must not import krita nor PyQt5.
+
+from collections import OrderedDict
+
+from .pixels import content_key, read_projection
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+STATE_EMPTY = "empty"              # Every byte is zero (never painted)
+STATE_TRANSPARENT = "transparent"  # Every pixel has a zero alpha
+STATE_SOLID = "solid"              # Every pixel has the same colour
+STATE_CONTENT = "content"          # Anything else
+
+
+def analyze_tiles(data, doc_size_x, doc_size_y, rects):
+    # data: BGRA pixels of the whole document (doc_size_x * doc_size_y * 4 bytes).
+    # rects: (x, y, width, height, row, col) tuples, e.g. from TileLayout.pixel_rects().
+    # Returns one dict per rect with the "row", "col" and "state" of the tile, its "color" as (r, g, b, a)
+    # when the tile is solid, and the "bbox" (x, y, width, height) of the pixels that differ from the tile's
+    # top-left pixel (None when there are none).
+    if not rects:
+        return []
+    if np is not None:
+        return _analyze_tiles_numpy(data, doc_size_x, doc_size_y, rects)
+    return [_analyze_tile_bytes(data, doc_size_x, rect) for rect in rects]
+
+
+def _tile_result(rect, state, color, bbox):
+    x, y, w, h, row, col = rect
+    return {"row": row, "col": col, "state": state, "color": color, "bbox": bbox}
+
+
+def _bgra_to_rgba(pixel):
+    blue, green, red, alpha = pixel
+    return (red, green, blue, alpha)
+
+
+def _analyze_tile_bytes(data, doc_size_x, rect):
+    x, y, w, h, row, col = rect
+    stride = doc_size_x * 4
+    row_size = w * 4
+    first_pixel = data[y * stride + x * 4:y * stride + x * 4 + 4]
+    solid_row = first_pixel * w
+    solid_row_int = int.from_bytes(solid_row, 'big')
+    zero_row = bytes(row_size)
+    zero_alpha = bytes(w)
+
+    is_empty = is_transparent = True
+    min_x = min_y = max_x = max_y = None
+    for k in range(h):
+        offset = (y + k) * stride + x * 4
+        pixels = data[offset:offset + row_size]
+        if is_empty and pixels != zero_row:
+            is_empty = False
+        if is_transparent and pixels[3::4] != zero_alpha:
+            is_transparent = False
+        if pixels == solid_row:
+            continue
+
+        # The XOR of the row and the solid row as big integers locates the first and last differing bytes in C
+        diff = int.from_bytes(pixels, 'big') ^ solid_row_int
+        first_byte = row_size - (diff.bit_length() + 7) // 8
+        last_byte = row_size - 1 - ((diff & -diff).bit_length() - 1) // 8
+        min_x = first_byte // 4 if min_x is None else min(min_x, first_byte // 4)
+        max_x = last_byte // 4 if max_x is None else max(max_x, last_byte // 4)
+        if min_y is None:
+            min_y = k
+        max_y = k
+
+    bbox = None if min_y is None else (x + min_x, y + min_y, max_x - min_x + 1, max_y - min_y + 1)
+    if is_empty:
+        return _tile_result(rect, STATE_EMPTY, None, None)
+    if is_transparent:
+        return _tile_result(rect, STATE_TRANSPARENT, None, bbox)
+    if bbox is None:
+        return _tile_result(rect, STATE_SOLID, _bgra_to_rgba(first_pixel), None)
+    return _tile_result(rect, STATE_CONTENT, None, bbox)
+
+
+def _analyze_tiles_numpy(data, doc_size_x, doc_size_y, rects):
+    # One uint32 per pixel: alpha is the most significant byte of a little-endian BGRA pixel
+    pixels = np.frombuffer(data, dtype='<u4').reshape(doc_size_y, doc_size_x)
+
+    # When all tiles have the same size and are evenly spaced, they are seen as a single
+    # (rows, cols, height, width) strided view and analyzed in one reduction
+    grid = _uniform_grid(rects)
+    if grid is None:
+        results = []
+        for rect in rects:
+            x, y, w, h = rect[:4]
+            results.extend(_analyze_tile_views(pixels[y:y + h, x:x + w][None, None], [rect]))
+        return results
+
+    x0, y0, w, h, step_x, step_y, num_rows, num_cols = grid
+    origin = pixels[y0:, x0:]
+    tiles = np.lib.stride_tricks.as_strided(
+        origin,
+        shape=(num_rows, num_cols, h, w),
+        strides=(step_y * pixels.strides[0], step_x * pixels.strides[1], pixels.strides[0], pixels.strides[1]),
+        writeable=False)
+    return _analyze_tile_views(tiles, rects)
+
+
+def _uniform_grid(rects):
+    x0, y0, w, h, _, _ = rects[0]
+    num_rows = rects[-1][4] - rects[0][4] + 1
+    num_cols = rects[-1][5] - rects[0][5] + 1
+    if num_rows * num_cols != len(rects):
+        return None
+    step_x = rects[1][0] - x0 if num_cols > 1 else w
+    step_y = rects[num_cols][1] - y0 if num_rows > 1 else h
+    for index, (x, y, tile_w, tile_h, _, _) in enumerate(rects):
+        if tile_w != w or tile_h != h or x != x0 + (index % num_cols) * step_x or y != y0 + (index // num_cols) * step_y:
+            return None
+    return x0, y0, w, h, step_x, step_y, num_rows, num_cols
+
+
+def _analyze_tile_views(tiles, rects):
+    # tiles: (rows, cols, height, width) uint32 array, rects in the same row-major order
+    first_pixels = tiles[:, :, 0, 0]
+    differs = tiles != first_pixels[:, :, None, None]
+    empty = ~tiles.any(axis=(2, 3))
+    transparent = ((tiles >> 24) == 0).all(axis=(2, 3))
+
+    rows_differ = differs.any(axis=3)
+    cols_differ = differs.any(axis=2)
+    has_content = rows_differ.any(axis=2)
+    h = rows_differ.shape[2]
+    w = cols_differ.shape[2]
+    min_y = rows_differ.argmax(axis=2)
+    max_y = h - 1 - rows_differ[:, :, ::-1].argmax(axis=2)
+    min_x = cols_differ.argmax(axis=2)
+    max_x = w - 1 - cols_differ[:, :, ::-1].argmax(axis=2)
+
+    results = []
+    num_cols = tiles.shape[1]
+    for index, rect in enumerate(rects):
+        i, j = divmod(index, num_cols)
+        x, y = rect[0], rect[1]
+        bbox = None
+        if has_content[i, j]:
+            bbox = (x + int(min_x[i, j]), y + int(min_y[i, j]), int(max_x[i, j] - min_x[i, j]) + 1, int(max_y[i, j] - min_y[i, j]) + 1)
+        if empty[i, j]:
+            results.append(_tile_result(rect, STATE_EMPTY, None, None))
+        elif transparent[i, j]:
+            results.append(_tile_result(rect, STATE_TRANSPARENT, None, bbox))
+        elif bbox is None:
+            results.append(_tile_result(rect, STATE_SOLID, _bgra_to_rgba(int(first_pixels[i, j]).to_bytes(4, 'little')), None))
+        else:
+            results.append(_tile_result(rect, STATE_CONTENT, None, bbox))
+    return results
+
+
+
+class OccupancyCache:
+    # Occupancy maps keyed by the layout and the content key of the document (least recently used first).
+    # Documents without a content key (modified since they were opened or saved) are always analyzed again.
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_occupancy(self, doc, layout, data=None):
+        # data: the projection when the caller has already read it, otherwise it is only read on a cache miss
+        doc_key = content_key(doc)
+        key = None if doc_key is None else (layout.key(), doc_key)
+        results = self.entries.get(key) if key is not None else None
+        if results is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return results
+
+        self.misses += 1
+        if data is None:
+            data = read_projection(doc)
+        results = analyze_tiles(data, doc.width(), doc.height(), layout.pixel_rects())
+        if key is not None:
+            self.entries[key] = results
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return results
+
+
+# Shared by the exports and the scripting API
+occupancy_cache = OccupancyCache()
+
+
+def get_occupancy(doc, layout):
+    # Cached analyze_tiles() of the merged image of doc
+    return occupancy_cache.get_occupancy(doc, layout)
@@ -0,0 +1,135 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Hex (pointy or flat top) and 2:1 isometric grids. Guides can only draw axis-aligned lines, so these grids are drawn
+# as a vector overlay: a single SVG path where the outline of the cell is computed once, as relative path commands,
+# and instanced at each cell center by a single absolute move.
+# This module must not import krita nor PyQt5 (the document is passed in).
+
+from array import array
+import io, math
+
+from .borders import DEFAULT_BORDER_COLOR, DEFAULT_BORDER_WIDTH, add_svg_layer, svg_cache, svg_stroke
+from .layout import TileLayout
+from .spec import GRID_HEX_FLAT, GRID_HEX_POINTY, GRID_ISOMETRIC, GRID_RECT
+
+
+DEFAULT_OVERLAY_LAYER_NAME = "Cell grid"
+
+SQRT3 = math.sqrt(3)
+
+
+class CellGrid(TileLayout):
+    # Grid of identical non-rectangular cells, num_tiles_x per row and num_tiles_y rows, centered in the margins.
+    # Hex rows (pointy top) or columns (flat top) are staggered by half a cell; isometric grids form a diamond.
+    # tile_size_x/tile_size_y is the size of the cell bounding box, and tile_rects() lists the bounding boxes.
+    def __init__(self, grid_type, doc_size_x, doc_size_y, margin_l, margin_r, margin_t, margin_b, num_tiles_x, num_tiles_y,
+                 tile_size_x, tile_size_y, outline, centers_x, centers_y):
+        super().__init__(doc_size_x, doc_size_y, margin_l, margin_r, margin_t, margin_b, num_tiles_x, num_tiles_y,
+                         tile_size_x, tile_size_y, 0, 0, 0, 0)
+        self.grid_type = grid_type
+        self.outline = outline
+        self.centers_x = centers_x
+        self.centers_y = centers_y
+
+    def key(self):
+        return super().key() + (self.grid_type,)
+
+    def guides_x(self):
+        return array('d')
+
+    def guides_y(self):
+        return array('d')
+
+    def tile_rects(self):
+        half_x = self.tile_size_x / 2
+        half_y = self.tile_size_y / 2
+        return [(x - half_x, y - half_y, self.tile_size_x, self.tile_size_y) for x, y in zip(self.centers_x, self.centers_y)]
+
+    def cell_polygons(self):
+        # Vertices of each cell, e.g. for the preview
+        return [[(x + dx, y + dy) for dx, dy in self.outline] for x, y in zip(self.centers_x, self.centers_y)]
+
+    def cell_path(self):
+        # Relative SVG path of the outline, starting from its first vertex
+        steps = " ".join("{0:.3f} {1:.3f}".format(x1 - x0, y1 - y0) for (x0, y0), (x1, y1) in zip(self.outline, self.outline[1:]))
+        return "l{0}z".format(steps)
+
+
+def compute_cell_grid(spec, doc_size_x, doc_size_y):
+    # Largest cells of spec["grid_type"] that fit num_tiles_x by num_tiles_y cells within the margins.
+    # Cells share their edges, so gutters and the tile ratio do not apply.
+    grid_type = spec["grid_type"]
+    margin_l = spec["margin_l"]
+    margin_r = spec["margin_r"]
+    margin_t = spec["margin_t"]
+    margin_b = spec["margin_b"]
+    num_tiles_x = int(spec["num_tiles_x"])
+    num_tiles_y = int(spec["num_tiles_y"])
+    available_x = doc_size_x - margin_l - margin_r
+    available_y = doc_size_y - margin_t - margin_b
+
+    if grid_type == GRID_HEX_POINTY:
+        stagger = 0.5 if num_tiles_y > 1 else 0
+        radius = min(available_x / (SQRT3 * (num_tiles_x + stagger)), available_y / (2 + 1.5 * (num_tiles_y - 1)))
+        width, height = SQRT3 * radius, 2 * radius
+        start_x = margin_l + (available_x - width * (num_tiles_x + stagger)) / 2 + width / 2
+        start_y = margin_t + (available_y - height - 1.5 * radius * (num_tiles_y - 1)) / 2 + radius
+        outline = [(0, -radius), (width / 2, -radius / 2), (width / 2, radius / 2), (0, radius), (-width / 2, radius / 2), (-width / 2, -radius / 2)]
+        centers = [(start_x + col * width + (width / 2 if row % 2 else 0), start_y + row * 1.5 * radius)
+                   for row in range(num_tiles_y) for col in range(num_tiles_x)]
+    elif grid_type == GRID_HEX_FLAT:
+        stagger = 0.5 if num_tiles_x > 1 else 0
+        radius = min(available_x / (2 + 1.5 * (num_tiles_x - 1)), available_y / (SQRT3 * (num_tiles_y + stagger)))
+        width, height = 2 * radius, SQRT3 * radius
+        start_x = margin_l + (available_x - width - 1.5 * radius * (num_tiles_x - 1)) / 2 + radius
+        start_y = margin_t + (available_y - height * (num_tiles_y + stagger)) / 2 + height / 2
+        outline = [(-radius, 0), (-radius / 2, -height / 2), (radius / 2, -height / 2), (radius, 0), (radius / 2, height / 2), (-radius / 2, height / 2)]
+        centers = [(start_x + col * 1.5 * radius, start_y + row * height + (height / 2 if col % 2 else 0))
+                   for row in range(num_tiles_y) for col in range(num_tiles_x)]
+    elif grid_type == GRID_ISOMETRIC:
+        # Row k and column k run along the two diagonals of the diamond; the cells are twice as wide as high
+        diagonal = num_tiles_x + num_tiles_y
+        width = min(2 * available_x / diagonal, 4 * available_y / diagonal)
+        height = width / 2
+        start_x = margin_l + (available_x - diagonal * width / 2) / 2 + num_tiles_y * width / 2
+        start_y = margin_t + (available_y - diagonal * height / 2) / 2 + height / 2
+        outline = [(0, -height / 2), (width / 2, 0), (0, height / 2), (-width / 2, 0)]
+        centers = [(start_x + (col - row) * width / 2, start_y + (col + row) * height / 2)
+                   for row in range(num_tiles_y) for col in range(num_tiles_x)]
+    else:
+        raise ValueError("Unknown grid type: {0}".format(grid_type))
+
+    return CellGrid(grid_type, doc_size_x, doc_size_y, margin_l, margin_r, margin_t, margin_b, num_tiles_x, num_tiles_y,
+                    width, height, outline, array('d', [x for x, y in centers]), array('d', [y for x, y in centers]))
+
+
+def build_overlay_svg(grid, doc_ppi, width=DEFAULT_BORDER_WIDTH, color=DEFAULT_BORDER_COLOR):
+    # One <path> for the whole grid: "M x y" to the first vertex of each cell, followed by the shared relative outline
+    doc_size_x = grid.doc_size_x
+    doc_size_y = grid.doc_size_y
+    points_per_pixel = 72.0 / doc_ppi
+    cell_path = grid.cell_path()
+    first_x, first_y = grid.outline[0]
+    move = "M{0:.3f} {1:.3f}" + cell_path
+
+    svg = io.StringIO()
+    svg.write('<svg xmlns="http://www.w3.org/2000/svg" width="{0:.3f}pt" height="{1:.3f}pt" viewBox="0 0 {2} {3}">'.format(
+        doc_size_x * points_per_pixel, doc_size_y * points_per_pixel, doc_size_x, doc_size_y))
+    svg.write('<path fill="none" {0} stroke-width="{1:.3f}" stroke-linejoin="round" d="'.format(svg_stroke(color), width))
+    write = svg.write
+    for x, y in zip(grid.centers_x, grid.centers_y):
+        write(move.format(x + first_x, y + first_y))
+    svg.write('"/></svg>')
+    return svg.getvalue()
+
+
+def get_overlay_svg(grid, doc_ppi, width=DEFAULT_BORDER_WIDTH, color=DEFAULT_BORDER_COLOR):
+    # Cached build_overlay_svg()
+    return svg_cache.get_svg(("overlay", grid.key(), doc_ppi, width, color),
+                             lambda: build_overlay_svg(grid, doc_ppi, width, color))
+
+
+def add_overlay_layer(doc, grid, width=DEFAULT_BORDER_WIDTH, color=DEFAULT_BORDER_COLOR, name=DEFAULT_OVERLAY_LAYER_NAME):
+    # Adds a vector layer with the cell outlines on top of the document. Returns the layer.
+    return add_svg_layer(doc, get_overlay_svg(grid, doc.resolution(), width, color), name)
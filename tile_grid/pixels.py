@@ -0,0 +1,45 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Bulk access to document pixels, shared by the tile export and the occupancy map.
+# This module must not import PyQt5; documents are only used through their scripting API.
+
+import os
+
+
+def check_rgba8(doc):
+    # Only 8-bit RGBA documents are supported: their pixels are 4 bytes in BGRA order (like QImage.Format_ARGB32)
+    if doc.colorModel() != "RGBA" or doc.colorDepth() != "U8":
+        raise ValueError("Only 8-bit RGBA documents are supported")
+
+
+def read_projection(doc):
+    # Reads the merged image in one call
+    check_rgba8(doc)
+    doc.waitForDone()
+    return bytes(doc.pixelData(0, 0, doc.width(), doc.height()))
+
+
+
+def content_key(doc):
+    # Cheap key of the content of a document for caches, read without touching any pixel: the file and its
+    # modification time, plus the id, compositing properties and bounds of every layer.
+    # Krita has no revision counter for unsaved edits, so a modified document has no key (None): it must be analyzed
+    # again rather than served from a cache.
+    file_name = doc.fileName()
+    if not file_name or doc.modified():
+        return None
+    try:
+        modification_time = os.stat(file_name).st_mtime_ns
+    except OSError:
+        return None
+
+    layers = []
+    stack = list(reversed(doc.topLevelNodes()))
+    while stack:
+        node = stack.pop()
+        bounds = node.bounds()
+        layers.append((node.uniqueId().toString(), node.visible(), node.opacity(), node.blendingMode(),
+                       (bounds.x(), bounds.y(), bounds.width(), bounds.height())))
+        stack.extend(reversed(node.childNodes()))
+    return file_name, modification_time, tuple(layers)
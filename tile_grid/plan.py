@@ -0,0 +1,172 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Layout planning for batches of .kra files, done in a worker pool before any document is opened in Krita,
+# and for storyboards (see storyboard.py), done before any document is created.
+# This module must not import krita nor PyQt5, so that it can run in worker processes.
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import os, sys, time, zipfile
+import xml.etree.ElementTree as ElementTree
+
+from .borders import border_style, get_border_svg
+from .guides import merge_guides
+from .layout import compute_layout
+from .overlays import CellGrid, get_overlay_svg
+from .spec import UNIT_LABELS, GridSpec
+
+
+def list_kra_files(directory, recursive=False):
+    if recursive:
+        paths = [os.path.join(root, name) for root, _, names in os.walk(directory) for name in names]
+    else:
+        paths = [os.path.join(directory, name) for name in os.listdir(directory)]
+    return sorted(path for path in paths if path.lower().endswith(".kra") and os.path.isfile(path))
+
+
+def read_kra_info(path):
+    # Reads the image size and resolution from the maindoc.xml of a .kra file, without loading any pixel data.
+    # Returns (width, height, ppi).
+    with zipfile.ZipFile(path) as archive:
+        root = ElementTree.fromstring(archive.read("maindoc.xml"))
+    image = root.find("{*}IMAGE")
+    if image is None:
+        raise ValueError("No image found in {0}".format(path))
+    return int(image.get("width")), int(image.get("height")), float(image.get("x-res", 72))
+
+
+def plan_document(path, preset, unit_labels=UNIT_LABELS):
+    # Worker task: computes the guides of one document.
+    # Returns a dict with the document size and resolution, the guide lists and the time spent.
+    start_time = time.perf_counter()
+    doc_size_x, doc_size_y, doc_ppi = read_kra_info(path)
+    grid_spec = GridSpec.from_preset(preset, unit_labels)
+    layout = compute_layout(grid_spec.resolve(doc_size_x, doc_size_y, doc_ppi), doc_size_x, doc_size_y)
+    panel_borders, width, radius, color = border_style(grid_spec)
+    if isinstance(layout, CellGrid):
+        # Hex and isometric cells are drawn as an overlay whether or not panel_borders is set, as in api.apply_tile_grid()
+        overlay_svg, border_svg = get_overlay_svg(layout, doc_ppi, width, color), None
+    else:
+        overlay_svg, border_svg = None, get_border_svg(layout, doc_ppi, width, radius, color) if panel_borders else None
+    return {
+        "document": path,
+        "doc_size_x": doc_size_x,
+        "doc_size_y": doc_size_y,
+        "doc_ppi": doc_ppi,
+        "tile_size_x": layout.tile_size_x,
+        "tile_size_y": layout.tile_size_y,
+        "guides_x": layout.guides_x().tolist(),
+        "guides_y": layout.guides_y().tolist(),
+        "border_svg": border_svg,
+        "overlay_svg": overlay_svg,
+        "plan_time": time.perf_counter() - start_time
+    }
+
+
+def can_use_processes():
+    # Inside Krita, sys.executable is Krita itself and cannot be used to spawn Python workers
+    return os.path.basename(sys.executable or "").lower().startswith("python")
+
+
+def plan_chunk(paths, preset, unit_labels=UNIT_LABELS):
+    # Worker task: plans a run of documents, so that the preset is sent and the results are returned once per chunk
+    # rather than once per document. A failing document gets an "error" entry instead of guides.
+    # Each result records the process that planned it as "worker".
+    results = []
+    for path in paths:
+        try:
+            result = plan_document(path, preset, unit_labels)
+        except Exception as error:
+            result = {"document": path, "error": str(error)}
+        result["worker"] = os.getpid()
+        results.append(result)
+    return results
+
+
+def plan_documents(paths, preset, unit_labels=UNIT_LABELS, workers=None, use_processes=None):
+    # Plans every document in a pool of workers (processes when possible, threads otherwise).
+    # Returns one result per path, in the same order. A failing document gets an "error" entry instead of guides.
+    # The preset is validated once, before any worker starts (raises ValueError if it is invalid).
+    grid_spec = GridSpec.from_preset(preset, unit_labels)
+    if not paths:
+        return []
+    if use_processes is None:
+        use_processes = can_use_processes()
+    # No more workers than documents: each process costs a start, and caches of its own
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    # A few chunks per worker, so that a worker done early takes over the documents left
+    chunk_size = -(-len(paths) // (4 * workers))
+    chunks = [paths[index:index + chunk_size] for index in range(0, len(paths), chunk_size)]
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+
+    with executor_class(max_workers=workers) as executor:
+        futures = [executor.submit(plan_chunk, chunk, grid_spec, unit_labels) for chunk in chunks]
+        results = []
+        for chunk, future in zip(chunks, futures):
+            try:
+                results.extend(future.result())
+            except Exception as error:
+                # The worker itself failed (e.g. a process that died)
+                results.extend({"document": path, "error": str(error)} for path in chunk)
+    return results
+
+
+def plan_storyboard(preset, page_sizes, doc_ppi, single_document=False, page_gap=0, unit_labels=UNIT_LABELS):
+    # Plans the documents of a storyboard, one page per (doc_size_x, doc_size_y) of page_sizes.
+    # The layout is computed once per distinct page size and shared by the pages of that size.
+    # With single_document, the pages are stacked top to bottom in one document, page_gap pixels apart, and the
+    # page edges get guides as well; the pages must then have the same width and columns, since a vertical guide runs
+    # through every page. Returns (documents, layouts) where each document is a dict with its size,
+    # guides and pages ({"offset_x", "offset_y", "layout"}), and layouts maps each page size to its layout.
+    # Raises ValueError if the preset is invalid, the grid does not fit a page or single document pages have different
+    # columns.
+    if not page_sizes:
+        raise ValueError("A storyboard needs at least one page")
+    grid_spec = GridSpec.from_preset(preset, unit_labels)
+    layouts = {}
+    for size in page_sizes:
+        if size not in layouts:
+            doc_size_x, doc_size_y = size
+            layout = compute_layout(grid_spec.resolve(doc_size_x, doc_size_y, doc_ppi), doc_size_x, doc_size_y)
+            if layout.tile_size_x < 1 or layout.tile_size_y < 1:
+                raise ValueError("The specified grid parameters are too big for a {0} x {1} page".format(doc_size_x, doc_size_y))
+            layouts[size] = layout
+
+    if not single_document:
+        documents = []
+        for size in page_sizes:
+            layout = layouts[size]
+            documents.append({
+                "doc_size_x": size[0],
+                "doc_size_y": size[1],
+                "guides_x": layout.guides_x().tolist(),
+                "guides_y": layout.guides_y().tolist(),
+                "pages": [{"offset_x": 0, "offset_y": 0, "layout": layout}]
+            })
+        return documents, layouts
+
+    pages = []
+    positions_y = []
+    offset_y = 0
+    for size in page_sizes:
+        layout = layouts[size]
+        pages.append({"offset_x": 0, "offset_y": offset_y, "layout": layout})
+        positions_y.extend([offset_y, offset_y + size[1]])
+        positions_y.extend(guide + offset_y for guide in layout.guides_y().tolist())
+        offset_y += size[1] + page_gap
+    # Vertical guides run through every page, so every page must have the same ones
+    guides_x = None
+    for size, layout in layouts.items():
+        columns, _ = merge_guides([], [0, size[0]] + layout.guides_x().tolist())
+        if guides_x is not None and (len(columns) != len(guides_x) or any(abs(a - b) > 1e-6 for a, b in zip(columns, guides_x))):
+            raise ValueError("The pages of a single document must have the same width and the same columns")
+        guides_x = columns
+    guides_y, _ = merge_guides([], positions_y)
+    document = {
+        "doc_size_x": page_sizes[0][0],
+        "doc_size_y": offset_y - page_gap,
+        "guides_x": guides_x,
+        "guides_y": guides_y,
+        "pages": pages
+    }
+    return [document], layouts
@@ -0,0 +1,103 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Live preview of the tile layout displayed in the Tile Grid dialog.
+
+from PyQt5.QtCore import Qt, QPointF, QRectF
+from PyQt5.QtGui import QColor, QPainter, QPainterPath, QPen, QPixmap, QPolygonF
+from PyQt5.QtWidgets import QSizePolicy, QWidget
+
+
+class TileGridPreview(QWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMinimumSize(240, 160)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+
+        self.DEFAULT_BORDER = 6
+        self.PAGE_COLOR = QColor(255, 255, 255)
+        self.PAGE_OUTLINE_COLOR = QColor(96, 96, 96)
+        self.MARGIN_COLOR = QColor(160, 160, 160)
+        self.TILE_COLOR = QColor(120, 170, 230)
+        self.TILE_OUTLINE_COLOR = QColor(40, 90, 160)
+
+        # The rendered layout is cached in a pixmap which is only redrawn when the layout or the widget size changes
+        self.tile_layout = None
+        self.layout_key = None
+        self.pixmap = None
+        self.render_count = 0
+
+    def set_tile_layout(self, tile_layout):
+        key = None if tile_layout is None else tile_layout.key()
+        if key == self.layout_key:
+            return
+        self.tile_layout = tile_layout
+        self.layout_key = key
+        self.pixmap = None
+        self.update()
+
+    def resizeEvent(self, event):
+        self.pixmap = None
+        super().resizeEvent(event)
+
+    def paintEvent(self, event):
+        if self.pixmap is None:
+            self.pixmap = self.render_tile_layout()
+        painter = QPainter(self)
+        painter.drawPixmap(0, 0, self.pixmap)
+        painter.end()
+
+    def render_tile_layout(self):
+        self.render_count += 1
+        pixmap = QPixmap(self.size())
+        pixmap.fill(self.palette().window().color())
+
+        tile_layout = self.tile_layout
+        if tile_layout is None or tile_layout.doc_size_x <= 0 or tile_layout.doc_size_y <= 0:
+            return pixmap
+
+        # Fit the document in the widget
+        border = self.DEFAULT_BORDER
+        scale = min((self.width() - 2 * border) / tile_layout.doc_size_x, (self.height() - 2 * border) / tile_layout.doc_size_y)
+        if scale <= 0:
+            return pixmap
+        offset_x = (self.width() - tile_layout.doc_size_x * scale) / 2
+        offset_y = (self.height() - tile_layout.doc_size_y * scale) / 2
+
+        painter = QPainter(pixmap)
+        painter.translate(offset_x, offset_y)
+        painter.scale(scale, scale)
+
+        # Cosmetic pens (width 0) keep a 1 pixel outline whatever the scale
+        page_pen = QPen(self.PAGE_OUTLINE_COLOR, 0)
+        margin_pen = QPen(self.MARGIN_COLOR, 0, Qt.DashLine)
+        tile_pen = QPen(self.TILE_OUTLINE_COLOR, 0)
+
+        # Document
+        painter.setPen(page_pen)
+        painter.setBrush(self.PAGE_COLOR)
+        painter.drawRect(QRectF(0, 0, tile_layout.doc_size_x, tile_layout.doc_size_y))
+
+        # Margins
+        painter.setPen(margin_pen)
+        painter.setBrush(Qt.NoBrush)
+        painter.drawRect(QRectF(tile_layout.margin_l, tile_layout.margin_t,
+                                tile_layout.doc_size_x - tile_layout.margin_l - tile_layout.margin_r,
+                                tile_layout.doc_size_y - tile_layout.margin_t - tile_layout.margin_b))
+
+        # Tiles, drawn in a single call. Outlines are dropped when the tiles get smaller than a few screen pixels.
+        draw_outlines = min(tile_layout.tile_size_x, tile_layout.tile_size_y) * scale >= 4
+        painter.setPen(tile_pen if draw_outlines else Qt.NoPen)
+        painter.setBrush(self.TILE_COLOR)
+        if hasattr(tile_layout, "cell_polygons"):
+            # Hex and isometric cells, gathered in a single path
+            path = QPainterPath()
+            for polygon in tile_layout.cell_polygons():
+                path.addPolygon(QPolygonF([QPointF(x, y) for x, y in polygon]))
+                path.closeSubpath()
+            painter.drawPath(path)
+        else:
+            painter.drawRects([QRectF(x, y, w, h) for x, y, w, h in tile_layout.tile_rects()])
+
+        painter.end()
+        return pixmap
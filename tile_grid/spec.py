@@ -0,0 +1,319 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Grid settings model shared by the dialog, the presets, the scripting API and the batches.
+# A preset (JSON dict) is parsed and validated once into a GridSpec; units are an enum whose pixel factors are
+# precomputed per document (DocumentUnits), so resolving a GridSpec for a document compares no strings.
+# Presets are versioned. Version 2 stores unit keys ("px", "in", "cm", "%") rather than translated unit labels,
+# so that presets load in any language; version 1 presets (unit labels, flags as "True"/"False") are still read.
+# This module must not import krita nor PyQt5.
+
+from enum import Enum
+import builtins, math, re
+
+from .guides import DEFAULT_MERGE_TOLERANCE
+from .tracks import parse_tracks
+
+
+PRESET_VERSION = 2
+
+
+class Unit(Enum):
+    PX = "px"
+    IN = "in"
+    CM = "cm"
+    PC = "%"
+
+
+# Units of the preset fields
+UNIT_PX = Unit.PX.value
+UNIT_IN = Unit.IN.value
+UNIT_CM = Unit.CM.value
+UNIT_PC = Unit.PC.value
+
+# Display labels (version 1 presets store them, translated)
+UNIT_LABELS = {
+    "Pixels (px)": UNIT_PX,
+    "Inches (in)": UNIT_IN,
+    "Centimeter (cm)": UNIT_CM,
+    "Percentage (%)": UNIT_PC
+}
+UNIT_DISPLAY_LABELS = {Unit(key): label for label, key in UNIT_LABELS.items()}
+
+
+def get_unit_labels():
+    # Presets saved by the dialog store translated unit labels, so accept both the English and the translated ones
+    # (i18n is only defined when running inside Krita)
+    unit_labels = dict(UNIT_LABELS)
+    translate = getattr(builtins, "i18n", None)
+    if translate is not None:
+        for label, unit in UNIT_LABELS.items():
+            unit_labels[translate(label)] = unit
+    return unit_labels
+
+
+class DocumentUnits:
+    # Pixel factor of each unit along each axis of a document
+    __slots__ = ("doc_size_x", "doc_size_y", "doc_ppi", "factors_x", "factors_y")
+
+    def __init__(self, doc_size_x, doc_size_y, doc_ppi):
+        self.doc_size_x = doc_size_x
+        self.doc_size_y = doc_size_y
+        self.doc_ppi = doc_ppi
+        self.factors_x = self.factors(doc_size_x, doc_ppi)
+        self.factors_y = self.factors(doc_size_y, doc_ppi)
+
+    @staticmethod
+    def factors(doc_size, doc_ppi):
+        return {
+            Unit.PX: 1.0,
+            Unit.IN: doc_ppi,
+            Unit.CM: doc_ppi / 2.54,  # 1 inch = 2.54 cm
+            Unit.PC: doc_size * 0.01
+        }
+
+    def to_pixels(self, value, unit, axis):
+        return value * (self.factors_x if axis == "x" else self.factors_y)[unit]
+
+    def from_pixels(self, value, unit, axis):
+        return value / (self.factors_x if axis == "x" else self.factors_y)[unit]
+
+    def max_value(self, unit, axis):
+        # Value of the whole document size in unit (the upper bound of a margin or gutter)
+        doc_size = self.doc_size_x if axis == "x" else self.doc_size_y
+        return 100.0 if unit is Unit.PC else self.from_pixels(doc_size, unit, axis)
+
+
+class Length:
+    # A margin or gutter size along with its unit
+    __slots__ = ("value", "unit")
+
+    def __init__(self, value, unit):
+        self.value = value
+        self.unit = unit
+
+    def __eq__(self, other):
+        return isinstance(other, Length) and self.value == other.value and self.unit == other.unit
+
+    def __repr__(self):
+        return "Length({0!r}, {1})".format(self.value, self.unit.value)
+
+
+GRID_RECT = "rect"
+GRID_HEX_POINTY = "hex_pointy"
+GRID_HEX_FLAT = "hex_flat"
+GRID_ISOMETRIC = "isometric"
+GRID_TYPES = (GRID_RECT, GRID_HEX_POINTY, GRID_HEX_FLAT, GRID_ISOMETRIC)
+
+DEFAULT_BORDER_WIDTH = 4.0
+DEFAULT_BORDER_RADIUS = 0.0
+DEFAULT_BORDER_COLOR = "#000000"
+
+# Border colors are written into SVG attributes as they are, so only hex colors are accepted (#RRGGBB or #RRGGBBAA)
+BORDER_COLOR_PATTERN = re.compile(r"#[0-9A-Fa-f]{6}(?:[0-9A-Fa-f]{2})?\Z")
+
+# Length fields and the axis they belong to
+LENGTH_FIELDS = (
+    ("margin_l", "x"), ("margin_r", "x"),
+    ("margin_t", "y"), ("margin_b", "y"),
+    ("gutter_x", "x"), ("gutter_y", "y")
+)
+LENGTH_AXES = dict(LENGTH_FIELDS)
+
+# Same defaults as the dialog
+DEFAULT_PRESET = {
+    "version": PRESET_VERSION,
+    "margin_l": 10.0,
+    "margin_l_unit": UNIT_PC,
+    "margin_r": 10.0,
+    "margin_r_unit": UNIT_PC,
+    "margin_t": 15.0,
+    "margin_t_unit": UNIT_PC,
+    "margin_b": 15.0,
+    "margin_b_unit": UNIT_PC,
+    "gutter_x": 2.5,
+    "gutter_x_unit": UNIT_PC,
+    "gutter_y": 2.5,
+    "gutter_y_unit": UNIT_PC,
+    "num_tiles_x": 3,
+    "num_tiles_y": 3,
+    "tile_ratio": 1.78,
+    "clear_guides": False,
+    "lock_guides": True,
+    "snap_guides": True,
+    "guide_tolerance": DEFAULT_MERGE_TOLERANCE,
+    "pixel_aligned": False,
+    "tracks_x": "",
+    "tracks_y": "",
+    "subgrids": [],
+    "panel_borders": False,
+    "border_width": DEFAULT_BORDER_WIDTH,
+    "border_radius": DEFAULT_BORDER_RADIUS,
+    "border_color": DEFAULT_BORDER_COLOR,
+    "grid_type": GRID_RECT
+}
+
+FLAG_FIELDS = ("clear_guides", "lock_guides", "snap_guides", "pixel_aligned", "panel_borders")
+
+
+def preset_flag(preset, key):
+    # Preset flags may have been saved as booleans or as "True"/"False" strings
+    flag = preset.get(key, DEFAULT_PRESET[key])
+    if isinstance(flag, str):
+        return flag.strip().lower() in ("true", "1", "yes")
+    return bool(flag)
+
+
+def check_color(color):
+    # Raises ValueError unless color is "#RRGGBB" or "#RRGGBBAA"
+    if not isinstance(color, str) or not BORDER_COLOR_PATTERN.match(color):
+        raise ValueError("Invalid color (expected #RRGGBB or #RRGGBBAA): {0!r}".format(color))
+    return color
+
+
+def convert_value_to_pixels(value, unit, doc_size, doc_ppi):
+    if unit not in (UNIT_PX, UNIT_IN, UNIT_CM, UNIT_PC):
+        raise ValueError("Unknown unit: {0}".format(unit))
+    return value * DocumentUnits.factors(doc_size, doc_ppi)[Unit(unit)]
+
+
+class GridSpec:
+    # Validated grid settings. Margins and gutters are Lengths; see DEFAULT_PRESET for the other fields.
+    __slots__ = ("margin_l", "margin_r", "margin_t", "margin_b", "gutter_x", "gutter_y",
+                 "num_tiles_x", "num_tiles_y", "tile_ratio",
+                 "clear_guides", "lock_guides", "snap_guides", "guide_tolerance",
+                 "pixel_aligned", "tracks_x", "tracks_y", "subgrids", "grid_type",
+                 "panel_borders", "border_width", "border_radius", "border_color")
+
+    def __init__(self, **fields):
+        # Missing fields get their default value. Values are not checked: use from_preset() to validate a preset.
+        for name in self.__slots__:
+            if name in fields:
+                setattr(self, name, fields.pop(name))
+            elif name in LENGTH_AXES:
+                setattr(self, name, Length(DEFAULT_PRESET[name], Unit(DEFAULT_PRESET[name + "_unit"])))
+            else:
+                setattr(self, name, DEFAULT_PRESET[name])
+        if fields:
+            raise TypeError("Unknown fields: {0}".format(", ".join(sorted(fields))))
+
+    def __eq__(self, other):
+        return isinstance(other, GridSpec) and all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def copy(self, **fields):
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(fields)
+        return GridSpec(**values)
+
+    @classmethod
+    def from_preset(cls, preset, unit_labels=None):
+        # Parses a preset (version 1 or 2) in a single validation pass.
+        # Raises ValueError listing every invalid field. Missing fields get their default value.
+        if isinstance(preset, GridSpec):
+            return preset
+        errors = []
+        version = preset.get("version", 1)
+        if not isinstance(version, int) or version > PRESET_VERSION:
+            errors.append("unsupported preset version {0}".format(version))
+        unit_labels = unit_labels if unit_labels is not None else get_unit_labels()
+        fields = {}
+
+        def number(key, minimum=None, strict=False, integral=False):
+            # NaN and infinities are rejected, and so are counts with a fractional part (e.g. 2.5 tiles)
+            try:
+                value = float(preset.get(key, DEFAULT_PRESET[key]))
+            except (TypeError, ValueError):
+                errors.append("{0} is not a number".format(key))
+                return DEFAULT_PRESET[key]
+            if not math.isfinite(value):
+                errors.append("{0} is not a finite number".format(key))
+                return DEFAULT_PRESET[key]
+            if integral:
+                if not value.is_integer():
+                    errors.append("{0} must be a whole number".format(key))
+                    return DEFAULT_PRESET[key]
+                value = int(value)
+            if minimum is not None and (value <= minimum if strict else value < minimum):
+                errors.append("{0} must be {1} {2}".format(key, "greater than" if strict else "at least", minimum))
+            return value
+
+        for key, axis in LENGTH_FIELDS:
+            value = number(key, minimum=0)
+            unit = preset.get(key + "_unit", DEFAULT_PRESET[key + "_unit"])
+            unit = unit_labels.get(unit, unit)
+            try:
+                fields[key] = Length(value, Unit(unit))
+            except ValueError:
+                errors.append("unknown unit for {0}: {1}".format(key, preset.get(key + "_unit")))
+        fields["num_tiles_x"] = number("num_tiles_x", 1, integral=True)
+        fields["num_tiles_y"] = number("num_tiles_y", 1, integral=True)
+        fields["tile_ratio"] = number("tile_ratio", minimum=0, strict=True)
+        fields["guide_tolerance"] = number("guide_tolerance", minimum=0)
+        fields["border_width"] = number("border_width", minimum=0, strict=True)
+        fields["border_radius"] = number("border_radius", minimum=0)
+        for key in FLAG_FIELDS:
+            fields[key] = preset_flag(preset, key)
+
+        for key in ("tracks_x", "tracks_y"):
+            fields[key] = str(preset.get(key, DEFAULT_PRESET[key]) or "").strip()
+            try:
+                parse_tracks(fields[key])
+            except ValueError as error:
+                errors.append("{0}: {1}".format(key, error))
+
+        fields["grid_type"] = preset.get("grid_type", DEFAULT_PRESET["grid_type"])
+        if fields["grid_type"] not in GRID_TYPES:
+            errors.append("unknown grid type: {0}".format(fields["grid_type"]))
+        fields["border_color"] = preset.get("border_color", DEFAULT_PRESET["border_color"])
+        try:
+            check_color(fields["border_color"])
+        except ValueError as error:
+            errors.append("border_color: {0}".format(error))
+
+        fields["subgrids"] = preset.get("subgrids", DEFAULT_PRESET["subgrids"]) or []
+        if not isinstance(fields["subgrids"], list):
+            errors.append("subgrids must be a list")
+        else:
+            for index, subgrid in enumerate(fields["subgrids"]):
+                try:
+                    cls.from_preset(subgrid.get("preset", {}), unit_labels)
+                except (AttributeError, ValueError) as error:
+                    errors.append("subgrid {0}: {1}".format(index, error))
+
+        if errors:
+            raise ValueError("Invalid preset: {0}".format("; ".join(errors)))
+        return cls(**fields)
+
+    def to_preset(self):
+        # Current (locale independent) preset schema
+        preset = {"version": PRESET_VERSION}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if isinstance(value, Length):
+                preset[name] = value.value
+                preset[name + "_unit"] = value.unit.value
+            else:
+                preset[name] = value
+        return preset
+
+    def resolve(self, doc_size_x, doc_size_y, doc_ppi, units=None):
+        # Layout spec in pixels for a document (see layout.SPEC_KEYS). units: DocumentUnits of the document, if already known.
+        units = units or DocumentUnits(doc_size_x, doc_size_y, doc_ppi)
+        factors_x, factors_y = units.factors_x, units.factors_y
+        return {
+            "margin_l": self.margin_l.value * factors_x[self.margin_l.unit],
+            "margin_r": self.margin_r.value * factors_x[self.margin_r.unit],
+            "margin_t": self.margin_t.value * factors_y[self.margin_t.unit],
+            "margin_b": self.margin_b.value * factors_y[self.margin_b.unit],
+            "gutter_x": self.gutter_x.value * factors_x[self.gutter_x.unit],
+            "gutter_y": self.gutter_y.value * factors_y[self.gutter_y.unit],
+            "num_tiles_x": self.num_tiles_x,
+            "num_tiles_y": self.num_tiles_y,
+            "tile_ratio": self.tile_ratio,
+            "pixel_aligned": self.pixel_aligned,
+            "tracks_x": self.tracks_x,
+            "tracks_y": self.tracks_y,
+            "subgrids": self.subgrids,
+            "doc_ppi": doc_ppi,
+            "grid_type": self.grid_type
+        }
@@ -0,0 +1,151 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Storyboard generator: creates the pages of a storyboard from a preset, either one document per page or a single
+# document with the pages stacked top to bottom, each panel getting its own paint layer with a selection mask
+# (so that painting stays within the panel).
+#
+# Example (from the Scripter), 24 A4 pages at 300 ppi saved in a folder:
+#     from tile_grid.storyboard import create_storyboard
+#     create_storyboard({"num_tiles_x": 2, "num_tiles_y": 3}, [(2480, 3508)] * 24, 300, directory="/path/to/episode")
+#
+# The layouts are planned up front, once per distinct page size (see plan.plan_storyboard). The layers of a page are
+# all created first, then inserted with one setChildNodes() call, and the projection is refreshed once per document.
+
+from krita import Krita, Selection
+import os, time
+
+from .annotation import store_grid
+from .api import apply_guides
+from .borders import add_border_layer
+from .overlays import CellGrid, add_overlay_layer
+from .plan import plan_storyboard
+from .spec import GridSpec, get_unit_labels
+from .timing import timer
+
+
+DEFAULT_DOCUMENT_NAME = "Storyboard"
+DEFAULT_PAGE_NAME_FORMAT = "{name} - page {page:03d}"
+DEFAULT_PAGE_GROUP_FORMAT = "Page {page}"
+DEFAULT_PANEL_NAME_FORMAT = "Panel {panel}"
+DEFAULT_MASK_NAME_FORMAT = "Panel {panel} selection"
+
+
+def create_storyboard(preset, page_sizes, doc_ppi=300.0, single_document=False, page_gap=0, name=DEFAULT_DOCUMENT_NAME,
+                      directory=None, panel_layers=True, selection_masks=True, show=True,
+                      color_model="RGBA", color_depth="U8", profile=""):
+    # Creates the storyboard documents and returns (documents, report).
+    # page_sizes: one (width, height) in pixels per page. With single_document, all the pages go into one document
+    # (page_gap pixels apart), the panel layers of each page being grouped; the pages must then have the same width.
+    # When directory is given, the documents are saved there as .kra files, listed in report["paths"]. When show is
+    # False, saved documents are closed and left out of documents (the others are left open and returned).
+    # Panel borders and hex or isometric cells are added as in the dialog, for documents holding a single page.
+    # Raises ValueError if the preset is invalid, the grid does not fit a page or single document pages have
+    # different columns.
+    start_time = time.perf_counter()
+    run = timer.start_run("create_storyboard", pages=len(page_sizes), single_document=single_document)
+    try:
+        grid_spec = GridSpec.from_preset(preset, get_unit_labels())
+        with timer.stage("plan"):
+            plans, layouts = plan_storyboard(grid_spec, [tuple(size) for size in page_sizes], doc_ppi, single_document, page_gap)
+        report = {"pages": len(page_sizes), "documents": len(plans), "layouts": len(layouts), "panels": 0, "paths": [],
+                  "plan_time": time.perf_counter() - start_time}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        app = Krita.instance()
+        window = app.activeWindow() if show else None
+        documents = []
+        for index, plan in enumerate(plans, 1):
+            doc_name = name if single_document else DEFAULT_PAGE_NAME_FORMAT.format(name=name, page=index)
+            with timer.stage("create_document"):
+                doc = app.createDocument(plan["doc_size_x"], plan["doc_size_y"], doc_name, color_model, color_depth, profile, doc_ppi)
+                doc.setBatchmode(True)
+
+            with timer.stage("guides"):
+                apply_guides(doc, plan["guides_x"], plan["guides_y"], grid_spec)
+                if not single_document:
+                    # A single page follows later resizes like any grid applied from the dialog
+                    store_grid(doc, grid_spec, plan["guides_x"], plan["guides_y"])
+
+            if panel_layers:
+                with timer.stage("panel_layers"):
+                    report["panels"] += add_panel_layers(doc, plan["pages"], selection_masks, grouped=single_document)
+
+            if not single_document:
+                with timer.stage("borders"):
+                    layout = plan["pages"][0]["layout"]
+                    if isinstance(layout, CellGrid):
+                        add_overlay_layer(doc, layout, grid_spec.border_width, grid_spec.border_color)
+                    elif grid_spec.panel_borders:
+                        # Pages of the same size share their layout, so the border SVG is only built once (see borders.py)
+                        add_border_layer(doc, layout, grid_spec.border_width, grid_spec.border_radius, grid_spec.border_color)
+
+            with timer.stage("refresh"):
+                doc.refreshProjection()
+                doc.setBatchmode(False)
+
+            if directory:
+                with timer.stage("save"):
+                    path = os.path.join(directory, doc_name + ".kra")
+                    if not doc.saveAs(path):
+                        raise IOError("Unable to save {0}".format(path))
+                    report["paths"].append(path)
+            if window is not None:
+                window.addView(doc)
+            elif not show and directory:
+                # A closed document can no longer be used
+                doc.close()
+                continue
+            documents.append(doc)
+
+        report["total_time"] = time.perf_counter() - start_time
+        run.set_info(**report)
+        return documents, report
+    finally:
+        timer.finish_run(run)
+
+
+def add_panel_layers(doc, pages, selection_masks=True, grouped=False):
+    # Adds one paint layer per panel of the pages (see plan.plan_storyboard), the first panel on top, each with a
+    # selection mask covering its panel. With grouped, the layers of each page go into a group layer.
+    # Returns the number of panels.
+    root = doc.rootNode()
+    top_nodes = []
+    num_panels = 0
+    for page_number, page in enumerate(pages, 1):
+        layers = []
+        for panel, (x, y, w, h, row, col) in enumerate(page["layout"].pixel_rects(), 1):
+            layer = doc.createNode(DEFAULT_PANEL_NAME_FORMAT.format(panel=panel, page=page_number, row=row + 1, col=col + 1), "paintlayer")
+            if selection_masks:
+                mask = create_selection_mask(doc, DEFAULT_MASK_NAME_FORMAT.format(panel=panel, page=page_number),
+                                             page["offset_x"] + x, page["offset_y"] + y, w, h)
+                layer.setChildNodes([mask])
+            layers.append(layer)
+        num_panels += len(layers)
+
+        # Nodes are listed bottom to top
+        layers.reverse()
+        if grouped:
+            group = doc.createNode(DEFAULT_PAGE_GROUP_FORMAT.format(page=page_number), "grouplayer")
+            group.setChildNodes(layers)
+            top_nodes.append(group)
+        else:
+            top_nodes.extend(layers)
+
+    if grouped:
+        top_nodes.reverse()
+    root.setChildNodes(root.childNodes() + top_nodes)
+    return num_panels
+
+
+def create_selection_mask(doc, name, x, y, w, h):
+    selection = Selection()
+    selection.select(x, y, w, h, 255)
+    if hasattr(doc, "createSelectionMask"):
+        mask = doc.createSelectionMask(name)
+    else:
+        # Older Krita versions
+        mask = doc.createNode(name, "selectionmask")
+    mask.setSelection(selection)
+    return mask
@@ -6,7 +6,7 @@
 from krita import (
         Extension
     )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtWidgets import (
         QCheckBox,
         QComboBox,
@@ -17,13 +17,30 @@ from PyQt5.QtWidgets import (
         QGridLayout,
         QGroupBox,
         QHBoxLayout,
+        QInputDialog,
         QLabel,
+        QLineEdit,
+        QMenu,
         QMessageBox,
         QPushButton,
         QSpinBox,
         QVBoxLayout
     )
-import os, json
+import os, json, time
+
+from .annotation import GridWatcher, load_grid, store_grid
+from .autofit import auto_fit, default_gutter_candidates
+from .borders import add_border_layer
+from .export import export_tiles
+from .guides import merge_guides
+from .infer import infer_verified_grid
+from .library import PresetLibrary, background_writer, dump_json
+from .layout import compute_layout, evaluate_max_tile_size, evaluate_max_tile_size_axis
+from .overlays import GRID_HEX_FLAT, GRID_HEX_POINTY, GRID_ISOMETRIC, GRID_RECT, CellGrid, add_overlay_layer
+from .preview import TileGridPreview
+from .timing import timer
+from .spec import DEFAULT_BORDER_COLOR, LENGTH_FIELDS, UNIT_DISPLAY_LABELS, DocumentUnits, GridSpec, Length, Unit
+from .tracks import parse_tracks
 
 
 PLUGIN_VERSION = '0.1.3'
@@ -32,9 +49,63 @@ EXTENSION_ID = 'pykrita_tile_grid'
 PLUGIN_MENU_ENTRY = i18n('Tile Grid')
 PLUGIN_DIALOG_TITLE = i18n("{0} - {1}".format(i18n('Tile Grid'), PLUGIN_VERSION))
 
+# Axis affected by each editable field
+FIELD_AXIS = {
+    "margin_l": "x",
+    "margin_r": "x",
+    "gutter_x": "x",
+    "num_tiles_x": "x",
+    "tracks_x": "x",
+    "margin_t": "y",
+    "margin_b": "y",
+    "gutter_y": "y",
+    "num_tiles_y": "y",
+    "tracks_y": "y"
+}
+
+# Parsed JSON files, keyed by path, along with the modification time they were read at
+_json_cache = {}
+
+
+def load_json_cached(path):
+    # Only re-reads the file when its modification time changed. Raises FileNotFoundError like open().
+    mtime = os.stat(path).st_mtime_ns
+    cached = _json_cache.get(path)
+    if cached is not None and cached[0] in (mtime, None):
+        # Saved by save_json_cached() (None): the file has this data, or will once written
+        _json_cache[path] = (mtime, cached[1])
+        return cached[1]
+    with open(path, 'r') as file:
+        data = json.load(file)
+    _json_cache[path] = (mtime, data)
+    background_writer.remember(path, dump_json(data))
+    return data
+
+
+def save_json_cached(path, data):
+    # Written atomically in the background, and only if the content changed
+    if background_writer.write(path, dump_json(data)):
+        _json_cache[path] = (None, data)
+
+
+class LengthField:
+    # Spinbox and unit combobox of a margin or gutter, along with the unit the spinbox value is currently in
+    __slots__ = ("sbox", "cbox", "axis", "unit")
+
+    def __init__(self, sbox, cbox, axis):
+        self.sbox = sbox
+        self.cbox = cbox
+        self.axis = axis
+        self.unit = Unit(cbox.currentData())
+
+    def pixels(self, units):
+        return units.to_pixels(self.sbox.value(), self.unit, self.axis)
+
+
 class TileGridDialog(QDialog):
-    def __init__(self, doc_size_x, doc_size_y, doc_ppi):
-        super().__init__()
+    def __init__(self, doc_size_x, doc_size_y, doc_ppi, parent=None):
+        start_time = time.perf_counter()
+        super().__init__(parent)
         self.setWindowTitle(PLUGIN_DIALOG_TITLE)
         
         # Resolution in pixels per inch
@@ -45,25 +116,11 @@ class TileGridDialog(QDialog):
         # Default values
         self.LAST_PRESET_FILENAME = "krita_tile_grid_plugin_last_preset"
 
-        self.UNIT_PX = i18n("Pixels (px)")
-        self.UNIT_IN = i18n("Inches (in)")
-        self.UNIT_CM = i18n("Centimeter (cm)")
-        self.UNIT_PC = i18n("Percentage (%)")
-        self.UNITS = [self.UNIT_PX, self.UNIT_IN, self.UNIT_CM, self.UNIT_PC]
-
-        self.DEFAULT_MARGIN_L_PC = 10.0
-        self.DEFAULT_MARGIN_R_PC = 10.0
-        self.DEFAULT_MARGIN_T_PC = 15.0
-        self.DEFAULT_MARGIN_B_PC = 15.0
-        self.DEFAULT_GUTTER_X_PC = 2.5
-        self.DEFAULT_GUTTER_Y_PC = 2.5
-        self.DEFAULT_NUM_TILES_X = 3
-        self.DEFAULT_NUM_TILES_Y = 3
-        self.DEFAULT_TILE_RATIO = 1.78
-        self.DEFAULT_CLEAR_GUIDES = False
-        self.DEFAULT_LOCK_GUIDES = True
-        self.DEFAULT_SNAP_GUIDES = True
         self.DEFAULT_MIN_SPINBOX_WIDTH = 80
+        self.DEFAULT_RECOMPUTE_DELAY_MS = 50
+
+        # Pixel factors of the units for the current document
+        self.units = DocumentUnits(doc_size_x, doc_size_y, doc_ppi)
 
         self.layout = QVBoxLayout()
         
@@ -80,12 +137,22 @@ class TileGridDialog(QDialog):
         self.gutter_x_unit = QComboBox()
         self.gutter_y = QDoubleSpinBox()
         self.gutter_y_unit = QComboBox()
+        self.grid_type = QComboBox()
         self.num_tiles_x = QSpinBox()
         self.num_tiles_y = QSpinBox()
         self.tile_ratio = QDoubleSpinBox()
+        self.tracks_x = QLineEdit()
+        self.tracks_y = QLineEdit()
+        self.auto_fit_button = QPushButton(i18n("Auto-Fit"))
         self.clear_guides = QCheckBox(i18n("Clear guides"))
         self.lock_guides = QCheckBox(i18n("Lock guides"))
         self.snap_guides = QCheckBox(i18n("Snap to guides"))
+        self.export_tiles = QCheckBox(i18n("Export tiles"))
+        self.pixel_aligned = QCheckBox(i18n("Pixel-aligned"))
+        self.guide_tolerance = QDoubleSpinBox()
+        self.panel_borders = QCheckBox(i18n("Panel borders"))
+        self.border_width = QDoubleSpinBox()
+        self.border_radius = QDoubleSpinBox()
 
         self.margin_l.setMinimum(0)
         self.margin_r.setMinimum(0)
@@ -93,15 +160,22 @@ class TileGridDialog(QDialog):
         self.margin_b.setMinimum(0)
         self.gutter_x.setMinimum(0)
         self.gutter_y.setMinimum(0)
-        self.num_tiles_x.setMinimum(1)
-        self.num_tiles_y.setMinimum(1)
+        self.num_tiles_x.setRange(1, 1000)
+        self.num_tiles_y.setRange(1, 1000)
         self.tile_ratio.setDecimals(3)
         self.tile_ratio.setSingleStep(0.01)
         self.tile_ratio.setMinimum(0.01)
+        self.guide_tolerance.setDecimals(3)
+        self.guide_tolerance.setSingleStep(0.01)
+        self.guide_tolerance.setRange(0.0, 1.0)
+        self.border_width.setRange(0.1, 1000.0)
+        self.border_radius.setRange(0.0, 1000.0)
 
         self.num_tiles_x.setMinimumWidth(self.DEFAULT_MIN_SPINBOX_WIDTH)
         self.num_tiles_y.setMinimumWidth(self.DEFAULT_MIN_SPINBOX_WIDTH)
         self.tile_ratio.setMinimumWidth(self.DEFAULT_MIN_SPINBOX_WIDTH)
+        self.tracks_x.setPlaceholderText(i18n("e.g. 1, 2, 300px, 1[100:400]"))
+        self.tracks_y.setPlaceholderText(i18n("e.g. 1, 2, 300px, 1[100:400]"))
 
         self.margin_l.setAlignment(Qt.AlignRight)
         self.margin_r.setAlignment(Qt.AlignRight)
@@ -112,6 +186,9 @@ class TileGridDialog(QDialog):
         self.num_tiles_x.setAlignment(Qt.AlignRight)
         self.num_tiles_y.setAlignment(Qt.AlignRight)
         self.tile_ratio.setAlignment(Qt.AlignRight)
+        self.guide_tolerance.setAlignment(Qt.AlignRight)
+        self.border_width.setAlignment(Qt.AlignRight)
+        self.border_radius.setAlignment(Qt.AlignRight)
 
         self.margin_l.setToolTip(i18n("Set the left margin size"))
         self.margin_l_unit.setToolTip(i18n("Select the unit for the left margin size"))
@@ -125,27 +202,36 @@ class TileGridDialog(QDialog):
         self.gutter_x_unit.setToolTip(i18n("Select the unit for the minimum horizontal gutter size"))
         self.gutter_y.setToolTip(i18n("Set the minimum size for the vertical gutters"))
         self.gutter_y_unit.setToolTip(i18n("Select the unit for the minimum vertical gutter size"))
+        self.grid_type.setToolTip(i18n("Select the shape of the tiles. Hex and isometric grids are drawn on a vector layer instead of guides."))
         self.num_tiles_x.setToolTip(i18n("Set the number of tiles horizontally"))
         self.num_tiles_y.setToolTip(i18n("Set the number of tiles vertically"))
         self.tile_ratio.setToolTip(i18n("Set the tile format ratio (width/height)"))
+        self.tracks_x.setToolTip(i18n("Optional column widths, separated by commas: a weight (2), a size in pixels (300px), or a weight with a minimum and maximum size in pixels (1[100:400]). Overrides the number of columns and the format ratio."))
+        self.tracks_y.setToolTip(i18n("Optional row heights, separated by commas: a weight (2), a size in pixels (300px), or a weight with a minimum and maximum size in pixels (1[100:400]). Overrides the number of rows and the format ratio."))
+        self.auto_fit_button.setToolTip(i18n("Suggest numbers of columns and rows, and gutters, that best fit the format ratio"))
         self.clear_guides.setToolTip(i18n("Clear existing guides before adding new ones"))
         self.lock_guides.setToolTip(i18n("Lock guides so they are not accidentally moved"))
         self.snap_guides.setToolTip(i18n("Toggle the 'View > Snap To... > Snap to Guides' option"))
-
-        # Fill the comboboxes with the units
-        self.margin_l_unit.addItems(self.UNITS)
-        self.margin_r_unit.addItems(self.UNITS)
-        self.margin_t_unit.addItems(self.UNITS)
-        self.margin_b_unit.addItems(self.UNITS)
-        self.gutter_x_unit.addItems(self.UNITS)
-        self.gutter_y_unit.addItems(self.UNITS)
-
-        self.margin_l_params = {"sbox": self.margin_l, "cbox": self.margin_l_unit, "idx": -1, "doc_size": self.doc_size_x}
-        self.margin_r_params = {"sbox": self.margin_r, "cbox": self.margin_r_unit, "idx": -1, "doc_size": self.doc_size_x}
-        self.margin_t_params = {"sbox": self.margin_t, "cbox": self.margin_t_unit, "idx": -1, "doc_size": self.doc_size_y}
-        self.margin_b_params = {"sbox": self.margin_b, "cbox": self.margin_b_unit, "idx": -1, "doc_size": self.doc_size_y}
-        self.gutter_x_params = {"sbox": self.gutter_x, "cbox": self.gutter_x_unit, "idx": -1, "doc_size": self.doc_size_x}
-        self.gutter_y_params = {"sbox": self.gutter_y, "cbox": self.gutter_y_unit, "idx": -1, "doc_size": self.doc_size_y}
+        self.export_tiles.setToolTip(i18n("Save each tile of the merged image as a PNG file"))
+        self.pixel_aligned.setToolTip(i18n("Place every tile edge on a whole pixel, with identical tile sizes"))
+        self.guide_tolerance.setToolTip(i18n("Guides closer than this distance (in pixels) are merged into a single guide"))
+        self.panel_borders.setToolTip(i18n("Add a vector layer with a border around each tile"))
+        self.border_width.setToolTip(i18n("Set the width of the panel borders and of the hex or isometric cell outlines (in pixels)"))
+        self.border_radius.setToolTip(i18n("Set the corner radius of the panel borders (in pixels)"))
+
+        # Grid types are stored in presets by key, whatever the language
+        self.grid_type.addItem(i18n("Rectangular"), GRID_RECT)
+        self.grid_type.addItem(i18n("Hex (pointy top)"), GRID_HEX_POINTY)
+        self.grid_type.addItem(i18n("Hex (flat top)"), GRID_HEX_FLAT)
+        self.grid_type.addItem(i18n("Isometric (2:1)"), GRID_ISOMETRIC)
+
+        # Fill the comboboxes with the units, stored by key whatever the language
+        self.length_fields = {}
+        for name, axis in LENGTH_FIELDS:
+            cbox = getattr(self, name + "_unit")
+            for unit in Unit:
+                cbox.addItem(i18n(UNIT_DISPLAY_LABELS[unit]), unit.value)
+            self.length_fields[name] = LengthField(getattr(self, name), cbox, axis)
 
         # Create a grid layout to organize the fields
         self.margin_grid_layout = QGridLayout()
@@ -173,6 +259,7 @@ class TileGridDialog(QDialog):
         self.margin_grid_gbox.setLayout(self.margin_grid_layout)
 
         self.tile_grid_layout = QHBoxLayout()
+        self.tile_grid_layout.addWidget(self.grid_type)
         self.tile_grid_layout.addWidget(QLabel(i18n("Columns")))
         self.tile_grid_layout.addWidget(self.num_tiles_x)
         self.tile_grid_layout.addStretch()
@@ -181,40 +268,100 @@ class TileGridDialog(QDialog):
         self.tile_grid_layout.addStretch()
         self.tile_grid_layout.addWidget(QLabel(i18n("Format ratio (w/h)")))
         self.tile_grid_layout.addWidget(self.tile_ratio)
-
-        # Surround tile_grid_layout by a frame
+        self.tile_grid_layout.addWidget(self.auto_fit_button)
+        self.tile_grid_layout.addWidget(self.pixel_aligned)
+
+        # Non-uniform columns and rows
+        self.tracks_layout = QHBoxLayout()
+        self.tracks_layout.addWidget(QLabel(i18n("Column tracks")))
+        self.tracks_layout.addWidget(self.tracks_x)
+        self.tracks_layout.addWidget(QLabel(i18n("Row tracks")))
+        self.tracks_layout.addWidget(self.tracks_y)
+
+        # Vector panel borders
+        self.borders_layout = QHBoxLayout()
+        self.borders_layout.addWidget(self.panel_borders)
+        self.borders_layout.addStretch()
+        self.borders_layout.addWidget(QLabel(i18n("Border width (px)")))
+        self.borders_layout.addWidget(self.border_width)
+        self.borders_layout.addWidget(QLabel(i18n("Corner radius (px)")))
+        self.borders_layout.addWidget(self.border_radius)
+
+        # Surround tile_grid_layout, tracks_layout and borders_layout by a frame
+        self.tiles_layout = QVBoxLayout()
+        self.tiles_layout.addLayout(self.tile_grid_layout)
+        self.tiles_layout.addLayout(self.tracks_layout)
+        self.tiles_layout.addLayout(self.borders_layout)
         self.tile_grid_gbox = QGroupBox(i18n("Tiles"))
-        self.tile_grid_gbox.setLayout(self.tile_grid_layout)
-
-        # Add save and load buttons
+        self.tile_grid_gbox.setLayout(self.tiles_layout)
+
+        # Live preview of the layout. Nested grids (only editable in presets) are expanded down to the levels shown.
+        self.preview = TileGridPreview()
+        self.preview.setToolTip(i18n("Preview of the document, margins and tiles"))
+        self.preview_depth = QSpinBox()
+        self.preview_depth.setRange(-1, 16)
+        self.preview_depth.setValue(-1)
+        self.preview_depth.setSpecialValueText(i18n("All"))
+        self.preview_depth.setToolTip(i18n("Number of nested grid levels shown in the preview"))
+        self.preview_depth.valueChanged.connect(lambda value: self.update_preview())
+        self.preview_depth_layout = QHBoxLayout()
+        self.preview_depth_layout.addStretch()
+        self.preview_depth_layout.addWidget(QLabel(i18n("Nested levels")))
+        self.preview_depth_layout.addWidget(self.preview_depth)
+        self.preview_layout = QVBoxLayout()
+        self.preview_layout.addWidget(self.preview)
+        self.preview_layout.addLayout(self.preview_depth_layout)
+        self.preview_gbox = QGroupBox(i18n("Preview"))
+        self.preview_gbox.setLayout(self.preview_layout)
+
+        # Add the preset library, and the save, import, delete and default buttons
+        self.library = PresetLibrary()
+        self.preset_combo = QComboBox()
         self.save_button = QPushButton(i18n("Save Preset"))
-        self.load_button = QPushButton(i18n("Load Preset"))
+        self.load_button = QPushButton(i18n("Import Preset"))
+        self.delete_button = QPushButton(i18n("Delete Preset"))
         self.default_button = QPushButton(i18n("Default"))
 
-        self.save_button.setToolTip(i18n("Save current settings as a preset"))
-        self.load_button.setToolTip(i18n("Load settings from a preset"))
+        self.preset_combo.setMinimumWidth(160)
+        self.preset_combo.setToolTip(i18n("Switch to a preset of the library"))
+        self.save_button.setToolTip(i18n("Save current settings as a preset of the library"))
+        self.load_button.setToolTip(i18n("Add a preset file to the library and load it"))
+        self.delete_button.setToolTip(i18n("Remove the selected preset from the library"))
         self.default_button.setToolTip(i18n("Restore default settings"))
 
+        self.auto_fit_button.clicked.connect(self.show_auto_fit)
+        self.preset_combo.activated.connect(self.on_library_preset_activated)
         self.save_button.clicked.connect(self.save_preset)
         self.load_button.clicked.connect(self.load_preset)
+        self.delete_button.clicked.connect(self.delete_preset)
         self.default_button.clicked.connect(self.default_preset)
 
         self.preset_layout = QHBoxLayout()
+        self.preset_layout.addWidget(self.preset_combo)
         self.preset_layout.addWidget(self.save_button)
         self.preset_layout.addWidget(self.load_button)
+        self.preset_layout.addWidget(self.delete_button)
         self.preset_layout.addWidget(self.default_button)
         self.preset_layout.addStretch()
 
         self.checkbox_layout = QHBoxLayout()
         self.checkbox_layout.addStretch()
+        self.checkbox_layout.addWidget(QLabel(i18n("Merge tolerance (px)")))
+        self.checkbox_layout.addWidget(self.guide_tolerance)
         self.checkbox_layout.addWidget(self.clear_guides, Qt.AlignRight)
         self.checkbox_layout.addWidget(self.lock_guides, Qt.AlignRight)
         self.checkbox_layout.addWidget(self.snap_guides, Qt.AlignRight)
+        self.checkbox_layout.addWidget(self.export_tiles, Qt.AlignRight)
 
         self.mix_layout = QHBoxLayout()
         self.mix_layout.addLayout(self.preset_layout)
         self.mix_layout.addLayout(self.checkbox_layout)
 
+        # Timings of the last grid application, when timing is on (see timing.py)
+        self.timing_label = QLabel()
+        self.timing_label.setWordWrap(True)
+        self.timing_label.setToolTip(i18n("Time spent in each stage of the last grid application"))
+
         self.dlg_buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         self.dlg_buttons.accepted.connect(self.on_accept)
         self.dlg_buttons.rejected.connect(self.reject)
@@ -224,7 +371,9 @@ class TileGridDialog(QDialog):
 
         self.layout.addWidget(self.margin_grid_gbox)
         self.layout.addWidget(self.tile_grid_gbox)
+        self.layout.addWidget(self.preview_gbox)
         self.layout.addLayout(self.mix_layout)
+        self.layout.addWidget(self.timing_label)
         self.layout.addLayout(self.dlg_button_layout)
 
         self.setLayout(self.layout)
@@ -239,53 +388,159 @@ class TileGridDialog(QDialog):
         self.ret_num_tiles_x = 0
         self.ret_num_tiles_y = 0
         self.ret_tile_ratio = 0
+        self.ret_tracks_x = ""
+        self.ret_tracks_y = ""
+        self.subgrids = []
+        self.border_color = DEFAULT_BORDER_COLOR
+
+        # Maximum tile size of each axis, only re-evaluated for the axis whose fields changed
+        self.max_tile_size_x = 0
+        self.max_tile_size_y = 0
+
+        # Fields changed since the last recompute. Changes are coalesced behind a short debounce timer.
+        self.dirty_fields = set()
+        self.recompute_count = 0
+        self.skipped_recomputes = 0
+        self.recompute_timer = QTimer(self)
+        self.recompute_timer.setSingleShot(True)
+        self.recompute_timer.setInterval(self.DEFAULT_RECOMPUTE_DELAY_MS)
+        self.recompute_timer.timeout.connect(self.update_tile_ratio)
 
         # Load the last used preset on initialization
+        self.update_library_presets()
         self.load_last_preset()
         self.update_return_values()
+        self.update_timing_summary()
 
         # Connect the comboboxes to on_combobox_index_changed with an indirection to allow more parameters
-        self.margin_l_unit.currentIndexChanged.connect(lambda new_idx, params=self.margin_l_params: self.on_combobox_index_changed(new_idx, params))
-        self.margin_r_unit.currentIndexChanged.connect(lambda new_idx, params=self.margin_r_params: self.on_combobox_index_changed(new_idx, params))
-        self.margin_t_unit.currentIndexChanged.connect(lambda new_idx, params=self.margin_t_params: self.on_combobox_index_changed(new_idx, params))
-        self.margin_b_unit.currentIndexChanged.connect(lambda new_idx, params=self.margin_b_params: self.on_combobox_index_changed(new_idx, params))
-        self.gutter_x_unit.currentIndexChanged.connect(lambda new_idx, params=self.gutter_x_params: self.on_combobox_index_changed(new_idx, params))
-        self.gutter_y_unit.currentIndexChanged.connect(lambda new_idx, params=self.gutter_y_params: self.on_combobox_index_changed(new_idx, params))
-
-        # Connect the gutter spinboxes to calculate the time ratio
-        self.margin_l.valueChanged.connect(self.update_tile_ratio)
-        self.margin_r.valueChanged.connect(self.update_tile_ratio)
-        self.margin_t.valueChanged.connect(self.update_tile_ratio)
-        self.margin_b.valueChanged.connect(self.update_tile_ratio)
-        self.gutter_x.valueChanged.connect(self.update_tile_ratio)
-        self.gutter_y.valueChanged.connect(self.update_tile_ratio)
-        self.num_tiles_x.valueChanged.connect(self.update_tile_ratio)
-        self.num_tiles_y.valueChanged.connect(self.update_tile_ratio)
-
-    def update_tile_ratio(self, value):
+        for field in self.length_fields.values():
+            field.cbox.currentIndexChanged.connect(lambda new_idx, field=field: self.on_combobox_index_changed(new_idx, field))
+
+        # Connect the spinboxes to calculate the tile ratio
+        self.margin_l.valueChanged.connect(lambda value: self.on_field_changed("margin_l"))
+        self.margin_r.valueChanged.connect(lambda value: self.on_field_changed("margin_r"))
+        self.margin_t.valueChanged.connect(lambda value: self.on_field_changed("margin_t"))
+        self.margin_b.valueChanged.connect(lambda value: self.on_field_changed("margin_b"))
+        self.gutter_x.valueChanged.connect(lambda value: self.on_field_changed("gutter_x"))
+        self.gutter_y.valueChanged.connect(lambda value: self.on_field_changed("gutter_y"))
+        self.num_tiles_x.valueChanged.connect(lambda value: self.on_field_changed("num_tiles_x"))
+        self.num_tiles_y.valueChanged.connect(lambda value: self.on_field_changed("num_tiles_y"))
+        self.tile_ratio.valueChanged.connect(lambda value: self.on_field_changed("tile_ratio"))
+        self.pixel_aligned.stateChanged.connect(lambda state: self.on_field_changed("pixel_aligned"))
+        self.tracks_x.textChanged.connect(lambda text: self.on_field_changed("tracks_x"))
+        self.grid_type.currentIndexChanged.connect(lambda index: self.on_field_changed("grid_type"))
+        self.tracks_y.textChanged.connect(lambda text: self.on_field_changed("tracks_y"))
+
+        # Time spent building the dialog, and refreshing it for a new invocation (in seconds), also recorded as
+        # stages of the current timing run (see timing.py)
+        self.construction_time = time.perf_counter() - start_time
+        self.refresh_time = 0
+        timer.record("dialog_construction", self.construction_time)
+
+    def set_document(self, doc_size_x, doc_size_y, doc_ppi):
+        # Refreshes a persistent dialog for a new invocation, instead of building a new one
+        start_time = time.perf_counter()
+        self.doc_size_x = doc_size_x
+        self.doc_size_y = doc_size_y
+        self.doc_ppi = doc_ppi
+        self.units = DocumentUnits(doc_size_x, doc_size_y, doc_ppi)
+
+        # Like a new dialog, start from the last used preset (read from memory unless the file changed).
+        # Exporting is a one-shot action and is not part of the preset.
+        self.export_tiles.setChecked(False)
+        self.update_library_presets()
+        self.load_last_preset()
         self.update_return_values()
-        max_tile_size_x, max_tile_size_y = self.evaluate_max_tile_size()
-        tile_ratio = max_tile_size_x / max_tile_size_y
-        if self.tile_ratio.value() != tile_ratio:
-            self.tile_ratio.setValue(tile_ratio)
+        self.update_timing_summary()
+        self.refresh_time = time.perf_counter() - start_time
+        timer.record("dialog_refresh", self.refresh_time)
+
+    def update_timing_summary(self):
+        self.timing_label.setVisible(timer.enabled and timer.last_run is not None)
+        if timer.enabled and timer.last_run is not None:
+            self.timing_label.setText(i18n("Last run: {0}").format(timer.last_run.summary()))
+
+    def on_field_changed(self, field):
+        # A recompute is already pending: this change will be handled by it
+        if self.recompute_timer.isActive():
+            self.skipped_recomputes += 1
+        self.dirty_fields.add(field)
+        self.recompute_timer.start()
+
+    def update_tile_ratio(self):
+        # The latency of field changes, once debounced
+        with timer.stage("field_change"):
+            self._update_tile_ratio()
+
+    def _update_tile_ratio(self):
+        self.recompute_timer.stop()
+        dirty_fields, self.dirty_fields = self.dirty_fields, set()
+        if not dirty_fields:
+            return
+        self.recompute_count += 1
+
+        # Only convert the changed fields, and only re-evaluate the axes they belong to
+        for field in dirty_fields:
+            self.update_return_value(field)
+        dirty_axes = {FIELD_AXIS.get(field) for field in dirty_fields}
+        if "x" in dirty_axes:
+            self.max_tile_size_x = evaluate_max_tile_size_axis(self.doc_size_x, self.ret_margin_l_px, self.ret_margin_r_px, self.ret_gutter_x_px, self.ret_num_tiles_x)
+        if "y" in dirty_axes:
+            self.max_tile_size_y = evaluate_max_tile_size_axis(self.doc_size_y, self.ret_margin_t_px, self.ret_margin_b_px, self.ret_gutter_y_px, self.ret_num_tiles_y)
+
+        # Only the geometry fields change the optimal tile ratio. The ratio spinbox is updated without
+        # emitting valueChanged, so that it does not schedule another recompute.
+        if dirty_axes - {None} and self.max_tile_size_x > 0 and self.max_tile_size_y > 0:
+            tile_ratio = self.max_tile_size_x / self.max_tile_size_y
+            if self.tile_ratio.value() != round(tile_ratio, self.tile_ratio.decimals()):
+                self.tile_ratio.blockSignals(True)
+                self.tile_ratio.setValue(tile_ratio)
+                self.tile_ratio.blockSignals(False)
+        self.ret_tile_ratio = self.tile_ratio.value()
+        self.update_preview()
+
+    def update_preview(self):
+        if self.max_tile_size_x <= 0 or self.max_tile_size_y <= 0 or self.ret_tile_ratio <= 0:
+            self.preview.set_tile_layout(None)
+            return
+        spec = self.get_layout_spec()
+        if self.preview_depth.value() >= 0:
+            spec["max_depth"] = self.preview_depth.value()
+        try:
+            self.preview.set_tile_layout(compute_layout(spec, self.doc_size_x, self.doc_size_y))
+        except ValueError:
+            # Tracks being typed, or that do not fit
+            self.preview.set_tile_layout(None)
 
     def evaluate_max_tile_size(self):
-        tile_size_x = (self.doc_size_x - self.ret_margin_l_px - self.ret_margin_r_px - (self.ret_num_tiles_x - 1) * self.ret_gutter_x_px) / self.ret_num_tiles_x
-        tile_size_y = (self.doc_size_y - self.ret_margin_t_px - self.ret_margin_b_px - (self.ret_num_tiles_y - 1) * self.ret_gutter_y_px) / self.ret_num_tiles_y
-        return tile_size_x, tile_size_y
-
-    def on_combobox_index_changed(self, new_idx, params):
-        #QMessageBox.information(None, PLUGIN_DIALOG_TITLE, f"Combobox index changed to {str(new_idx)}, old index {str(params["idx"])}, size {str(params["doc_size"])}")
-        old_val = params["sbox"].value()
-        old_unit = params["cbox"].itemText(params["idx"])
-        doc_size = params["doc_size"]
-        old_val_px = self.convert_value_to_pixels(old_val, old_unit, doc_size)
-
-        params["idx"] = new_idx
-        self.update_sbox_range(params)
-        new_unit = params["cbox"].currentText()
-        new_val = self.convert_pixels_to_value(old_val_px, new_unit, doc_size)
-        params["sbox"].setValue(new_val)
+        return evaluate_max_tile_size(self.get_layout_spec(), self.doc_size_x, self.doc_size_y)
+
+    def get_layout_spec(self):
+        # Spec expected by the layout engine (all sizes in pixels)
+        return {
+            "margin_l": self.ret_margin_l_px,
+            "margin_r": self.ret_margin_r_px,
+            "margin_t": self.ret_margin_t_px,
+            "margin_b": self.ret_margin_b_px,
+            "gutter_x": self.ret_gutter_x_px,
+            "gutter_y": self.ret_gutter_y_px,
+            "num_tiles_x": self.ret_num_tiles_x,
+            "num_tiles_y": self.ret_num_tiles_y,
+            "tile_ratio": self.ret_tile_ratio,
+            "pixel_aligned": self.pixel_aligned.isChecked(),
+            "tracks_x": self.ret_tracks_x,
+            "tracks_y": self.ret_tracks_y,
+            "subgrids": self.subgrids,
+            "doc_ppi": self.doc_ppi,
+            "grid_type": self.grid_type.currentData()
+        }
+
+    def on_combobox_index_changed(self, new_idx, field):
+        # Keep the same size in pixels, expressed in the new unit
+        value_px = field.pixels(self.units)
+        field.unit = Unit(field.cbox.itemData(new_idx))
+        self.update_sbox_range(field)
+        field.sbox.setValue(self.units.from_pixels(value_px, field.unit, field.axis))
 
     def on_accept(self):
         self.save_last_preset(self.get_current_preset())
@@ -315,272 +570,379 @@ class TileGridDialog(QDialog):
                 self.margin_b.setStyleSheet("")
                 self.gutter_x.setStyleSheet("")
                 self.gutter_y.setStyleSheet("")
+            elif not self.check_tracks():
+                QMessageBox.warning(None, PLUGIN_DIALOG_TITLE, i18n("The column or row tracks indicated in red are invalid or do not fit the document size."))
+                self.tracks_x.setStyleSheet("")
+                self.tracks_y.setStyleSheet("")
             else:
                 self.accept()
 
+    def check_tracks(self):
+        # Highlights the track fields in red if they cannot be parsed, or if the tracks do not fit
+        valid = True
+        for field in (self.tracks_x, self.tracks_y):
+            try:
+                parse_tracks(field.text())
+            except ValueError:
+                field.setStyleSheet("color: red;")
+                valid = False
+        if valid and (self.ret_tracks_x or self.ret_tracks_y):
+            try:
+                compute_layout(self.get_layout_spec(), self.doc_size_x, self.doc_size_y)
+            except ValueError:
+                self.tracks_x.setStyleSheet("color: red;")
+                self.tracks_y.setStyleSheet("color: red;")
+                valid = False
+        return valid
+
+    def update_library_presets(self, current=None):
+        # Lists the presets of the library (re-reading the index only if it changed on disk)
+        self.library.reload()
+        self.preset_combo.blockSignals(True)
+        self.preset_combo.clear()
+        self.preset_combo.addItems(self.library.names())
+        self.preset_combo.setCurrentIndex(self.preset_combo.findText(current) if current else -1)
+        self.preset_combo.blockSignals(False)
+        self.delete_button.setEnabled(len(self.library) > 0)
+
+    def on_library_preset_activated(self, index):
+        name = self.preset_combo.itemText(index)
+        try:
+            self.apply_grid_spec(self.library.load(name))
+        except (KeyError, OSError, ValueError) as error:
+            QMessageBox.warning(None, PLUGIN_DIALOG_TITLE, i18n("Cannot load the preset {0}: {1}").format(name, error))
+            self.update_library_presets()
+
     def save_preset(self):
-        options = QFileDialog.Options()
-        file_name, _ = QFileDialog.getSaveFileName(self, i18n("Save Preset"), "", "JSON Files (*.json);;All Files (*)", options=options)
-        if file_name:
-            preset = self.get_current_preset()
-            with open(file_name, 'w') as file:
-                json.dump(preset, file)
+        name, ok = QInputDialog.getText(self, i18n("Save Preset"), i18n("Preset name:"), text=self.preset_combo.currentText())
+        name = name.strip()
+        if ok and name:
+            if name in self.library and name != self.preset_combo.currentText():
+                answer = QMessageBox.question(None, PLUGIN_DIALOG_TITLE, i18n("Replace the preset {0}?").format(name))
+                if answer != QMessageBox.Yes:
+                    return
+            self.library.save(name, self.get_grid_spec())
+            self.update_library_presets(name)
 
     def load_preset(self):
         options = QFileDialog.Options()
-        file_name, _ = QFileDialog.getOpenFileName(self, i18n("Load Preset"), "", "JSON Files (*.json);;All Files (*)", options=options)
+        file_name, _ = QFileDialog.getOpenFileName(self, i18n("Import Preset"), "", "JSON Files (*.json);;All Files (*)", options=options)
         if file_name:
-            with open(file_name, 'r') as file:
-                preset = json.load(file)
-                self.apply_preset(preset)
+            try:
+                name = self.library.import_file(file_name)
+            except (OSError, ValueError) as error:
+                QMessageBox.warning(None, PLUGIN_DIALOG_TITLE, str(error))
+            else:
+                self.apply_grid_spec(self.library.load(name))
+                self.update_library_presets(name)
+
+    def delete_preset(self):
+        name = self.preset_combo.currentText()
+        if name in self.library:
+            answer = QMessageBox.question(None, PLUGIN_DIALOG_TITLE, i18n("Delete the preset {0}?").format(name))
+            if answer == QMessageBox.Yes:
+                self.library.delete(name)
+                self.update_library_presets()
 
     def default_preset(self):
-        self.apply_preset({
-            "margin_l": str(self.DEFAULT_MARGIN_L_PC),
-            "margin_l_unit": self.UNIT_PC,
-            "margin_r": str(self.DEFAULT_MARGIN_R_PC),
-            "margin_r_unit": self.UNIT_PC,
-            "margin_t": str(self.DEFAULT_MARGIN_T_PC),
-            "margin_t_unit": self.UNIT_PC,
-            "margin_b": str(self.DEFAULT_MARGIN_B_PC),
-            "margin_b_unit": self.UNIT_PC,
-            "gutter_x": str(self.DEFAULT_GUTTER_X_PC),
-            "gutter_x_unit": self.UNIT_PC,
-            "gutter_y": str(self.DEFAULT_GUTTER_Y_PC),
-            "gutter_y_unit": self.UNIT_PC,
-            "num_tiles_x": str(self.DEFAULT_NUM_TILES_X),
-            "num_tiles_y": str(self.DEFAULT_NUM_TILES_Y),
-            "tile_ratio": str(self.DEFAULT_TILE_RATIO),
-            "clear_guides": str(self.DEFAULT_CLEAR_GUIDES),
-            "lock_guides": str(self.DEFAULT_LOCK_GUIDES),
-            "snap_guides": str(self.DEFAULT_SNAP_GUIDES)
-        })
+        self.apply_grid_spec(GridSpec())
 
     def get_current_preset(self):
-        return {
-            "margin_l": self.margin_l.value(),
-            "margin_l_unit": self.margin_l_unit.currentText(),
-            "margin_r": self.margin_r.value(),
-            "margin_r_unit": self.margin_r_unit.currentText(),
-            "margin_t": self.margin_t.value(),
-            "margin_t_unit": self.margin_t_unit.currentText(),
-            "margin_b": self.margin_b.value(),
-            "margin_b_unit": self.margin_b_unit.currentText(),
-            "gutter_x": self.gutter_x.value(),
-            "gutter_x_unit": self.gutter_x_unit.currentText(),
-            "gutter_y": self.gutter_y.value(),
-            "gutter_y_unit": self.gutter_y_unit.currentText(),
-            "num_tiles_x": self.num_tiles_x.value(),
-            "num_tiles_y": self.num_tiles_y.value(),
-            "tile_ratio": self.tile_ratio.value(),
-            "clear_guides": self.clear_guides.isChecked(),
-            "lock_guides": self.lock_guides.isChecked(),
-            "snap_guides": self.snap_guides.isChecked()
-        }
+        return self.get_grid_spec().to_preset()
+
+    def get_grid_spec(self):
+        # Settings of the fields, in their current units
+        lengths = {name: Length(field.sbox.value(), field.unit) for name, field in self.length_fields.items()}
+        return GridSpec(
+            num_tiles_x=self.num_tiles_x.value(),
+            num_tiles_y=self.num_tiles_y.value(),
+            tile_ratio=self.tile_ratio.value(),
+            clear_guides=self.clear_guides.isChecked(),
+            lock_guides=self.lock_guides.isChecked(),
+            snap_guides=self.snap_guides.isChecked(),
+            guide_tolerance=self.guide_tolerance.value(),
+            pixel_aligned=self.pixel_aligned.isChecked(),
+            tracks_x=self.tracks_x.text().strip(),
+            tracks_y=self.tracks_y.text().strip(),
+            subgrids=self.subgrids,
+            panel_borders=self.panel_borders.isChecked(),
+            border_width=self.border_width.value(),
+            border_radius=self.border_radius.value(),
+            border_color=self.border_color,
+            grid_type=self.grid_type.currentData(),
+            **lengths)
 
     def apply_preset(self, preset):
-        # Set the text of unit comboboxes
-        self.margin_l_unit.setCurrentText(preset.get("margin_l_unit", self.UNIT_PC))
-        self.margin_r_unit.setCurrentText(preset.get("margin_r_unit", self.UNIT_PC))
-        self.margin_t_unit.setCurrentText(preset.get("margin_t_unit", self.UNIT_PC))
-        self.margin_b_unit.setCurrentText(preset.get("margin_b_unit", self.UNIT_PC))
-        self.gutter_x_unit.setCurrentText(preset.get("gutter_x_unit", self.UNIT_PC))
-        self.gutter_y_unit.setCurrentText(preset.get("gutter_y_unit", self.UNIT_PC))
-
-        # Store the current index of all comboboxes for future use
-        self.margin_l_params["idx"] = self.margin_l_unit.currentIndex()
-        self.margin_r_params["idx"] = self.margin_r_unit.currentIndex()
-        self.margin_t_params["idx"] = self.margin_t_unit.currentIndex()
-        self.margin_b_params["idx"] = self.margin_b_unit.currentIndex()
-        self.gutter_x_params["idx"] = self.gutter_x_unit.currentIndex()
-        self.gutter_y_params["idx"] = self.gutter_y_unit.currentIndex()
-
-        # Update the spinboxes range
-        self.update_sbox_range(self.margin_l_params)
-        self.update_sbox_range(self.margin_r_params)
-        self.update_sbox_range(self.margin_t_params)
-        self.update_sbox_range(self.margin_b_params)
-        self.update_sbox_range(self.gutter_x_params)
-        self.update_sbox_range(self.gutter_y_params)
+        # Raises ValueError if the preset is invalid, leaving the fields unchanged
+        self.apply_grid_spec(GridSpec.from_preset(preset))
+
+    def apply_grid_spec(self, grid_spec):
+        # Set the units without converting the values, then the spinbox ranges and values
+        for name, field in self.length_fields.items():
+            length = getattr(grid_spec, name)
+            field.unit = length.unit
+            field.cbox.blockSignals(True)
+            field.cbox.setCurrentIndex(field.cbox.findData(length.unit.value))
+            field.cbox.blockSignals(False)
+            self.update_sbox_range(field)
+            field.sbox.setValue(length.value)
 
         # Set the values of the spinboxes and checkboxes
-        self.margin_l.setValue(float(preset.get("margin_l", self.DEFAULT_MARGIN_L_PC)))
-        self.margin_r.setValue(float(preset.get("margin_r", self.DEFAULT_MARGIN_R_PC)))
-        self.margin_t.setValue(float(preset.get("margin_t", self.DEFAULT_MARGIN_T_PC)))
-        self.margin_b.setValue(float(preset.get("margin_b", self.DEFAULT_MARGIN_B_PC)))
-        self.gutter_x.setValue(float(preset.get("gutter_x", self.DEFAULT_GUTTER_X_PC)))
-        self.gutter_y.setValue(float(preset.get("gutter_y", self.DEFAULT_GUTTER_Y_PC)))
-        self.num_tiles_x.setValue(int(preset.get("num_tiles_x", self.DEFAULT_NUM_TILES_X)))
-        self.num_tiles_y.setValue(int(preset.get("num_tiles_y", self.DEFAULT_NUM_TILES_Y)))
-        self.tile_ratio.setValue(float(preset.get("tile_ratio", self.DEFAULT_TILE_RATIO)))
-        self.clear_guides.setChecked(bool(preset.get("clear_guides", self.DEFAULT_CLEAR_GUIDES)))
-        self.lock_guides.setChecked(bool(preset.get("lock_guides", self.DEFAULT_LOCK_GUIDES)))
-        self.snap_guides.setChecked(bool(preset.get("snap_guides", self.DEFAULT_SNAP_GUIDES)))
-        
+        self.num_tiles_x.setValue(grid_spec.num_tiles_x)
+        self.num_tiles_y.setValue(grid_spec.num_tiles_y)
+        self.tile_ratio.setValue(grid_spec.tile_ratio)
+        self.clear_guides.setChecked(grid_spec.clear_guides)
+        self.lock_guides.setChecked(grid_spec.lock_guides)
+        self.snap_guides.setChecked(grid_spec.snap_guides)
+        self.guide_tolerance.setValue(grid_spec.guide_tolerance)
+        self.pixel_aligned.setChecked(grid_spec.pixel_aligned)
+        self.tracks_x.setText(grid_spec.tracks_x)
+        self.tracks_y.setText(grid_spec.tracks_y)
+        self.subgrids = grid_spec.subgrids
+        self.panel_borders.setChecked(grid_spec.panel_borders)
+        self.border_width.setValue(grid_spec.border_width)
+        self.border_radius.setValue(grid_spec.border_radius)
+        self.border_color = grid_spec.border_color
+        self.grid_type.setCurrentIndex(max(0, self.grid_type.findData(grid_spec.grid_type)))
+
+    def show_auto_fit(self):
+        # Lists the best layouts for the current margins and ratio in a popup menu
+        self.update_return_values()
+        margins = (self.ret_margin_l_px, self.ret_margin_r_px, self.ret_margin_t_px, self.ret_margin_b_px)
+        results = auto_fit(self.doc_size_x, self.doc_size_y, margins, tile_ratio=self.ret_tile_ratio,
+                           gutters_x=default_gutter_candidates(self.doc_size_x, self.ret_gutter_x_px),
+                           gutters_y=default_gutter_candidates(self.doc_size_y, self.ret_gutter_y_px))
+        if not results:
+            QMessageBox.information(None, PLUGIN_DIALOG_TITLE, i18n("No layout fits the current margins."))
+            return
+
+        menu = QMenu(self)
+        for result in results:
+            text = i18n("{0} x {1} tiles of {2:.0f} x {3:.0f} px, min. gutters {4:.1f} x {5:.1f} px").format(
+                result["num_tiles_x"], result["num_tiles_y"], result["tile_size_x"], result["tile_size_y"], result["gutter_x"], result["gutter_y"])
+            action = menu.addAction(text)
+            action.triggered.connect(lambda checked=False, result=result: self.apply_auto_fit(result))
+        menu.exec_(self.auto_fit_button.mapToGlobal(self.auto_fit_button.rect().bottomLeft()))
+
+    def apply_auto_fit(self, result):
+        spec = self.get_layout_spec()
+        for key in ("num_tiles_x", "num_tiles_y", "gutter_x", "gutter_y"):
+            spec[key] = result[key]
+        # Auto-fit layouts have uniform tiles
+        spec["tracks_x"] = spec["tracks_y"] = ""
+        self.apply_layout_spec(spec)
+
+    def apply_layout_spec(self, spec):
+        # Fills the fields from a layout spec in pixels (e.g. inferred from the document guides), keeping the current units.
+        # Only the fields present in the spec change: the others (e.g. tracks missing from a partial spec) are kept.
+        changes = {name: Length(self.units.from_pixels(spec[name], field.unit, field.axis), field.unit)
+                   for name, field in self.length_fields.items() if name in spec}
+        for name in ("num_tiles_x", "num_tiles_y"):
+            if name in spec:
+                changes[name] = int(spec[name])
+        for name in ("tile_ratio", "pixel_aligned", "tracks_x", "tracks_y", "subgrids", "grid_type"):
+            if name in spec:
+                changes[name] = spec[name]
+        self.apply_grid_spec(self.get_grid_spec().copy(**changes))
+        self.update_return_values()
+
     def save_last_preset(self, preset):
         last_preset_path = os.path.join(os.path.expanduser("~"), self.LAST_PRESET_FILENAME + ".json")
-        with open(last_preset_path, 'w') as file:
-            json.dump(preset, file)
+        save_json_cached(last_preset_path, preset)
 
     def load_last_preset(self):
         last_preset_path = os.path.join(os.path.expanduser("~"), self.LAST_PRESET_FILENAME + ".json")
         try:
-            with open(last_preset_path, 'r') as file:
-                preset = json.load(file)
-                self.apply_preset(preset)
-        except FileNotFoundError:
+            with timer.stage("preset_read"):
+                preset = load_json_cached(last_preset_path)
+            self.apply_preset(preset)
+        except (FileNotFoundError, ValueError):
             self.default_preset()
 
     def update_return_values(self):
-        self.ret_margin_l_px = self.convert_value_to_pixels(self.margin_l.value(), self.margin_l_unit.currentText(), self.doc_size_x)
-        self.ret_margin_r_px = self.convert_value_to_pixels(self.margin_r.value(), self.margin_r_unit.currentText(), self.doc_size_x)
-        self.ret_margin_t_px = self.convert_value_to_pixels(self.margin_t.value(), self.margin_t_unit.currentText(), self.doc_size_y)
-        self.ret_margin_b_px = self.convert_value_to_pixels(self.margin_b.value(), self.margin_b_unit.currentText(), self.doc_size_y)
-        self.ret_gutter_x_px = self.convert_value_to_pixels(self.gutter_x.value(), self.gutter_x_unit.currentText(), self.doc_size_x)
-        self.ret_gutter_y_px = self.convert_value_to_pixels(self.gutter_y.value(), self.gutter_y_unit.currentText(), self.doc_size_y)
+        with timer.stage("dialog_recompute"):
+            self._update_return_values()
+
+    def _update_return_values(self):
+        # Pending recomputes are superseded by the full update
+        self.recompute_timer.stop()
+        self.dirty_fields.clear()
+
+        for name, field in self.length_fields.items():
+            setattr(self, "ret_{0}_px".format(name), field.pixels(self.units))
         self.ret_num_tiles_x = self.num_tiles_x.value()
         self.ret_num_tiles_y = self.num_tiles_y.value()
         self.ret_tile_ratio = self.tile_ratio.value()
-
-    def convert_value_to_pixels(self, value, unit, doc_size):
-        if unit == self.UNIT_PX:
-            return value  # Already in pixels
-        elif unit == self.UNIT_IN:
-            return value * self.doc_ppi  # Use provided ppi for conversion
-        elif unit == self.UNIT_CM:
-            return value * (self.doc_ppi / 2.54)  # 1 inch = 2.54 cm
-        elif unit == self.UNIT_PC:
-            return value * 0.01 * doc_size
-        else:
-            raise ValueError
-
-    def convert_pixels_to_value(self, value, unit, doc_size):
-        if unit == self.UNIT_PX:
-            return value  # Already in pixels
-        elif unit == self.UNIT_IN:
-            return value / self.doc_ppi
-        elif unit == self.UNIT_CM:
-            return value / (self.doc_ppi / 2.54)
-        elif unit == self.UNIT_PC:
-            return value * 100.0 / doc_size
+        self.update_return_value("tracks_x")
+        self.update_return_value("tracks_y")
+        self.max_tile_size_x, self.max_tile_size_y = self.evaluate_max_tile_size()
+        self.update_preview()
+
+    def update_return_value(self, field):
+        # Same as update_return_values() but for a single field
+        if field in self.length_fields:
+            setattr(self, "ret_{0}_px".format(field), self.length_fields[field].pixels(self.units))
+        elif field == "num_tiles_x":
+            self.ret_num_tiles_x = self.num_tiles_x.value()
+        elif field == "num_tiles_y":
+            self.ret_num_tiles_y = self.num_tiles_y.value()
+        elif field == "tile_ratio":
+            self.ret_tile_ratio = self.tile_ratio.value()
+        elif field in ("pixel_aligned", "grid_type"):
+            pass  # Read directly from the widget by get_layout_spec()
+        elif field == "tracks_x":
+            # Tracks replace the number of columns
+            self.ret_tracks_x = self.tracks_x.text().strip()
+            self.num_tiles_x.setEnabled(not self.ret_tracks_x)
+        elif field == "tracks_y":
+            self.ret_tracks_y = self.tracks_y.text().strip()
+            self.num_tiles_y.setEnabled(not self.ret_tracks_y)
         else:
             raise ValueError
 
-    def update_sbox_range(self, params):
-        sbox = params["sbox"]
-        unit = params["cbox"].currentText()
-        doc_size = params["doc_size"]
-
-        if unit == self.UNIT_PX:
-            sbox.setRange(0.0, doc_size)
-        elif unit == self.UNIT_IN:
-            sbox.setRange(0.0, doc_size / self.doc_ppi)
-        elif unit == self.UNIT_CM:
-            sbox.setRange(0.0, doc_size / (self.doc_ppi / 2.54))
-        elif unit == self.UNIT_PC:
-            sbox.setRange(0.0, 100.0)
-        else:
-            raise ValueError
+    def update_sbox_range(self, field):
+        field.sbox.setRange(0.0, self.units.max_value(field.unit, field.axis))
 
 
 class TileGridExtension(Extension):
     def __init__(self, parent):
         super().__init__(parent)
 
+        # Number of guides added, merged or dropped by the last grid application
+        self.last_merge_report = None
+
+        # One dialog per window, created on first use and reused afterwards
+        self.dialogs = {}
+
     def setup(self):
-        pass
+        # Keeps the stored grids in sync with the size of their document
+        self.grid_watcher = GridWatcher(self)
+        self.grid_watcher.start()
 
     def createActions(self, window):
         action = window.createAction(EXTENSION_ID, PLUGIN_MENU_ENTRY, "tools/scripts")
-        action.triggered.connect(self.add_tile_grid)
-
-    def add_tile_grid(self):
+        action.triggered.connect(lambda checked=False, window=window: self.add_tile_grid(window))
+
+    def get_dialog(self, window, doc_size_x, doc_size_y, doc_ppi):
+        qwindow = window.qwindow() if window is not None else None
+        dialog = self.dialogs.get(qwindow)
+        if dialog is None:
+            dialog = TileGridDialog(doc_size_x, doc_size_y, doc_ppi, qwindow)
+            self.dialogs[qwindow] = dialog
+            if qwindow is not None:
+                qwindow.destroyed.connect(lambda obj=None, qwindow=qwindow: self.dialogs.pop(qwindow, None))
+        else:
+            dialog.set_document(doc_size_x, doc_size_y, doc_ppi)
+        return dialog
+
+    def prefill_dialog(self, dialog, doc):
+        # The grid stored by a previous application (see annotation.py) is restored as it was, units included.
+        # Otherwise the grid is inferred from the guides, and only kept if all its guides are in the document. When neither is found,
+        # the dialog keeps the last preset.
+        stored = load_grid(doc)
+        if stored is not None:
+            try:
+                dialog.apply_preset(stored["preset"])
+                return
+            except (KeyError, ValueError):
+                pass
+        spec = infer_verified_grid(doc.verticalGuides(), doc.horizontalGuides(), doc.width(), doc.height())
+        if spec is not None:
+            dialog.apply_layout_spec(spec)
+
+    def add_tile_grid(self, window=None):
         doc = Krita.instance().activeDocument()
         if doc is None:
             QMessageBox.information(None, PLUGIN_DIALOG_TITLE, i18n("No document is currently opened."))
             return
         #QMessageBox.information(None, PLUGIN_DIALOG_TITLE, str(dir(doc)))
-        
+
+        # Timing of each stage, when turned on (see timing.py)
+        run = timer.start_run("add_tile_grid", doc_size_x=doc.width(), doc_size_y=doc.height(), doc_ppi=doc.resolution())
+        try:
+            self.run_tile_grid(doc, window, run)
+        finally:
+            timer.finish_run(run)
+
+    def run_tile_grid(self, doc, window, run):
         doc_size_x = doc.width()
         doc_size_y = doc.height()
         doc_ppi = doc.resolution()
 
-        dialog = TileGridDialog(doc_size_x, doc_size_y, doc_ppi)
-        if not dialog.exec_() == QDialog.Accepted:
+        with timer.stage("dialog"):
+            dialog = self.get_dialog(window, doc_size_x, doc_size_y, doc_ppi)
+
+        # Pre-fill the dialog with the grid already present in the document, if any
+        with timer.stage("infer"):
+            self.prefill_dialog(dialog, doc)
+
+        # The time the dialog is shown is not a stage
+        start_time = time.perf_counter()
+        recompute_count = dialog.recompute_count
+        skipped_recomputes = dialog.skipped_recomputes
+        accepted = dialog.exec_() == QDialog.Accepted
+        run.set_info(accepted=accepted, user_time=time.perf_counter() - start_time,
+                     recomputes=dialog.recompute_count - recompute_count, skipped_recomputes=dialog.skipped_recomputes - skipped_recomputes)
+        if not accepted:
             return
         
-        # Get the values from the dialog
-        margin_l = dialog.ret_margin_l_px  # float
-        margin_r = dialog.ret_margin_r_px  # float
-        margin_t = dialog.ret_margin_t_px  # float
-        margin_b = dialog.ret_margin_b_px  # float
-        min_gutter_x = dialog.ret_gutter_x_px  # float
-        min_gutter_y = dialog.ret_gutter_y_px  # float
-        num_tiles_x = dialog.ret_num_tiles_x  # int
-        num_tiles_y = dialog.ret_num_tiles_y  # int
-        tile_ratio = dialog.ret_tile_ratio  # float
-        
         # Make sure guides are visible and locked, then snap to the guides
-        if not doc.guidesVisible():
-            Krita.instance().action('view_show_guides').trigger()
-        
-        if dialog.lock_guides.isChecked() ^ doc.guidesLocked():
-            Krita.instance().action('view_lock_guides').trigger()
-        
-        if dialog.lock_guides.isChecked(): #^ doc.snapToGuides():
-            Krita.instance().action('view_snap_to_guides').trigger()
+        with timer.stage("guide_actions"):
+            if not doc.guidesVisible():
+                Krita.instance().action('view_show_guides').trigger()
+
+            if dialog.lock_guides.isChecked() ^ doc.guidesLocked():
+                Krita.instance().action('view_lock_guides').trigger()
+
+            if dialog.lock_guides.isChecked(): #^ doc.snapToGuides():
+                Krita.instance().action('view_snap_to_guides').trigger()
         
-        # Calculate the maximum tile size that fits the document (in percentage)
-        max_tile_size_x = (doc_size_x - margin_l - margin_r - (num_tiles_x - 1) * min_gutter_x) / num_tiles_x
-        max_tile_size_y = (doc_size_y - margin_t - margin_b - (num_tiles_y - 1) * min_gutter_y) / num_tiles_y
-
-        # Already checked in the dialog, but just in case
-        #assert max_tile_size_x > 0 and max_tile_size_y > 0, f"Invalid grid parameters max_tile_size_x={max_tile_size_x}, max_tile_size_y={max_tile_size_y}"
-
-        # Calculate the tile height based on the tile ratio
-        tile_size_y = max_tile_size_x / tile_ratio # float
-        gutter_x, gutter_y, pad_l, pad_t = 0, 0, 0, 0
-
-        # If the tiles height is too big, we need to adjust the tile size (and the gutter size) so that the tiles height is limited to max_tile_size_y
-        if tile_size_y <= max_tile_size_y:
-            tile_size_x = max_tile_size_x
-            if num_tiles_x > 1: # If there is more than one column, we need to calculate the gutter size
-                gutter_x = min_gutter_x
-                gutter_y = (doc_size_y - margin_t - margin_b - num_tiles_y * tile_size_y) / (num_tiles_y - 1)
-            else: # If there is only one column, we need to calculate the padding size
-                pad_t = (doc_size_y - margin_t - margin_b - tile_size_y) / 2
-        else:
-            #QMessageBox.information(None, PLUGIN_DIALOG_TITLE, "tile_size_y > max_tile_size_y")
-            tile_size_x = max_tile_size_y * tile_ratio
-            tile_size_y = max_tile_size_y
-            if num_tiles_x > 1: # If there is more than one column, we need to calculate the gutter size
-                gutter_x = (doc_size_x - margin_l - margin_r - num_tiles_x * tile_size_x) / (num_tiles_x - 1)
-                gutter_y = min_gutter_y
-            else: # If there is only one column, we need to calculate the padding size
-                pad_l = (doc_size_x - margin_l - margin_r - tile_size_x) / 2
+        # Calculate the tile sizes, gutters and paddings
+        with timer.stage("layout"):
+            layout = compute_layout(dialog.get_layout_spec(), doc_size_x, doc_size_y)
+            new_guides_x = layout.guides_x()
+            new_guides_y = layout.guides_y()
 
         # Lists of guide positions (in pixels from the left or top of the document)
-        guides_x = [] if dialog.clear_guides.isChecked() else doc.verticalGuides()
-        guides_y = [] if dialog.clear_guides.isChecked() else doc.horizontalGuides()
-
-        # Enclose each tile in guides
-        guides_x.extend(self.setup_guides(margin_l, pad_l, gutter_x, num_tiles_x, tile_size_x))
-        guides_y.extend(self.setup_guides(margin_t, pad_t, gutter_y, num_tiles_y, tile_size_y))
-
-        doc.setVerticalGuides(guides_x)
-        doc.setHorizontalGuides(guides_y)
-
-    def setup_guides(self, margin, pad, gutter, num_tiles, tile_size):
-        guides = []
-
-        # Enclose each tile in guides
-        pos = margin + pad
-        for _ in range(num_tiles):
-            #if not pos in guides:
-            guides.append(pos)
-            pos += tile_size
-            #if not pos in guides:
-            guides.append(pos)
-            pos += gutter
-
-        return guides
+        with timer.stage("get_guides"):
+            guides_x = [] if dialog.clear_guides.isChecked() else doc.verticalGuides()
+            guides_y = [] if dialog.clear_guides.isChecked() else doc.horizontalGuides()
+
+        # Enclose each tile in guides, merging the guides that coincide (e.g. adjacent tile edges when the gutter is zero)
+        with timer.stage("merge"):
+            tolerance = dialog.guide_tolerance.value()
+            guides_x, report_x = merge_guides(guides_x, new_guides_x, tolerance)
+            guides_y, report_y = merge_guides(guides_y, new_guides_y, tolerance)
+            self.last_merge_report = {key: report_x[key] + report_y[key] for key in report_x}
+        run.set_info(num_tiles_x=layout.num_tiles_x, num_tiles_y=layout.num_tiles_y, num_guides=len(guides_x) + len(guides_y))
+
+        with timer.stage("set_guides"):
+            doc.setVerticalGuides(guides_x)
+            doc.setHorizontalGuides(guides_y)
+
+        # Remember the grid in the document, so that it can follow later resizes
+        with timer.stage("store"):
+            store_grid(doc, dialog.get_grid_spec(), new_guides_x.tolist(), new_guides_y.tolist())
+
+        with timer.stage("layers"):
+            if isinstance(layout, CellGrid):
+                add_overlay_layer(doc, layout, dialog.border_width.value(), dialog.border_color)
+                doc.refreshProjection()
+            elif dialog.panel_borders.isChecked():
+                add_border_layer(doc, layout, dialog.border_width.value(), dialog.border_radius.value(), dialog.border_color)
+                doc.refreshProjection()
+
+        if dialog.export_tiles.isChecked():
+            with timer.stage("export"):
+                self.export_tiles(doc, layout)
+
+    def export_tiles(self, doc, layout):
+        directory = QFileDialog.getExistingDirectory(None, i18n("Export Tiles"), os.path.dirname(doc.fileName()))
+        if not directory:
+            return
+        try:
+            num_tiles, elapsed_time = export_tiles(doc, layout, directory, skip_empty=True)
+        except (ValueError, IOError) as error:
+            QMessageBox.warning(None, PLUGIN_DIALOG_TITLE, str(error))
+        else:
+            QMessageBox.information(None, PLUGIN_DIALOG_TITLE, i18n("{0} tiles exported in {1:.2f} s.").format(num_tiles, elapsed_time))
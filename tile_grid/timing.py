@@ -0,0 +1,134 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Optional timing of the stages of a grid application (dialog, preset read, layout, guide merge, Krita calls...).
+# Stages may be nested (e.g. the preset read within the dialog); each is timed on its own.
+# Off by default: every stage then shares one do-nothing context manager, so the instrumented code pays a function
+# call per stage and nothing else. When on, each run produces one record, appended to a JSON Lines log and
+# summarized in the dialog. Turn it on with enable(log_path), or by setting TILE_GRID_TIMING_LOG to the log path.
+# This module must not import krita nor PyQt5.
+
+import json, os, time
+
+
+class NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class NullRun:
+    # Stands in for a run when timing is off
+    def stage(self, name):
+        return NULL_STAGE
+
+    def record(self, name, seconds):
+        pass
+
+    def set_info(self, **info):
+        pass
+
+
+NULL_STAGE = NullStage()
+NULL_RUN = NullRun()
+
+
+class Stage:
+    __slots__ = ("run", "name", "start_time")
+
+    def __init__(self, run, name):
+        self.run = run
+        self.name = name
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.run.record(self.name, time.perf_counter() - self.start_time)
+        return False
+
+
+class TimingRun:
+    # Stages in the order they first ran; a stage that runs several times accumulates its time
+    def __init__(self, name, **info):
+        self.name = name
+        self.info = info
+        self.stages = {}
+        self.timestamp = time.time()
+        self.start_time = time.perf_counter()
+        self.total = None
+
+    def stage(self, name):
+        return Stage(self, name)
+
+    def record(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def set_info(self, **info):
+        self.info.update(info)
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start_time
+
+    def to_record(self):
+        return dict(self.info, run=self.name, timestamp=self.timestamp, total=self.total, stages=self.stages)
+
+    def summary(self):
+        # One line, slowest stages first, e.g. "add_tile_grid: 8.0 ms set_guides, 2.1 ms layout, ..."
+        stages = sorted(self.stages.items(), key=lambda item: item[1], reverse=True)
+        return "{0}: {1}".format(self.name, ", ".join("{0:.1f} ms {1}".format(1000 * seconds, name) for name, seconds in stages))
+
+
+class Timer:
+    def __init__(self, log_path=None):
+        self.log_path = log_path
+        self.enabled = bool(log_path)
+        self.current = NULL_RUN
+        self.last_run = None
+
+    def enable(self, log_path=None):
+        # log_path: JSON Lines file the records are appended to (None to only keep the last record in memory)
+        self.log_path = log_path
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        self.current = NULL_RUN
+
+    def stage(self, name):
+        # Times a stage of the current run, if any:
+        #     with timer.stage("layout"):
+        #         ...
+        return self.current.stage(name)
+
+    def record(self, name, seconds):
+        # Records a stage timed by the caller, e.g. one that does not fit in a with block
+        self.current.record(name, seconds)
+
+    def start_run(self, name, **info):
+        # Returns the new run, or NULL_RUN when timing is off. A run started within another run is not recorded
+        # on its own (NULL_RUN is returned): its stages are timed into the outer run.
+        if not self.enabled or self.current is not NULL_RUN:
+            return NULL_RUN
+        self.current = TimingRun(name, **info)
+        return self.current
+
+    def finish_run(self, run):
+        if run is not self.current or run is NULL_RUN:
+            return
+        self.current = NULL_RUN
+        run.finish()
+        self.last_run = run
+        if self.log_path:
+            try:
+                with open(self.log_path, 'a') as file:
+                    file.write(json.dumps(run.to_record()) + "\n")
+            except OSError:
+                pass  # Timing must never break a grid application
+
+
+# Shared by the dialog, the extension and the scripting API
+timer = Timer(os.environ.get("TILE_GRID_TIMING_LOG"))
@@ -0,0 +1,142 @@
+# Tile Grid plugin for Krita
+# By Jean-Yves 'madjyc' Chasle
+# SPDX-License-Identifier: CC0-1.0
+# Track solver for non-uniform columns and rows.
+# A track list is a comma separated string, one entry per column (or row):
+#     "2"           flexible track of weight 2
+#     "300px"       fixed track of 300 pixels
+#     "1[100:400]"  flexible track of weight 1, at least 100 and at most 400 pixels (either bound may be omitted)
+# Flexible tracks share the space left by the fixed tracks and the gutters in proportion to their weights,
+# within their bounds. The solve runs in expected linear time per axis (see solve_tracks).
+# This module must not import krita nor PyQt5.
+
+import math, random
+
+
+def parse_tracks(text):
+    # Returns a list of (weight, minimum, maximum) tuples, fixed tracks having a zero weight and minimum == maximum.
+    # Returns None for an empty string (uniform tiles). Raises ValueError on syntax errors.
+    if isinstance(text, (list, tuple)):
+        return [tuple(track) for track in text] or None
+    text = (text or "").strip()
+    if not text:
+        return None
+
+    tracks = []
+    for token in text.split(","):
+        token = token.strip().lower()
+        if not token:
+            raise ValueError("Empty track")
+        if token.endswith("px"):
+            size = _parse_number(token[:-2])
+            if size < 0:
+                raise ValueError("Negative track size: {0}".format(token))
+            tracks.append((0.0, size, size))
+            continue
+        minimum, maximum = 0.0, math.inf
+        if "[" in token:
+            if not token.endswith("]"):
+                raise ValueError("Invalid track bounds: {0}".format(token))
+            token, bounds = token[:-1].split("[", 1)
+            low, _, high = bounds.partition(":")
+            minimum = _parse_number(low) if low.strip() else 0.0
+            # An omitted maximum is the only unbounded value
+            maximum = _parse_number(high) if high.strip() else math.inf
+            if minimum < 0 or maximum < minimum:
+                raise ValueError("Invalid track bounds: {0}".format(bounds))
+        weight = _parse_number(token)
+        if weight <= 0:
+            raise ValueError("Track weights must be positive: {0}".format(token))
+        tracks.append((weight, minimum, maximum))
+    return tracks
+
+
+def _parse_number(text):
+    # float() also accepts "nan" and "inf", which NaN-poison the solve (NaN fails every comparison)
+    value = float(text)
+    if not math.isfinite(value):
+        raise ValueError("Track values must be finite: {0}".format(text.strip()))
+    return value
+
+
+def format_tracks(tracks):
+    # Inverse of parse_tracks()
+    tokens = []
+    for weight, minimum, maximum in tracks:
+        if weight == 0:
+            tokens.append("{0:g}px".format(minimum))
+        elif minimum == 0 and maximum == math.inf:
+            tokens.append("{0:g}".format(weight))
+        else:
+            tokens.append("{0:g}[{1}:{2}]".format(weight, "{0:g}".format(minimum) if minimum else "", "" if maximum == math.inf else "{0:g}".format(maximum)))
+    return ", ".join(tokens)
+
+
+def solve_tracks(available, tracks, gutter):
+    # Returns the size of each track so that tracks and gutters fill the available space.
+    # If the bounds make this impossible, the tracks are left at their bounds (check the total against available).
+    #
+    # Each flexible track has size clamp(weight * s, minimum, maximum) for a common scale s, and the total is a
+    # piecewise linear, non-decreasing function of s whose breakpoints are minimum / weight and maximum / weight.
+    # Rather than sorting the breakpoints, the interval containing the solution is narrowed around random pivots,
+    # and tracks whose breakpoints all fall outside the interval are folded into constants (quickselect style),
+    # which makes the solve expected O(n). Without bounds, it is a single pass.
+    free = available - (len(tracks) - 1) * gutter
+    constant = 0.0  # Total size of the tracks whose size does not depend on s within the interval
+    slope = 0.0     # Total weight of the tracks that are proportional to s within the interval
+    active = []
+    for weight, minimum, maximum in tracks:
+        if weight == 0:
+            constant += minimum
+        elif minimum == 0 and maximum == math.inf:
+            slope += weight
+        else:
+            active.append((weight, minimum, maximum, minimum / weight, maximum / weight))
+
+    low, high = 0.0, math.inf
+    while active:
+        points = [point for item in active for point in item[3:] if low < point < high]
+        if not points:
+            break
+        pivot = random.choice(points)
+        total = constant + slope * pivot + sum(min(max(weight * pivot, minimum), maximum) for weight, minimum, maximum, _, _ in active)
+        if total < free:
+            low = pivot
+        else:
+            high = pivot
+
+        remaining = []
+        for item in active:
+            weight, minimum, maximum, low_point, high_point = item
+            if high_point <= low:
+                constant += maximum
+            elif low_point >= high:
+                constant += minimum
+            elif low_point <= low and high_point >= high:
+                slope += weight
+            else:
+                remaining.append(item)
+        active = remaining
+
+    # Tracks still active have no breakpoint inside the interval: classify them with its midpoint
+    middle = low if high == math.inf else (low + high) / 2
+    for weight, minimum, maximum, low_point, high_point in active:
+        if high_point <= middle:
+            constant += maximum
+        elif low_point >= middle:
+            constant += minimum
+        else:
+            slope += weight
+
+    scale = max(0.0, (free - constant) / slope) if slope > 0 else low
+    return [minimum if weight == 0 else min(max(weight * scale, minimum), maximum) for weight, minimum, maximum in tracks]
+
+
+def track_starts(start, sizes, gutter):
+    # Start position of each track
+    starts = []
+    pos = start
+    for size in sizes:
+        starts.append(pos)
+        pos += size + gutter
+    return starts